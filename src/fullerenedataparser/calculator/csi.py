@@ -10,10 +10,14 @@ import os
 import pathlib
 import re
 from multiprocessing import Pool, RLock, freeze_support
+from typing import Generator, Iterable, Optional, Tuple
 
 import numpy as np
-from fullerenedataparser.data.spiral import adj_gener
+import pandas as pd
+import scipy.linalg
+from fullerenedataparser.data.spiral import adj_batch_gener, adj_gener, spiral_files
 from fullerenedataparser.io.recursion import recursion_files
+from fullerenedataparser.io.table import check_table_target, write_table
 from fullerenedataparser.io.xyz import simple_read_xyz_xtb
 from fullerenedataparser.molecular.fullerene import FullereneFamily
 from fullerenedataparser.util.logger import Logger
@@ -22,14 +26,196 @@ from tqdm import tqdm
 
 logger = Logger(__name__, console_on=True)
 
+DEFAULT_MEMORY_BUDGET = 256 * 2 ** 20  # bytes of matrices decomposed at once
+DEFAULT_CHARGES = (0, -2, 2, -4, 4, -6, 6)
+SUBSET_VALUES_MIN_NATOMS = 200  # see `subset_pays_off`
 
-def calculate_csi(fullerene: FullereneFamily):
+
+def count_napp(circleadj) -> np.ndarray:
+    """
+    Number of adjacent pentagon pairs of circle adjacency with shape [..., F, F].
+    """
+    circleadj = np.asarray(circleadj)
+    pentagon = circleadj.sum(-1) == 5
+    return (circleadj * pentagon[..., None, :] * pentagon[..., :, None]).sum((-2, -1)) / 2
+
+
+def eigh_batch_size(natoms: int, vectors: bool = False, memory_budget: int = DEFAULT_MEMORY_BUDGET) -> int:
+    """
+    Number of [N, N] float64 matrices decomposed at once within `memory_budget` bytes.
+    The stacked input and LAPACK's working copy are counted, and eigenvectors if `vectors`.
+    """
+    return max(1, memory_budget // (natoms * natoms * 8 * (3 if vectors else 2)))
+
+
+def check_window(window, natoms: int) -> Tuple[int, int]:
+    """
+    Validate an index range `(start, stop)` of eigenvalues in ascending order, as in `values[start:stop]`.
+    """
+    start, stop = (int(i) for i in window)
+    if not 0 <= start < stop <= natoms:
+        raise ValueError(f"Window {window} is not a non-empty range of {natoms} eigenvalues.")
+    return start, stop
+
+
+def frontier_window(natoms: int, charges: Iterable[int]) -> Optional[Tuple[int, int]]:
+    """
+    Smallest window of eigenvalues (ascending) used by CSI of all `charges`,
+    see `examples/xcsi/utils.py::calculate_origin_csi`.
+    Removing 2k electrons uses `values[N//2+1:N//2+1+k]`, adding 2k uses `values[N//2-k:N//2]`.
+    None if only neutral cages are asked for, whose CSI needs no eigenvalue.
+    """
+    ranges = []
+    for charge in charges:
+        if charge % 2:
+            raise ValueError(f"Only Deal with Even number charged Fullerene Now. Got charge:{charge}.")
+        if charge > 0:
+            ranges.append((natoms // 2 + 1, natoms // 2 + 1 + charge // 2))
+        elif charge < 0:
+            ranges.append((natoms // 2 + charge // 2, natoms // 2))
+    if not ranges:
+        return None
+    return check_window((min(lo for lo, _ in ranges), max(hi for _, hi in ranges)), natoms)
+
+
+def eigh_window(matrix: np.ndarray, vectors: bool = True, window: Optional[Tuple[int, int]] = None):
+    """
+    Eigen-decomposition of one symmetric matrix.
+
+    Parameters
+    ----------
+    matrix:np.ndarray
+        Symmetric matrix with shape [N, N].
+    vectors:bool
+        Also compute eigenvectors.
+    window:Tuple[int, int]
+        Only eigenpairs `start:stop` in ascending order, computed by LAPACK's subset driver.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]:
+        Eigenvalues and eigenvectors (None if not `vectors`).
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if window is None:
+        return np.linalg.eigh(matrix) if vectors else (np.linalg.eigvalsh(matrix), None)
+    start, stop = check_window(window, matrix.shape[-1])
+    result = scipy.linalg.eigh(matrix, eigvals_only=not vectors, subset_by_index=[start, stop - 1])
+    return result if vectors else (result, None)
+
+
+def subset_pays_off(natoms: int, window: Optional[Tuple[int, int]], vectors: bool) -> bool:
+    """
+    Whether LAPACK's subset driver on each matrix beats one batched full decomposition.
+
+    Measured with OpenBLAS for windows of about 7 eigenpairs: the subset driver is faster
+    with eigenvectors from N = 60 on, but for eigenvalues only it catches up at N = 200.
+    """
+    if window is None:
+        return False
+    start, stop = check_window(window, natoms)
+    return (stop - start) * 4 <= natoms and (vectors or natoms >= SUBSET_VALUES_MIN_NATOMS)
+
+
+def _decompose(stack: list, vectors: bool, window: Optional[Tuple[int, int]]):
+    natoms = stack[0].shape[-1]
+    if subset_pays_off(natoms, window, vectors):
+        results = [eigh_window(matrix, vectors=vectors, window=window) for matrix in stack]
+        return results if vectors else [values for values, _ in results]
+    stack = np.stack(stack).astype(np.float64, copy=False)
+    start, stop = (0, natoms) if window is None else check_window(window, natoms)
+    if vectors:
+        values, vecs = np.linalg.eigh(stack)
+        # Copies, so the full decomposition of the batch is not kept alive.
+        return zip(values[:, start:stop].copy(), vecs[:, :, start:stop].copy())
+    return np.linalg.eigvalsh(stack)[:, start:stop].copy()
+
+
+def _nbytes(result) -> int:
+    return sum(item.nbytes for item in result) if isinstance(result, tuple) else result.nbytes
+
+
+def batched_eigh(matrices: Iterable[np.ndarray], vectors: bool = False, window: Optional[Tuple[int, int]] = None,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET) -> Generator:
+    """
+    Eigen-decomposition of symmetric matrices in batches.
+
+    Matrices are grouped by size, and each group is stacked into [B, N, N] and decomposed
+    by one `np.linalg.eigh` (or `eigvalsh`) call once B reaches `eigh_batch_size`.
+    `matrices` is consumed lazily, so at most about `memory_budget` bytes of matrices are held per size.
+    Results waiting for an earlier matrix of another size are held as well. Once they exceed
+    `memory_budget` bytes, all groups are decomposed early so the results can be yielded.
+
+    Parameters
+    ----------
+    matrices:Iterable[np.ndarray]
+        Symmetric matrices, e.g. adjacency of isomers in spiral order.
+    vectors:bool
+        Also compute eigenvectors.
+    window:Tuple[int, int]
+        Only keep eigenpairs `start:stop` in ascending order, see `check_window`.
+        Narrow windows are computed matrix by matrix with LAPACK's subset driver where that
+        is faster (see `subset_pays_off`). Otherwise the batch is fully decomposed and
+        the window only reduces the output size.
+    memory_budget:int
+        Bytes of one batch, see `eigh_batch_size`.
+
+    Returns
+    -------
+    Generator:
+        Eigenvalues in ascending order (or `(eigenvalues, eigenvectors)` if `vectors`)
+        of each matrix, in the order of `matrices`.
+    """
+    pending = {}  # natoms -> (indices, matrices)
+    done = {}
+    held = 0  # bytes of results in `done`
+    current = 0
+
+    def flush(natoms):
+        nonlocal held
+        indices, stack = pending.pop(natoms)
+        for index, result in zip(indices, _decompose(stack, vectors, window)):
+            done[index] = result
+            held += _nbytes(result)
+
+    def ready():
+        nonlocal held, current
+        while current in done:
+            result = done.pop(current)
+            held -= _nbytes(result)
+            current += 1
+            yield result
+
+    for idx, matrix in enumerate(matrices):
+        natoms = matrix.shape[-1]
+        indices, stack = pending.setdefault(natoms, ([], []))
+        indices.append(idx)
+        stack.append(matrix)
+        if len(stack) < eigh_batch_size(natoms, vectors, memory_budget):
+            continue
+        flush(natoms)
+        yield from ready()
+        if held > memory_budget:
+            # An earlier matrix of a size whose batch isn't full blocks the results.
+            for natoms in list(pending):
+                flush(natoms)
+            yield from ready()
+    for natoms in list(pending):
+        flush(natoms)
+    yield from ready()
+
+
+def calculate_csi(fullerene: FullereneFamily, vectors: bool = True, window: Optional[Tuple[int, int]] = None):
     """
 
     Parameters
     ----------
     fullerene:FullereneFamily
         molecule Instance of Fullerene.
+    vectors:bool
+        Also compute eigenvectors, otherwise None is returned for them.
+    window:Tuple[int, int]
+        Only eigenpairs `start:stop` in ascending order, e.g. `frontier_window(N, charges)`.
     Returns
     -------
         CSI
@@ -41,13 +227,31 @@ def calculate_csi(fullerene: FullereneFamily):
     """
 
     assert fullerene.natoms % 2 == 0, f"Not A classical Fullerene. Check your input atoms: {fullerene}."
-    adj = fullerene.get_fullerenecage().circleADJ
-    Napp = (adj * (adj.sum(-1) == 5)[None, :] * (adj.sum(-1) == 5)[:, None]).sum() / 2
-    chi = np.linalg.eigh(fullerene.atomADJ)
+    Napp = count_napp(fullerene.get_fullerenecage().circleADJ)
+    chi = eigh_window(fullerene.atomADJ, vectors=vectors, window=window)
     return chi[0], chi[1], Napp
 
 
-def store_csi(atomfile, circlefile, xyz_dir, target_path):
+def save_csi(target_path, results: list, vectors: bool = False, window: Optional[Tuple[int, int]] = None, **arrays):
+    """
+    Save CSI `results` of `batched_eigh` to `target_path`.
+
+    The `.npz` file holds `csi_list` (eigenvalues), `csi_vectors` only if `vectors`,
+    `csi_window` only if `window` (columns of `csi_list` are eigenvalues `start:stop`),
+    and `arrays` such as `spiral_num`, `energy` and `napp`.
+    """
+    data = {key: np.asarray(value) for key, value in arrays.items()}
+    if vectors:
+        data["csi_list"] = np.array([values for values, _ in results])
+        data["csi_vectors"] = np.array([vecs for _, vecs in results])
+    else:
+        data["csi_list"] = np.array(results)
+    if window is not None:
+        data["csi_window"] = np.asarray(window, dtype=np.int64)
+    np.savez(target_path, **data)
+
+
+def store_csi(atomfile, circlefile, xyz_dir, target_path, memory_budget=DEFAULT_MEMORY_BUDGET, vectors=False, window=None):
     """
     save file to `target_path`,{
     csi_list,spiral_num,energy
@@ -60,6 +264,12 @@ def store_csi(atomfile, circlefile, xyz_dir, target_path):
         .xyz files directory
     target_path
         .npz file path to store information
+    memory_budget:int
+        Bytes of adjacency decomposed at once, see `batched_eigh`.
+    vectors:bool
+        Also store eigenvectors as `csi_vectors`.
+    window:Tuple[int, int]
+        Only store eigenpairs `start:stop`, see `save_csi` and `batched_eigh` on the computing cost.
 
     See Also
     --------
@@ -67,42 +277,50 @@ def store_csi(atomfile, circlefile, xyz_dir, target_path):
 
     """
     spiral_num_list = []
-    csi_list = []
     energy_list = []
     napp_list = []
     pa = re.compile("[0-9]+")
     pbar = tqdm(total=len(os.listdir(xyz_dir)))
     adjgener = adj_gener(atomfile, circlefile)
-    for xyz_path in recursion_files(rootpath=xyz_dir, ignore_mode=True):
-        adj = next(adjgener)
-        pbar.set_description(f'{xyz_path}')
-        pbar.update()
-        f = list(simple_read_xyz_xtb(xyz_path))[-1]
-
-        spiral_num = int(pa.findall(os.path.splitext(xyz_path)[0])[-1])
-        assert spiral_num == adj["spiral_num"]
-        atomadj = adj["atomadj"]
-        circleadj = adj["circleadj"]
-        energy = f.info["energy"]
-        fuller = FullereneFamily(spiral=spiral_num, atomADJ=atomadj, circleADJ=circleadj, atoms=f)
-        spiral_num_list.append(spiral_num)
-        csi_val, _, napp_val = calculate_csi(fuller)
-        csi_list.append(csi_val)
-        napp_list.append(napp_val)
-        energy_list.append(energy)
-    np.savez(target_path, csi_list=csi_list, spiral_num=np.array(spiral_num_list), energy=np.array(energy_list), napp=napp_list)
+
+    def atomadjs():
+        for xyz_path in recursion_files(rootpath=xyz_dir, ignore_mode=True):
+            adj = next(adjgener)
+            pbar.set_description(f'{xyz_path}')
+            pbar.update()
+            f = list(simple_read_xyz_xtb(xyz_path))[-1]
+
+            spiral_num = int(pa.findall(os.path.splitext(xyz_path)[0])[-1])
+            assert spiral_num == adj["spiral_num"]
+            assert f.get_global_number_of_atoms() % 2 == 0, f"Not A classical Fullerene. Check your input atoms: {f}."
+            spiral_num_list.append(spiral_num)
+            napp_list.append(count_napp(adj["circleadj"]))
+            energy_list.append(f.info["energy"])
+            yield adj["atomadj"]
+
+    # Same as `calculate_csi` isomer by isomer.
+    results = list(batched_eigh(atomadjs(), vectors=vectors, window=window, memory_budget=memory_budget))
+    save_csi(target_path, results, vectors=vectors, window=window, spiral_num=spiral_num_list, energy=energy_list,
+             napp=napp_list)
 
 
 def _store_csi(args):
     logger.debug(f"_store_csi:{args}")
-    atomfile, circlefile, xyz_dir, target_path = args
-    store_csi(atomfile, circlefile, xyz_dir, target_path)
+    atomfile, circlefile, xyz_dir, target_path, memory_budget, vectors, window = args
+    store_csi(atomfile, circlefile, xyz_dir, target_path, memory_budget=memory_budget, vectors=vectors, window=window)
 
 
-def mp_store_csi(atomdir, circledir, xyz_root_dir, target_dir, recalculate=True, npz_file_suffix="CSI", number_mask=None):
+def mp_store_csi(atomdir, circledir, xyz_root_dir, target_dir, recalculate=True, npz_file_suffix="CSI", number_mask=None,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, vectors=False, window=None):
     """
     Batch process of calculating CSI
 
+    Parameters
+    ----------
+    window:
+        Index range passed to `store_csi`, or a callable of atom number returning it,
+        e.g. `lambda natoms: frontier_window(natoms, [-2, 0, 2])`.
+
     See Also
     --------
     `store_csi`, `calculate_csi`
@@ -112,7 +330,7 @@ def mp_store_csi(atomdir, circledir, xyz_root_dir, target_dir, recalculate=True,
     tqdm.set_lock(RLock())
     pa = re.compile("[0-9]+")
     po = Pool(1, initializer=tqdm.set_lock, initargs=(tqdm.get_lock(),))
-    for atomfile in recursion_files(atomdir, format=""):
+    for atomfile in spiral_files(atomdir):
         basename = os.path.basename(atomfile)
         circlefile = os.path.join(circledir, basename)
 
@@ -127,7 +345,8 @@ def mp_store_csi(atomdir, circledir, xyz_root_dir, target_dir, recalculate=True,
             os.mkdir(target_dir)
         try:
             target_path = os.path.join(target_dir, basename + f"_{npz_file_suffix}.npz")
-            args = atomfile, circlefile, xyz_dir, target_path
+            file_window = window(int(number)) if callable(window) else window
+            args = atomfile, circlefile, xyz_dir, target_path, memory_budget, vectors, file_window
             if not recalculate:
                 if pathlib.Path(target_path).exists():
                     continue
@@ -136,3 +355,140 @@ def mp_store_csi(atomdir, circledir, xyz_root_dir, target_dir, recalculate=True,
             continue
     po.close()
     po.join()
+
+
+def charged_csi(values: np.ndarray, napp, natoms: int, charges: Iterable[int], start: int = 0) -> np.ndarray:
+    """
+    CSI of several charges from one spectrum of atom adjacency, as `examples/xcsi/utils.py::calculate_origin_csi`.
+
+    Parameters
+    ----------
+    values:np.ndarray
+        Eigenvalues in ascending order with shape [M, W], eigenvalues `start:start+W` of all N.
+    napp:np.ndarray
+        Number of adjacent pentagon pairs with shape [M].
+    natoms:int
+    charges:Iterable[int]
+    start:int
+        Index of the first column of `values`, e.g. of `frontier_window(natoms, charges)`.
+        `values` may have no column if all charges are 0.
+
+    Returns
+    -------
+    np.ndarray:
+        CSI with shape [M, len(charges)].
+    """
+    values = np.asarray(values)
+    csi = []
+    for charge in charges:
+        if charge == 0:
+            csi.append(0.2 * np.asarray(napp, dtype=np.float64))
+            continue
+        lo, hi = frontier_window(natoms, [charge])
+        if lo < start or hi > start + values.shape[-1]:
+            raise ValueError(f"Eigenvalues {start}:{start + values.shape[-1]} don't cover charge {charge}.")
+        elif charge > 0:
+            evalsum = -values[:, hi - charge // 2 - start:hi - start].sum(-1)
+        else:
+            evalsum = -values[:, lo - start:lo - charge // 2 - start].sum(-1)
+        csi.append(evalsum + 0.2 * np.asarray(napp))
+    return np.stack(csi, axis=-1)
+
+
+def charge_table(natoms: int, spiral_num, napp, csi: np.ndarray, charges: Iterable[int], name: str = "csi") \
+        -> pd.DataFrame:
+    """
+    Long table of CSI with shape [M, C], one row for each (natoms, spiral_num, charge).
+    """
+    charges = list(charges)
+    spiral_num = np.asarray(spiral_num, dtype=np.int64)
+    return pd.DataFrame({"natoms": np.full(csi.size, natoms, dtype=np.int64),
+                         "spiral_num": np.repeat(spiral_num, len(charges)),
+                         "charge": np.tile(np.asarray(charges, dtype=np.int64), spiral_num.shape[0]),
+                         "napp": np.repeat(np.asarray(napp), len(charges)),
+                         name: csi.reshape(-1)})
+
+
+def sweep_csi(atomfile, circlefile=None, charges: Iterable[int] = DEFAULT_CHARGES,
+              memory_budget: int = DEFAULT_MEMORY_BUDGET, batch_size: int = 1000) -> pd.DataFrame:
+    """
+    CSI of all isomers in `atomfile` for all `charges`, each isomer decomposed once.
+
+    Only the topology is used, so no `.xyz` files are needed. Only the frontier eigenvalues
+    of `charges` are kept, see `frontier_window`, and nothing is decomposed for neutral cages only.
+
+    Parameters
+    ----------
+    atomfile
+    circlefile
+        If None, circle adjacency of each batch is computed as the dual at once, see `adj_batch_gener`.
+    charges:Iterable[int]
+    memory_budget:int
+        Bytes of adjacency decomposed at once, see `batched_eigh`.
+    batch_size:int
+        Number of isomers read at once.
+
+    Returns
+    -------
+    pd.DataFrame:
+        Columns `natoms`, `spiral_num`, `charge`, `napp` and `csi`.
+    """
+    charges = list(charges)
+    natoms, window = 0, None
+    spiral_num_list = []
+    napp_list = []
+    values = []
+    for batch in adj_batch_gener(atomfile, circlefile, batch_size=batch_size):
+        natoms = batch["atomadj"].shape[-1]
+        window = frontier_window(natoms, charges)
+        spiral_num_list.append(batch["spiral_num"])
+        napp_list.append(count_napp(batch["circleadj"]))
+        if window is not None:
+            values.extend(batched_eigh(batch["atomadj"], window=window, memory_budget=memory_budget))
+    if not spiral_num_list:
+        return charge_table(0, [], [], np.zeros([0, len(charges)]), charges)
+    spiral_num = np.concatenate(spiral_num_list)
+    napp = np.concatenate(napp_list)
+    values = np.array(values) if window is not None else np.zeros([spiral_num.shape[0], 0])
+    csi = charged_csi(values, napp, natoms, charges, start=0 if window is None else window[0])
+    return charge_table(natoms, spiral_num, napp, csi, charges)
+
+
+def store_sweep_csi(atomdir, target, circledir=None, charges: Iterable[int] = DEFAULT_CHARGES, number_mask=None,
+                    memory_budget: int = DEFAULT_MEMORY_BUDGET) -> pd.DataFrame:
+    """
+    `sweep_csi` of all spiral files in `atomdir`, stored in one table keyed by (natoms, spiral_num, charge).
+    It replaces running `mp_store_csi` once per charge.
+
+    Parameters
+    ----------
+    atomdir
+    target
+        Path of the table, see `io.table.write_table`.
+    circledir
+        Directory of circle adjacency with the same file names, or None to compute it.
+    charges:Iterable[int]
+    number_mask
+        Only these atom numbers if given.
+    memory_budget:int
+
+    Returns
+    -------
+    pd.DataFrame:
+        The stored table.
+    """
+    check_table_target(target)
+    charges = list(charges)
+    pa = re.compile("[0-9]+")
+    tables = []
+    for atomfile in spiral_files(atomdir):
+        number = int(pa.findall(os.path.splitext(atomfile)[0])[-1])
+        if number_mask is not None and number not in number_mask:
+            continue
+        circlefile = None if circledir is None else os.path.join(circledir, os.path.basename(atomfile))
+        logger.info(f"Sweeping CSI of {atomfile} over charges {charges}.")
+        tables.append(sweep_csi(atomfile, circlefile, charges=charges, memory_budget=memory_budget))
+    table = pd.concat(tables, ignore_index=True) if tables else charge_table(0, [], [], np.zeros([0, 0]), [])
+    write_table(table, target)
+    logger.info(f"CSI of {len(table) // max(len(charges), 1)} isomers x {len(charges)} charges stored in {target}.")
+    return table
@@ -15,28 +15,35 @@
 import logging
 import os
 import re
+from itertools import chain
 from multiprocessing import Pool, RLock, freeze_support
 import pathlib
+from typing import Generator, Iterable, Tuple
 
 import numpy as np
-from fullerenedataparser.data.spiral import adj_gener
+import pandas as pd
+from fullerenedataparser.calculator.csi import DEFAULT_CHARGES, DEFAULT_MEMORY_BUDGET, batched_eigh, charge_table, \
+    check_window, count_napp, eigh_window, save_csi
+from fullerenedataparser.data.spiral import adj_gener, spiral_files
+from fullerenedataparser.graph.adjacency import dense_to_neighbors
 from fullerenedataparser.io.recursion import recursion_files
+from fullerenedataparser.io.table import check_table_target, write_table
 from fullerenedataparser.io.xyz import simple_read_xyz_xtb
 from fullerenedataparser.molecular.fullerene import FullereneFamily
 from fullerenedataparser.util.config import setGlobValue
 from fullerenedataparser.util.logger import Logger
 from fullerenedataparser.util.mp import print_error
-from fullerenedataparser.util.geometry import sphere_center_of_four_points
+from fullerenedataparser.util.geometry import nearest_neighbors, sphere_center_of_four_points, topology_changes
 from tqdm import tqdm
 
 setGlobValue("log_level", logging.DEBUG)
 logger = Logger(__name__, console_on=True)
 
 
-def calculate_ext_csi(fullerene: FullereneFamily, para=7,
-                      distance_cutoff=None):
+def extended_adjacency(fullerene: FullereneFamily, para=7, distance_cutoff=None) -> np.ndarray:
     """
-    Implemention of extended
+    Extended adjacency of atoms decomposed by `calculate_ext_csi`.
+
     Parameters
     ----------
     fullerene:FullereneFamily
@@ -47,17 +54,14 @@ def calculate_ext_csi(fullerene: FullereneFamily, para=7,
         distance more than cutoff will be regard as 0
     Returns
     -------
-        CSI
-    References
-    ----------
+    np.ndarray:
+        Matrix with shape [N, N].
 
+    Raises
+    ------
+    ValueError:
+        If some atom of `fullerene` has not exactly three neighbors.
     """
-
-    assert fullerene.natoms % 2 == 0, f"Not A classical Fullerene. Check your input atoms: {fullerene}."
-    assert fullerene.info[
-               "charge"] % 2 == 0, f"Only Deal with Even number charged Fullerene Now. Got charge:{fullerene.info['charge']}."
-    # csi_adj = fullerene.atomADJ # not used actually
-
     distances = fullerene.get_all_distances()
     mask = np.ones_like(distances) - np.eye(fullerene.natoms)
     # dis_vec = fullerene.get_all_distances(vector=True)
@@ -65,14 +69,10 @@ def calculate_ext_csi(fullerene: FullereneFamily, para=7,
     # orbital_p_vec = (distances[:, :, None] * dis_vec).sum(-2)
     # orbital_p_vec /= -np.linalg.norm(orbital_p_vec, 2, 1)[:, None]
 
-    orbital_p_vec = np.zeros([fullerene.natoms, 3])
-    for i in range(fullerene.natoms):
-        O = sphere_center_of_four_points(
-            fullerene.positions[np.where(fullerene.atomADJ[i] == 1)][0],
-            fullerene.positions[np.where(fullerene.atomADJ[i] == 1)][1],
-            fullerene.positions[np.where(fullerene.atomADJ[i] == 1)][2],
-            fullerene.positions[i])
-        orbital_p_vec[i] = fullerene.positions[i] - O
+    # Spheres through each atom and its three neighbors, all at once.
+    neighbors = fullerene.positions[dense_to_neighbors(fullerene.atomADJ == 1)]
+    O = sphere_center_of_four_points(neighbors[:, 0], neighbors[:, 1], neighbors[:, 2], fullerene.positions)
+    orbital_p_vec = fullerene.positions - O
     orbital_p_vec /= -np.linalg.norm(orbital_p_vec, 2, 1)[:, None]
     if distance_cutoff:
         dis_mask_idx = np.where(distances > distance_cutoff)
@@ -84,19 +84,98 @@ def calculate_ext_csi(fullerene: FullereneFamily, para=7,
     t = para
 
     extend_adj = orbital_p_cos * 1 / (distances + 0.00001) ** 4
+    return t * extend_adj * mask
 
-    sum_chi = np.linalg.eigh(t * extend_adj * mask)
 
-    adj = fullerene.get_fullerenecage().circleADJ
-    Napp = (adj * (adj.sum(-1) == 5)[None, :] * (adj.sum(-1) == 5)[:,
-                                                None]).sum() / 2
+def calculate_ext_csi(fullerene: FullereneFamily, para=7,
+                      distance_cutoff=None, vectors=True, window=None):
+    """
+    Implemention of extended
+    Parameters
+    ----------
+    fullerene:FullereneFamily
+        molecule Instance of Fullerene.
+    para:int
+        multiple value to adj
+    distance_cutoff: float or None
+        distance more than cutoff will be regard as 0
+    vectors: bool
+        Also compute eigenvectors, otherwise None is returned for them.
+    window: Tuple[int, int] or None
+        Only eigenpairs `start:stop` in ascending order, see `calculator.csi.eigh_window`.
+    Returns
+    -------
+        CSI
+    References
+    ----------
+
+    See Also
+    --------
+    extended_adjacency
+    """
+
+    assert fullerene.natoms % 2 == 0, f"Not A classical Fullerene. Check your input atoms: {fullerene}."
+    assert fullerene.info[
+               "charge"] % 2 == 0, f"Only Deal with Even number charged Fullerene Now. Got charge:{fullerene.info['charge']}."
+    # csi_adj = fullerene.atomADJ # not used actually
+
+    sum_chi = eigh_window(extended_adjacency(fullerene, para=para, distance_cutoff=distance_cutoff),
+                          vectors=vectors, window=window)
+
+    Napp = count_napp(fullerene.get_fullerenecage().circleADJ)
     # sum_chi = sum_chi[:fullerene.natoms // 2 - int(fullerene.info["charge"])//2]
 
     return sum_chi[0], sum_chi[1], Napp
 
 
+def xyz_cages(atomfile, circlefile, xyz_dir, charge=0, all_xyz=False) -> Generator[FullereneFamily, None, None]:
+    """
+    Cages of `.xyz` files in `xyz_dir` with their adjacency, in spiral order.
+
+    Parameters
+    ----------
+    atomfile
+    circlefile
+    xyz_dir:
+        .xyz files directory, one file for each isomer in `atomfile`
+    charge: int
+        the charge number of cages
+    all_xyz:
+        all frames of each file, otherwise only the last one
+
+    Returns
+    -------
+    Generator[FullereneFamily]:
+        Energies are in `info["energy"]`.
+    """
+    pa = re.compile("[0-9]+")
+    pbar = tqdm(total=len(os.listdir(xyz_dir)))
+    adjgener = adj_gener(atomfile, circlefile)
+    for xyz_path in recursion_files(rootpath=xyz_dir, ignore_mode=True,
+                                    format="xyz"):
+        adj = next(adjgener)
+        pbar.set_description(f'{xyz_path}')
+        pbar.update()
+        frames = list(simple_read_xyz_xtb(xyz_path))
+        if all_xyz and len(frames) > 1:
+            # Bonds of all frames in one KD-tree query.
+            changed = np.nonzero(topology_changes(nearest_neighbors(np.stack([f.positions for f in frames]))))[0]
+            if changed.shape[0]:
+                logger.warning(f"Bonds change at frames {changed.tolist()} of {xyz_path}.")
+        for f in frames[-1:] if not all_xyz else frames:
+            spiral_num = int(pa.findall(os.path.splitext(xyz_path)[0])[-1])
+            assert spiral_num == adj["spiral_num"]
+            atomadj = adj["atomadj"]
+            circleadj = adj["circleadj"]
+            f.info["charge"] = charge
+            yield FullereneFamily(spiral=spiral_num, atomADJ=atomadj,
+                                  circleADJ=circleadj, atoms=f)
+    pbar.close()
+
+
 def store_csi(atomfile, circlefile, xyz_dir, target_path, para,
-              _func=calculate_ext_csi, charge=0, all_xyz=False):
+              _func=calculate_ext_csi, charge=0, all_xyz=False,
+              memory_budget=DEFAULT_MEMORY_BUDGET, vectors=False, window=None):
     """
         save file to `target_path`,{
     csi_list,spiral_num,energy
@@ -118,57 +197,71 @@ def store_csi(atomfile, circlefile, xyz_dir, target_path, para,
         the charge number of cages
     all_xyz:
         read and calculate all xyz coordinations from xyz_dir's files
+    memory_budget: int
+        Bytes of matrices decomposed at once by `batched_eigh`.
+        Only for the default `_func`, other functions are called cage by cage.
+    vectors: bool
+        Also store eigenvectors as `csi_vectors`.
+    window: Tuple[int, int] or None
+        Only store eigenpairs `start:stop`, see `calculator.csi.save_csi`.
     See Also
     --------
     data.spiral.adj_store, calculate_csi
 
     """
     spiral_num_list = []
-    csi_list = []
     energy_list = []
     napp_list = []
-    pa = re.compile("[0-9]+")
-    pbar = tqdm(total=len(os.listdir(xyz_dir)))
-    adjgener = adj_gener(atomfile, circlefile)
-    for xyz_path in recursion_files(rootpath=xyz_dir, ignore_mode=True,
-                                    format="xyz"):
-        adj = next(adjgener)
-        pbar.set_description(f'{xyz_path}')
-        pbar.update()
-        for f in list(simple_read_xyz_xtb(xyz_path))[
-                 -1:] if not all_xyz else list(simple_read_xyz_xtb(xyz_path)):
-            spiral_num = int(pa.findall(os.path.splitext(xyz_path)[0])[-1])
-            assert spiral_num == adj["spiral_num"]
-            atomadj = adj["atomadj"]
-            circleadj = adj["circleadj"]
-            energy = f.info["energy"]
-            f.info["charge"] = charge
-            fuller = FullereneFamily(spiral=spiral_num, atomADJ=atomadj,
-                                     circleADJ=circleadj, atoms=f)
-            spiral_num_list.append(spiral_num)
-            csi_val, _, napp_val = _func(fuller, para=para)
-            csi_list.append(csi_val)
+
+    def cages():
+        for fuller in xyz_cages(atomfile, circlefile, xyz_dir, charge=charge, all_xyz=all_xyz):
+            spiral_num_list.append(fuller.spiral)
+            energy_list.append(fuller.info["energy"])
+            yield fuller
+
+    if _func is calculate_ext_csi:
+        def matrices():
+            for fuller in cages():
+                assert fuller.natoms % 2 == 0, f"Not A classical Fullerene. Check your input atoms: {fuller}."
+                assert charge % 2 == 0, f"Only Deal with Even number charged Fullerene Now. Got charge:{charge}."
+                napp_list.append(count_napp(fuller.get_fullerenecage().circleADJ))
+                yield extended_adjacency(fuller, para=para)
+
+        results = list(batched_eigh(matrices(), vectors=vectors, window=window, memory_budget=memory_budget))
+    else:
+        results = []
+        for fuller in cages():
+            csi_val, csi_vectors, napp_val = _func(fuller, para=para)
+            start, stop = (0, len(csi_val)) if window is None else check_window(window, len(csi_val))
+            csi_val = csi_val[start:stop]
+            results.append((csi_val, csi_vectors[:, start:stop]) if vectors else csi_val)
             napp_list.append(napp_val)
-            energy_list.append(energy)
-    np.savez(target_path, csi_list=csi_list,
-             spiral_num=np.array(spiral_num_list),
-             energy=np.array(energy_list), napp=napp_list)
+    save_csi(target_path, results, vectors=vectors, window=window,
+             spiral_num=spiral_num_list, energy=energy_list, napp=napp_list)
 
 
 def _store_csi(args):
     logger.debug(f"_store_csi:{args}")
-    atomfile, circlefile, xyz_dir, target_path, para, _func, charge, include_traj = args
+    atomfile, circlefile, xyz_dir, target_path, para, _func, charge, include_traj, memory_budget, vectors, window = args
     store_csi(atomfile, circlefile, xyz_dir, target_path, para, _func=_func,
-              charge=charge, all_xyz=include_traj)
+              charge=charge, all_xyz=include_traj, memory_budget=memory_budget,
+              vectors=vectors, window=window)
 
 
 def mp_store_csi(atomdir, circledir, xyz_root_dir, target_dir, para=7,
                  charge=0, recalculate=True, npz_file_suffix="xCSI",
                  number_mask=None, _func=calculate_ext_csi,
-                 include_traj=False):
+                 include_traj=False, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 vectors=False, window=None):
     """
     Batch process of calculating extended-CSI
 
+    Parameters
+    ----------
+    window:
+        Index range passed to `store_csi`, or a callable of atom number returning it,
+        see `calculator.csi.mp_store_csi`.
+
     See Also
     --------
     `store_csi`, `calculate_csi`
@@ -178,7 +271,7 @@ def mp_store_csi(atomdir, circledir, xyz_root_dir, target_dir, para=7,
     tqdm.set_lock(RLock())
     pa = re.compile("[0-9]+")
     po = Pool(1, initializer=tqdm.set_lock, initargs=(tqdm.get_lock(),))
-    for atomfile in recursion_files(atomdir, format=""):
+    for atomfile in spiral_files(atomdir):
         basename = os.path.basename(atomfile)
         circlefile = os.path.join(circledir, basename)
         # update = lambda *args: pbar.update()
@@ -195,7 +288,9 @@ def mp_store_csi(atomdir, circledir, xyz_root_dir, target_dir, para=7,
         try:
             target_path = os.path.join(target_dir,
                                        basename + f"_{npz_file_suffix}.npz")
-            args = atomfile, circlefile, xyz_dir, target_path, para, _func, charge, include_traj
+            file_window = window(int(number)) if callable(window) else window
+            args = atomfile, circlefile, xyz_dir, target_path, para, _func, charge, include_traj, memory_budget, \
+                vectors, file_window
             if not recalculate:
                 if pathlib.Path(target_path).exists():
                     continue
@@ -207,6 +302,114 @@ def mp_store_csi(atomdir, circledir, xyz_root_dir, target_dir, para=7,
     po.join()
 
 
+def xcsi_window(natoms: int, charges: Iterable[int]) -> Tuple[int, int]:
+    """
+    Eigenvalues (ascending) summed by xCSI of all `charges`, see `examples/xcsi/utils.py::calculate_xcsi`.
+    """
+    charges = list(charges)
+    if any(charge % 2 for charge in charges):
+        raise ValueError(f"Only Deal with Even number charged Fullerene Now. Got charges:{charges}.")
+    return check_window((0, natoms // 2 + max(charges) // 2 - 1), natoms)
+
+
+def charged_xcsi(values: np.ndarray, napp, natoms: int, charges: Iterable[int]) -> np.ndarray:
+    """
+    xCSI of several charges from one spectrum of extended adjacency.
+
+    Parameters
+    ----------
+    values:np.ndarray
+        The lowest eigenvalues in ascending order with shape [M, W], e.g. of `xcsi_window(natoms, charges)`.
+    napp:np.ndarray
+        Number of adjacent pentagon pairs with shape [M].
+    natoms:int
+    charges:Iterable[int]
+
+    Returns
+    -------
+    np.ndarray:
+        xCSI with shape [M, len(charges)].
+    """
+    values = np.asarray(values)
+    xcsi = []
+    for charge in charges:
+        stop = xcsi_window(natoms, [charge])[1]
+        if stop > values.shape[-1]:
+            raise ValueError(f"Eigenvalues 0:{values.shape[-1]} don't cover charge {charge}.")
+        xcsi.append(values[:, :stop].sum(-1) + 0.2 * np.asarray(napp))
+    return np.stack(xcsi, axis=-1)
+
+
+def sweep_ext_csi(atomfile, circlefile, xyz_dir, charges: Iterable[int] = DEFAULT_CHARGES, para=7,
+                  memory_budget=DEFAULT_MEMORY_BUDGET) -> pd.DataFrame:
+    """
+    xCSI of all isomers for all `charges` from one geometry of each isomer (the last frame
+    in `xyz_dir`), each extended adjacency decomposed once.
+
+    Returns
+    -------
+    pd.DataFrame:
+        Columns `natoms`, `spiral_num`, `charge`, `napp` and `xcsi`.
+
+    See Also
+    --------
+    calculator.csi.sweep_csi
+    """
+    charges = list(charges)
+    spiral_num_list = []
+    napp_list = []
+    cages = xyz_cages(atomfile, circlefile, xyz_dir)
+    first = next(cages, None)
+    if first is None:
+        return charge_table(0, [], [], np.zeros([0, len(charges)]), charges, name="xcsi")
+    # All cages of one spiral file have the same atom number.
+    natoms = first.natoms
+    window = xcsi_window(natoms, charges)
+
+    def matrices():
+        for fuller in chain([first], cages):
+            assert fuller.natoms % 2 == 0, f"Not A classical Fullerene. Check your input atoms: {fuller}."
+            spiral_num_list.append(fuller.spiral)
+            napp_list.append(count_napp(fuller.get_fullerenecage().circleADJ))
+            yield extended_adjacency(fuller, para=para)
+
+    values = np.array(list(batched_eigh(matrices(), window=window, memory_budget=memory_budget)))
+    xcsi = charged_xcsi(values, napp_list, natoms, charges)
+    return charge_table(natoms, spiral_num_list, napp_list, xcsi, charges, name="xcsi")
+
+
+def store_sweep_ext_csi(atomdir, circledir, xyz_root_dir, target, charges: Iterable[int] = DEFAULT_CHARGES, para=7,
+                        number_mask=None, memory_budget=DEFAULT_MEMORY_BUDGET) -> pd.DataFrame:
+    """
+    `sweep_ext_csi` of all spiral files in `atomdir` with `.xyz` files in `xyz_root_dir/C{N}`,
+    stored in one table keyed by (natoms, spiral_num, charge).
+
+    See Also
+    --------
+    calculator.csi.store_sweep_csi
+    """
+    check_table_target(target)
+    charges = list(charges)
+    pa = re.compile("[0-9]+")
+    tables = []
+    for atomfile in spiral_files(atomdir):
+        number = pa.findall(os.path.splitext(atomfile)[0])[-1]
+        if number_mask is not None and int(number) not in number_mask:
+            continue
+        circlefile = os.path.join(circledir, os.path.basename(atomfile))
+        xyz_dir = os.path.join(xyz_root_dir, "C" + number)
+        if not os.path.exists(xyz_dir):
+            logger.warning(f"No directory {xyz_dir}, skip {atomfile}.")
+            continue
+        tables.append(sweep_ext_csi(atomfile, circlefile, xyz_dir, charges=charges, para=para,
+                                    memory_budget=memory_budget))
+    table = pd.concat(tables, ignore_index=True) if tables else \
+        charge_table(0, [], [], np.zeros([0, 0]), [], name="xcsi")
+    write_table(table, target)
+    logger.info(f"xCSI of {len(table) // max(len(charges), 1)} isomers x {len(charges)} charges stored in {target}.")
+    return table
+
+
 if __name__ == '__main__':
     freeze_support()
     tqdm.set_lock(RLock())
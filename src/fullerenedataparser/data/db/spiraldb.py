@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : spiraldb.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+
+"""
+Binary spiral database, one file per atom count.
+
+Layout of a database file::
+
+    header   64 bytes, see `HEADER_DTYPE`
+    records  `count` fixed-stride records, see `record_dtype`
+    tables   utf-8 json of symmetry and NMR pattern names
+
+Records are exposed through `numpy.memmap`, so opening a database only reads
+the header and tables, and slicing records doesn't copy.
+"""
+
+import json
+from typing import Generator
+
+import numpy as np
+from tqdm import tqdm
+
+from fullerenedataparser.data.spiral import adj_gener
+from fullerenedataparser.graph.adjacency import CSRAdjacency, neighbors_to_dense
+from fullerenedataparser.graph.algorithm.isomers import enumerate_isomers
+from fullerenedataparser.util.logger import Logger
+
+logger = Logger(__name__, console_on=True)
+
+MAGIC = b"FDPSPDB1"
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("atom_num", "<u4"),
+    ("circle_num", "<u4"),
+    ("count", "<u8"),
+    ("table_offset", "<u8"),
+    ("record_size", "<u4"),
+    ("reserved", "V28"),
+])
+# Point groups of fullerenes. Codes of these symbols are the same in all databases.
+POINT_GROUPS = ["C1", "Cs", "Ci", "C2", "C2v", "C2h", "C3", "C3v", "C3h", "S4", "S6",
+                "D2", "D2h", "D2d", "D3", "D3h", "D3d", "D5", "D5h", "D5d", "D6", "D6h", "D6d",
+                "T", "Td", "Th", "I", "Ih"]
+CIRCLE_DEGREE = 6
+
+
+def record_dtype(atom_num: int) -> np.dtype:
+    """
+    dtype of one record in database of C`atom_num`.
+
+    Fields:
+        spiral_num: spiral number.
+        symmetry: code of point group, see `SpiralDatabase.symmetry_table`.
+        pentagon_index: 12 pentagon indices.
+        nmr: code of NMR pattern, see `SpiralDatabase.nmr_table`.
+        neighbors: `(N, 3)` neighbor array of atoms.
+        circle_neighbors: `(N // 2 + 2, 6)` neighbor array of circles, padded with -1 for pentagons.
+    """
+    return np.dtype([
+        ("spiral_num", "<u4"),
+        ("symmetry", "u1"),
+        ("pentagon_index", "<u2", (12,)),
+        ("nmr", "<u4"),
+        ("neighbors", "<i2", (atom_num, 3)),
+        ("circle_neighbors", "<i2", (atom_num // 2 + 2, CIRCLE_DEGREE)),
+    ])
+
+
+def _padded_circle_neighbors(circleadj: CSRAdjacency) -> np.ndarray:
+    padded = np.full([len(circleadj), CIRCLE_DEGREE], -1, dtype=np.int16)
+    degree = circleadj.degree
+    padded[np.repeat(np.arange(len(circleadj)), degree),
+           np.arange(circleadj.indices.shape[0]) - np.repeat(circleadj.indptr[:-1], degree)] = circleadj.indices
+    return padded
+
+
+class _CodeTable:
+    def __init__(self, names=None):
+        self.names = list(names) if names else []
+        self.codes = {name: code for code, name in enumerate(self.names)}
+
+    def code(self, name):
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+
+def convert_spiral_db(atomfile, circlefile, target, buffer=1000):
+    """
+    Convert a pair of spiral output files to a binary spiral database.
+
+    Parameters
+    ----------
+    atomfile
+        Spiral file of atom adjacency.
+    circlefile
+        Spiral file of circle adjacency.
+    target
+        Path of database file.
+    buffer:int
+        Number of records written at once.
+    """
+    gener = adj_gener(atomfile, circlefile, compact=True)
+    write_spiral_db(target, gener, buffer=buffer)
+
+
+def enumerate_spiral_db(atom_num: int, target, ipr: bool = False, workers: int = 1, buffer=1000):
+    """
+    !! Multiprocess
+    Enumerate all isomers of C`atom_num` (see `enumerate_isomers`) into a binary spiral database.
+
+    Parameters
+    ----------
+    atom_num:int
+        Number of atoms.
+    target
+        Path of database file.
+    ipr:bool
+        Only isomers obeying the isolated pentagon rule.
+    workers:int
+        Number of worker processes.
+    buffer:int
+        Number of records written at once.
+    """
+    gener = enumerate_isomers(atom_num, ipr=ipr, workers=workers)
+    write_spiral_db(target, gener, atom_num=atom_num, buffer=buffer)
+
+
+def write_spiral_db(target, gener, atom_num: int = None, buffer=1000):
+    """
+    Stream records from `gener` into a binary spiral database.
+
+    Parameters
+    ----------
+    target
+        Path of database file.
+    gener
+        Generator of dicts like `adj_gener(..., compact=True)`.
+    atom_num:int
+        Atom number of isomers, taken from the first record if not given.
+    buffer:int
+        Number of records written at once.
+    """
+    symmetry_table = _CodeTable(POINT_GROUPS)
+    nmr_table = _CodeTable()
+    count = 0
+    pbar = tqdm()
+    pbar.set_description(f'{target}')
+    with open(target, "wb") as f:
+        f.write(bytes(HEADER_SIZE))
+        chunk = None
+        filled = 0
+        for item in gener:
+            if chunk is None:
+                atom_num = atom_num or item["atomadj"].shape[0]
+                dtype = record_dtype(atom_num)
+                chunk = np.zeros(buffer, dtype=dtype)
+            record = chunk[filled]
+            record["spiral_num"] = item["spiral_num"]
+            record["symmetry"] = symmetry_table.code(item["symmetry"])
+            record["pentagon_index"] = item["pentagon_index"]
+            record["nmr"] = nmr_table.code(item["NMR"])
+            record["neighbors"] = item["atomadj"]
+            record["circle_neighbors"] = _padded_circle_neighbors(item["circleadj"])
+            filled += 1
+            if filled == buffer:
+                f.write(chunk.tobytes())
+                count += filled
+                pbar.update(filled)
+                filled = 0
+        if chunk is None:
+            raise ValueError(f"No isomer to store in {target}.")
+        f.write(chunk[:filled].tobytes())
+        count += filled
+        pbar.update(filled)
+        table_offset = f.tell()
+        f.write(json.dumps({"symmetry": symmetry_table.names, "nmr": nmr_table.names}).encode("utf-8"))
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["atom_num"] = atom_num
+        header["circle_num"] = atom_num // 2 + 2
+        header["count"] = count
+        header["table_offset"] = table_offset
+        header["record_size"] = dtype.itemsize
+        f.seek(0)
+        f.write(header.tobytes())
+    pbar.close()
+    logger.info(f"{count} isomers have been stored in {target}.")
+
+
+class SpiralDatabase:
+    """
+    Reader of binary spiral database, see `convert_spiral_db`.
+
+    Indexing a `SpiralDatabase` with an integer, a slice or an array indexes
+    its records by position. Slices of records are views of the memory map.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = np.frombuffer(f.read(HEADER_SIZE), dtype=HEADER_DTYPE)[0]
+            if header["magic"] != MAGIC:
+                raise ValueError(f"Not a spiral database file: {path}.")
+            self.atom_num = int(header["atom_num"])
+            self.circle_num = int(header["circle_num"])
+            self.count = int(header["count"])
+            f.seek(int(header["table_offset"]))
+            tables = json.loads(f.read().decode("utf-8"))
+        self.symmetry_table = np.array(tables["symmetry"])
+        self.nmr_table = np.array(tables["nmr"])
+        self.dtype = record_dtype(self.atom_num)
+        assert self.dtype.itemsize == int(header["record_size"]), f"Record size mismatch in {path}."
+        if self.count:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r", offset=HEADER_SIZE, shape=(self.count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        return self.records[key]
+
+    @property
+    def spiral_num(self) -> np.ndarray:
+        return self.records["spiral_num"]
+
+    @property
+    def pentagon_index(self) -> np.ndarray:
+        return self.records["pentagon_index"]
+
+    @property
+    def neighbors(self) -> np.ndarray:
+        return self.records["neighbors"]
+
+    @property
+    def circle_neighbors(self) -> np.ndarray:
+        return self.records["circle_neighbors"]
+
+    def symmetry(self, key=slice(None)) -> np.ndarray:
+        """
+        Point group names of records at `key`.
+        """
+        return self.symmetry_table[self.records["symmetry"][key]]
+
+    def nmr(self, key=slice(None)) -> np.ndarray:
+        """
+        NMR patterns of records at `key`.
+        """
+        return self.nmr_table[self.records["nmr"][key]]
+
+    def position(self, spiral_num) -> np.ndarray:
+        """
+        Positions of records with spiral number `spiral_num`.
+        """
+        spiral_num = np.asarray(spiral_num)
+        position = np.searchsorted(self.spiral_num, spiral_num)
+        if (position >= self.count).any() or (self.spiral_num[np.minimum(position, self.count - 1)] != spiral_num).any():
+            raise KeyError(f"Spiral number {spiral_num} not found in {self.path}.")
+        return position
+
+    def get(self, spiral_num: int, compact=False) -> dict:
+        """
+        Isomer with spiral number `spiral_num`, as a dict like items from `adj_gener`.
+        """
+        return self._item(self.records[int(self.position(spiral_num))], compact=compact)
+
+    def content(self, compact=False) -> Generator[dict, None, None]:
+        """
+        Iterate all isomers as dicts like items from `adj_gener`.
+        """
+        for record in self.records:
+            yield self._item(record, compact=compact)
+
+    def _item(self, record, compact=False) -> dict:
+        circle_neighbors = record["circle_neighbors"]
+        circleadj = CSRAdjacency(np.concatenate([[0], np.cumsum((circle_neighbors >= 0).sum(-1))]),
+                                 circle_neighbors[circle_neighbors >= 0])
+        item = {
+            "spiral_num": int(record["spiral_num"]),
+            "atomadj": record["neighbors"],
+            "symmetry": str(self.symmetry_table[record["symmetry"]]),
+            "pentagon_index": record["pentagon_index"].astype(int).tolist(),
+            "circleadj": circleadj,
+            "NMR": str(self.nmr_table[record["nmr"]])
+        }
+        if not compact:
+            item["atomadj"] = neighbors_to_dense(item["atomadj"])
+            item["circleadj"] = circleadj.todense()
+        return item
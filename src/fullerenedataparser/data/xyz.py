@@ -11,6 +11,7 @@ from typing import Generator, Optional, Union
 
 from ase import Atoms
 
+from fullerenedataparser.io.compress import open_file
 from fullerenedataparser.util.logger import Logger
 
 logger = Logger(__name__, console_on=True)
@@ -36,7 +37,7 @@ def simple_read_xyz_xtb(fileobj: Union[Path,str, io.TextIOWrapper],
         With info attribution from comment of .xyz file.
     """
     if isinstance(fileobj, Path) or isinstance(fileobj,str):
-        fileobj = open(fileobj, "r")
+        fileobj = open_file(fileobj, "r")
     lines = fileobj.readlines()
     natoms = int(lines[0])
     nimages = len(lines) // (natoms + 2)  # Calculate the number of molecules.
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : adjacency.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+
+"""
+Compact adjacency representations of fullerene graphs.
+
+Dense adjacency matrices cost `N*N` entries while a fullerene graph only has `3N/2` edges.
+
+* Atom graphs are cubic, so they are carried as a `(N, 3)` neighbor array.
+* Circle (dual) graphs have degree 5 or 6, so they are carried as `CSRAdjacency`.
+
+Both convert to dense matrices only on request. `CSRAdjacency` is also the graph
+layer of cages (edges, BFS distances, connected components); networkx graphs are
+only built by `CSRAdjacency.to_networkx`.
+"""
+
+import numpy as np
+
+
+def dense_to_neighbors(adj: np.ndarray, degree: int = 3, dtype=np.int16) -> np.ndarray:
+    """
+    Convert a dense adjacency matrix of a regular graph to a neighbor array.
+
+    Parameters
+    ----------
+    adj:np.ndarray
+        Adjacency matrix with shape [N, N].
+    degree:int
+        Degree of every vertex. Default to 3 for fullerene atoms.
+    dtype:
+        dtype of neighbor array.
+
+    Returns
+    -------
+    np.ndarray:
+        Neighbor array with shape [N, degree], neighbors of each vertex sorted ascending.
+    """
+    rows, cols = np.nonzero(adj)
+    if rows.shape[0] != adj.shape[0] * degree or (np.bincount(rows, minlength=adj.shape[0]) != degree).any():
+        raise ValueError(f"Not a graph with all vertices of degree {degree}.")
+    return cols.reshape(adj.shape[0], degree).astype(dtype)
+
+
+def neighbors_to_dense(neighbors: np.ndarray, dtype=int) -> np.ndarray:
+    """
+    Convert a neighbor array to a dense adjacency matrix.
+
+    Parameters
+    ----------
+    neighbors:np.ndarray
+        Neighbor array with shape [N, degree].
+    dtype:
+        dtype of adjacency matrix.
+
+    Returns
+    -------
+    np.ndarray:
+        Adjacency matrix with shape [N, N].
+    """
+    adj = np.zeros([neighbors.shape[0], neighbors.shape[0]], dtype=dtype)
+    adj[np.arange(neighbors.shape[0])[:, None], neighbors] = 1
+    return adj
+
+
+class CSRAdjacency:
+    """
+    Adjacency of a graph in compressed sparse row layout.
+
+    Neighbors of vertex `i` are `indices[indptr[i]:indptr[i + 1]]`.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray):
+        """
+
+        Parameters
+        ----------
+        indptr:np.ndarray
+            Row offsets with shape [N + 1].
+        indices:np.ndarray
+            Flat neighbor indices with shape [indptr[-1]].
+        """
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int16)
+
+    @classmethod
+    def from_dense(cls, adj: np.ndarray) -> "CSRAdjacency":
+        rows, cols = np.nonzero(adj)
+        indptr = np.zeros(adj.shape[0] + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=adj.shape[0]), out=indptr[1:])
+        return cls(indptr, cols)
+
+    @classmethod
+    def from_neighbors(cls, neighbors: np.ndarray) -> "CSRAdjacency":
+        """
+        From a neighbor array of a regular graph with shape [N, degree].
+        """
+        neighbors = np.sort(neighbors, axis=-1)
+        return cls(np.arange(neighbors.shape[0] + 1) * neighbors.shape[1], neighbors.reshape(-1))
+
+    def todense(self, dtype=int) -> np.ndarray:
+        adj = np.zeros(self.shape, dtype=dtype)
+        adj[np.repeat(np.arange(len(self)), self.degree), self.indices] = 1
+        return adj
+
+    def neighbors(self, i: int) -> np.ndarray:
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    @property
+    def degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    @property
+    def shape(self):
+        return len(self), len(self)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.indices.nbytes
+
+    def copy(self) -> "CSRAdjacency":
+        return CSRAdjacency(self.indptr.copy(), self.indices.copy())
+
+    def edges(self) -> np.ndarray:
+        """
+        Edges with shape [E, 2], each edge once with `edge[0] < edge[1]`, in lexicographic order.
+        """
+        rows = np.repeat(np.arange(len(self), dtype=np.int32), self.degree)
+        mask = rows < self.indices
+        return np.stack([rows[mask], self.indices[mask].astype(np.int32)], axis=-1)
+
+    def bfs_distances(self, source=None) -> np.ndarray:
+        """
+        Shortest path lengths by breadth-first search, -1 for unreachable vertices.
+
+        Parameters
+        ----------
+        source:int or None
+            Source vertex. All sources at once if None.
+
+        Returns
+        -------
+        np.ndarray:
+            Distances with shape [N], or [N, N] for all sources.
+        """
+        sources = np.arange(len(self)) if source is None else np.atleast_1d(source)
+        rows = np.repeat(np.arange(len(self)), self.degree)
+        dist = np.full([sources.shape[0], len(self)], -1, dtype=np.int32)
+        frontier = np.zeros([sources.shape[0], len(self)], dtype=bool)
+        frontier[np.arange(sources.shape[0]), sources] = True
+        level = 0
+        while frontier.any():
+            dist[frontier] = level
+            level += 1
+            # Vertices with any neighbor in the frontier, for all sources at once.
+            reached = np.zeros_like(frontier)
+            np.logical_or.at(reached, (slice(None), rows), frontier[:, self.indices])
+            frontier = reached & (dist < 0)
+        return dist[0] if source is not None and np.ndim(source) == 0 else dist
+
+    def connected_components(self) -> np.ndarray:
+        """
+        Label of the connected component of each vertex, numbered from 0 by the smallest vertex.
+        """
+        labels = np.arange(len(self))
+        rows = np.repeat(np.arange(len(self)), self.degree)
+        while True:
+            # Propagate the smallest label along edges until stable.
+            new = labels.copy()
+            np.minimum.at(new, rows, labels[self.indices])
+            new = new[new]
+            if np.array_equal(new, labels):
+                break
+            labels = new
+        return np.unique(labels, return_inverse=True)[1].reshape(-1)
+
+    def to_networkx(self):
+        """
+        `networkx.Graph` of the same graph, built on demand.
+        """
+        import networkx as nx
+        graph = nx.Graph()
+        graph.add_nodes_from(range(len(self)))
+        graph.add_edges_from(self.edges().tolist())
+        return graph
+
+    def __len__(self):
+        return self.indptr.shape[0] - 1
+
+    def __eq__(self, other):
+        if not isinstance(other, CSRAdjacency):
+            return NotImplemented
+        return np.array_equal(self.indptr, other.indptr) and np.array_equal(self.indices, other.indices)
+
+    def __repr__(self):
+        return f"CSRAdjacency(size={len(self)}, edges={self.indices.shape[0] // 2})"
+
+
+def atom_edges(atomadj) -> np.ndarray:
+    """
+    Edge list of atom graph.
+
+    Parameters
+    ----------
+    atomadj:np.ndarray
+        Adjacency matrix with shape [N, N] or neighbor array with shape [N, 3].
+
+    Returns
+    -------
+    np.ndarray:
+        int32 edges with shape [E, 2], each edge once with `edge[0] < edge[1]`.
+    """
+    if atomadj.shape[0] == atomadj.shape[1]:
+        return np.ascontiguousarray(np.argwhere(np.triu(atomadj)), dtype=np.int32)
+    rows = np.repeat(np.arange(atomadj.shape[0]), atomadj.shape[1])
+    cols = atomadj.reshape(-1)
+    return np.ascontiguousarray(np.stack([rows, cols], axis=-1)[rows < cols], dtype=np.int32)
+
+
+def geometry_rotation(positions: np.ndarray, neighbors: np.ndarray, tol: float = 0.1) -> np.ndarray:
+    """
+    Rotation system of a cubic cage from its geometry.
+
+    Neighbors of each atom are ordered counterclockwise around its radial vector
+    (from the center of the cage), which is the planar embedding of a convex cage.
+
+    Parameters
+    ----------
+    positions:np.ndarray
+        Positions of atoms with shape [N, 3].
+    neighbors:np.ndarray
+        Neighbor array with shape [N, 3].
+    tol:float
+        Minimum of `|r . (d0 x d1)|` with unit vectors, below which the order of an atom is ambiguous.
+
+    Returns
+    -------
+    np.ndarray:
+        int32 rotation with shape [N, 3].
+
+    Raises
+    ------
+    ValueError:
+        If the cage is not cubic or the order of any atom is ambiguous.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    neighbors = np.asarray(neighbors)
+    if neighbors.ndim != 2 or neighbors.shape[1] != 3 or neighbors.shape[0] != positions.shape[0]:
+        raise ValueError(f"Rotation from geometry needs a cubic cage, got neighbors of shape {neighbors.shape}.")
+    radial = positions - positions.mean(0)
+    bonds = positions[neighbors] - positions[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        radial = radial / np.linalg.norm(radial, axis=-1, keepdims=True)
+        bonds = bonds / np.linalg.norm(bonds, axis=-1, keepdims=True)
+        triple = np.einsum("ni,ni->n", radial, np.cross(bonds[:, 0], bonds[:, 1]))
+    if not (np.abs(triple) >= tol).all():
+        raise ValueError("Ambiguous neighbor order from geometry.")
+    rotation = np.array(neighbors, dtype=np.int32)
+    rotation[triple < 0, 1:] = rotation[triple < 0, :0:-1]
+    return rotation
+
+
+def circle_adjacency(atomadj, compact: bool = False):
+    """
+    Adjacency of circles (the dual graph) computed from adjacency of atoms.
+
+    Circles are numbered in the order the planar face traversal meets them,
+    which is generally not the spiral order of circles in spiral output files.
+    The graphs are the same up to this numbering.
+
+    Parameters
+    ----------
+    atomadj:np.ndarray
+        Adjacency matrix with shape [N, N] or neighbor array with shape [N, 3].
+    compact:bool
+        Return `CSRAdjacency` instead of dense matrix.
+
+    Returns
+    -------
+    np.ndarray or CSRAdjacency:
+        Adjacency of circles with shape [N // 2 + 2, N // 2 + 2].
+    """
+    from fullerenedataparser.graph.algorithm import dual
+    edges = atom_edges(atomadj)
+    finder = dual.py_graph_circle_finder(edges.shape[0], edges)
+    if compact:
+        adj = finder.dual_adjacency(dtype=np.int8, sparse=True)
+        return CSRAdjacency(adj.indptr, adj.indices)
+    return finder.dual_adjacency(dtype=int)
+
+
+def batch_circle_finder(edges, thread_num: int = 0):
+    """
+    Find faces and dual edges of a batch of atom graphs in one call.
+    The work runs in C++ threads with the GIL released.
+
+    Parameters
+    ----------
+    edges:
+        Edges with shape [B, E, 2], or a list of edge arrays with shape [E_i, 2].
+    thread_num:int
+        Number of threads. Default to all cores.
+
+    Returns
+    -------
+    dual.py_batch_circle_finder:
+        `get_face_vertex_list(i)`, `get_dual_edge_list(i)` etc. of the i-th graph, as zero-copy arrays.
+
+    Raises
+    ------
+    ValueError:
+        If any graph is not planar.
+    """
+    from fullerenedataparser.graph.algorithm import dual
+    edges = [np.asarray(item).reshape(-1, 2) for item in edges]
+    edge_offsets = np.zeros(len(edges) + 1, dtype=np.int32)
+    edge_offsets[1:] = np.cumsum([item.shape[0] for item in edges])
+    edge_origin = np.ascontiguousarray(np.concatenate(edges) if edges else np.zeros([0, 2]), dtype=np.int32)
+    finder = dual.py_batch_circle_finder(edge_offsets, edge_origin, thread_num)
+    nonplanar = np.nonzero(finder.planar_flag < 0)[0]
+    if nonplanar.shape[0]:
+        raise ValueError(f"Graphs {nonplanar.tolist()} are not planar.")
+    return finder
+
+
+def circle_adjacency_batch(atomadjs, thread_num: int = 0) -> np.ndarray:
+    """
+    `circle_adjacency` of a batch of cages with the same atom number.
+
+    Parameters
+    ----------
+    atomadjs:
+        Adjacency matrices with shape [B, N, N] or neighbor arrays with shape [B, N, 3].
+    thread_num:int
+        Number of threads. Default to all cores.
+
+    Returns
+    -------
+    np.ndarray:
+        Adjacency of circles with shape [B, N // 2 + 2, N // 2 + 2].
+    """
+    finder = batch_circle_finder([atom_edges(atomadj) for atomadj in atomadjs], thread_num)
+    return finder.dual_adjacency_batch(dtype=int)
@@ -9,60 +9,352 @@
 import numpy as np
 cimport numpy as np
 
-from libcpp.vector cimport vector
-
-cimport numpy as np
-import numpy as np
+from libcpp.string cimport string
 from libcpp.vector cimport vector
 
 cdef extern from "planar_dual.hpp" namespace "planar_dual":
-    cdef cppclass graph_circle_finder:
-        int edge_num # Size of edges, not vertex!
-        int *edge_origin # Array of edges.
-        int planar_flag # If the graph is planarity or not.
-        graph_circle_finder(int edge_num, int* edge_origin) except +
-        int privacy_get_graph_face_num() # Number of faces.
-        int privacy_get_face_vertex_num_sum() # Sum of vertex number in all faces. (Length of vertex_list and edge_list.)
-        int privacy_get_dual_edge_num() # Number of edges in dual graph.
-        void get_circle_vertex_num_list(vector[int]* vertex_num_list)
-        void get_circle_edge_num_list(vector[int]* edge_num_list)
-        void get_circle_vertex_list(vector[int]* vertex_num_list,vector[int]* vertex_list)
-        void get_circle_edge_list(vector[int]* edge_num_list,vector[vector[int]]* edge_list)
-        void get_dual_edge_list(int dual_edge_num, vector[vector[int]]* edge_list)
+    cdef cppclass circle_finder_result:
+        int planar_flag # 1 if the graph is planarity, else -1.
+        vector[int] face_offsets # Faces of `face_vertices[face_offsets[i]:face_offsets[i + 1]]`.
+        vector[int] face_vertices
+        vector[int] dual_edges # Pairs of faces.
+        vector[int] edge_faces # Pairs of faces of each input edge.
+        vector[int] vertex_face_offsets # Faces of `vertex_faces[vertex_face_offsets[i]:vertex_face_offsets[i + 1]]`.
+        vector[int] vertex_faces
+        int error_flag # 1 if finding circles of this graph raised, see `error_message`.
+        string error_message
+    void find_circles_flat(int edge_num, const int* edge_origin, circle_finder_result& result) except + nogil
+    int find_circles_rotation(int edge_num, const int* edge_origin, int vertex_num, int degree, const int* rotation,
+                              circle_finder_result& result) except + nogil
+    void find_circles_batch(int batch, const int* edge_offsets, const int* edge_origin, int thread_num,
+                            vector[circle_finder_result]* results) except + nogil
 
-cdef class py_graph_circle_finder:
-    cdef graph_circle_finder *c_finder
-    # cdef void * _data_vector_e
-    # cdef void * _data_vector_v
-    # cdef void * _data_vector_dual_edge
+cdef extern from "face_spiral.hpp" namespace "face_spiral":
+    int search_spirals(int circle_num, int ipr, const int* prefix, int prefix_len, int depth,
+                       vector[signed char]& sizes) except + nogil
+
+
+ctypedef fused adj_t:
+    double
+    float
+    long long
+    int
+    short
+    signed char
+    unsigned char
+
+
+cdef void _fill_adjacency(const vector[int]& dual_edges, adj_t[:, :] out) noexcept nogil:
+    # Zero `out` and set both directions of each dual edge.
+    cdef Py_ssize_t i, j
+    for i in range(out.shape[0]):
+        for j in range(out.shape[1]):
+            out[i, j] = 0
+    for i in range(0, dual_edges.size(), 2):
+        out[dual_edges[i], dual_edges[i + 1]] = 1
+        out[dual_edges[i + 1], dual_edges[i]] = 1
+
+
+cdef _check_out(out, Py_ssize_t face_num):
+    if out.ndim != 2 or out.shape[0] != face_num or out.shape[1] != face_num:
+        raise ValueError(f"`out` must have shape ({face_num}, {face_num}), got {out.shape}.")
+
+
+cdef _fill_adjacency_py(const vector[int]& dual_edges, out):
+    # Dispatch on dtype of `out`, no Python iteration over edges.
+    dtype = out.dtype
+    if dtype == np.float64:
+        _fill_adjacency[double](dual_edges, out)
+    elif dtype == np.float32:
+        _fill_adjacency[float](dual_edges, out)
+    elif dtype == np.int64:
+        _fill_adjacency[longlong](dual_edges, out)
+    elif dtype == np.int32:
+        _fill_adjacency[int](dual_edges, out)
+    elif dtype == np.int16:
+        _fill_adjacency[short](dual_edges, out)
+    elif dtype == np.int8:
+        _fill_adjacency[schar](dual_edges, out)
+    elif dtype == np.uint8 or dtype == np.bool_:
+        _fill_adjacency[uchar](dual_edges, out.view(np.uint8))
+    else:
+        raise TypeError(f"Unsupported dtype {dtype} of `out`.")
 
-    def __cinit__(self, int edge_num, int[:,:] edge_origin):
-        self.c_finder = new graph_circle_finder(edge_num, &edge_origin[0,0])
 
-    def __dealloc__(self):
-        del self.c_finder
+cdef _csr_adjacency(const vector[int]& dual_edges, Py_ssize_t face_num, dtype):
+    # `scipy.sparse.csr_matrix` of the dual graph, columns sorted within each row.
+    import scipy.sparse
+    cdef Py_ssize_t edge_num = dual_edges.size() // 2, i
+    indptr = np.zeros(face_num + 1, dtype=np.int32)
+    indices = np.empty(2 * edge_num, dtype=np.int32)
+    cdef int[:] indptr_view = indptr
+    cdef int[:] indices_view = indices
+    cdef vector[int] cursor
+    with nogil:
+        for i in range(2 * edge_num):
+            indptr_view[dual_edges[i] + 1] += 1
+        for i in range(face_num):
+            indptr_view[i + 1] += indptr_view[i]
+        cursor.assign(&indptr_view[0], &indptr_view[0] + face_num)
+        for i in range(edge_num):
+            indices_view[cursor[dual_edges[2 * i]]] = dual_edges[2 * i + 1]
+            cursor[dual_edges[2 * i]] += 1
+            indices_view[cursor[dual_edges[2 * i + 1]]] = dual_edges[2 * i]
+            cursor[dual_edges[2 * i + 1]] += 1
+    adj = scipy.sparse.csr_matrix((np.ones(2 * edge_num, dtype=dtype), indices, indptr), shape=(face_num, face_num))
+    adj.sort_indices()
+    return adj
 
 
+cdef class _IntBuffer:
+    """
+    Read-only buffer over a `vector[int]` of `owner`, which is kept alive by the buffer.
+    """
+    cdef object owner
+    cdef int* data
+    cdef Py_ssize_t shape[2]
+    cdef Py_ssize_t strides[2]
+    cdef int ndim
+
+    def __getbuffer__(self, Py_buffer *buffer, int flags):
+        buffer.buf = self.data
+        buffer.format = b"i"
+        buffer.internal = NULL
+        buffer.itemsize = sizeof(int)
+        buffer.len = self.shape[0] * self.shape[1] * sizeof(int)
+        buffer.ndim = self.ndim
+        buffer.obj = self
+        buffer.readonly = 1
+        buffer.shape = self.shape
+        buffer.strides = self.strides
+        buffer.suboffsets = NULL
+
+    def __releasebuffer__(self, Py_buffer *buffer):
+        pass
+
+
+cdef _view(object owner, vector[int]& v, Py_ssize_t width=0):
+    # Zero-copy int32 array of `v`, with shape [len // width, width] if `width`.
+    if v.size() == 0:
+        return np.zeros([0, width] if width else [0], dtype=np.int32)
+    cdef _IntBuffer buf = _IntBuffer.__new__(_IntBuffer)
+    buf.owner = owner
+    buf.data = v.data()
+    buf.ndim = 2 if width else 1
+    buf.shape[0] = v.size() // width if width else v.size()
+    buf.shape[1] = width if width else 1
+    buf.strides[0] = sizeof(int) * (width if width else 1)
+    buf.strides[1] = sizeof(int)
+    return np.asarray(buf)
+
+
+cdef class py_graph_circle_finder:
+    """
+    Faces and dual edges of a planar graph, given by `edge_num` edges in `edge_origin`.
+    Results are CSR-style int32 arrays sharing memory with the finder.
+
+    If a `rotation` system (neighbors of each vertex in cyclic order, shape [V, degree]) is given,
+    faces are traced from it in linear time. The Boyer-Myrvold planarity test is only run
+    if the rotation doesn't trace a sphere.
+    """
+    cdef circle_finder_result result
+    cdef readonly bint rotation_used
+
+    def __cinit__(self, int edge_num, int[:,:] edge_origin, int[:,:] rotation=None):
+        self.rotation_used = False
+        if rotation is not None and rotation.shape[0] > 0:
+            with nogil:
+                self.rotation_used = find_circles_rotation(edge_num, &edge_origin[0,0], rotation.shape[0],
+                                                           rotation.shape[1], &rotation[0,0], self.result) > 0
+        if not self.rotation_used:
+            with nogil:
+                find_circles_flat(edge_num, &edge_origin[0,0], self.result)
+        if self.result.planar_flag < 0:
+            raise ValueError("Graph is not planar.")
+
     def get_face_vertex_list(self):
-        cdef vector[int]* vertex_num_list=new vector[int](self.c_finder.privacy_get_graph_face_num())
-        self.c_finder.get_circle_vertex_num_list(&vertex_num_list[0])
-        cdef vector[int]* vertex_list=new vector[int](self.c_finder.privacy_get_face_vertex_num_sum())
-        self.c_finder.get_circle_vertex_list(&vertex_num_list[0], &vertex_list[0])
-        face_v_slice,face_v= (np.asarray(<vector[int]&> vertex_num_list[0]), np.asarray(<vector[int]&> vertex_list[0]))
-        del vertex_num_list
-        del vertex_list
-        return list(face_v[face_v_slice[:idx].sum():face_v_slice[:idx+1].sum()] for idx in range(self.face_size))
+        """
+        Vertices of each face as a list of views into `face_vertices`.
+        """
+        return np.split(self.face_vertices, self.face_offsets[1:-1])
 
     def get_dual_edge_list(self):
-        cdef vector[vector[int]]* dual_edge_list=new vector[vector[int]](self.c_finder.privacy_get_dual_edge_num(),vector[int](2,0))
-        self.c_finder.get_dual_edge_list(self.dual_size, &dual_edge_list[0])
-        dual_edge= np.asarray(<vector[vector[int]]&> dual_edge_list[0])
-        del dual_edge_list
-        return list(dual_edge)
+        return self.dual_edges
+
+    def dual_adjacency(self, dtype=np.float64, sparse=False, out=None):
+        """
+        Adjacency of faces (the dual graph), filled in C.
+
+        Parameters
+        ----------
+        dtype:
+            dtype of the adjacency.
+        sparse:bool
+            Return `scipy.sparse.csr_matrix` instead of dense matrix.
+        out:np.ndarray
+            Dense buffer with shape [F, F] to fill in place, `dtype` is ignored.
+
+        Returns
+        -------
+        np.ndarray or scipy.sparse.csr_matrix
+        """
+        if sparse:
+            return _csr_adjacency(self.result.dual_edges, self.face_size, dtype)
+        if out is None:
+            out = np.empty([self.face_size, self.face_size], dtype=dtype)
+        _check_out(out, self.face_size)
+        _fill_adjacency_py(self.result.dual_edges, out)
+        return out
 
     @property
     def face_size(self):
-        return self.c_finder.privacy_get_graph_face_num()
+        return self.result.face_offsets.size() - 1
     @property
     def dual_size(self):
-        return self.c_finder.privacy_get_dual_edge_num()
+        return self.result.dual_edges.size() // 2
+    @property
+    def face_offsets(self):
+        return _view(self, self.result.face_offsets)
+    @property
+    def face_vertices(self):
+        return _view(self, self.result.face_vertices)
+    @property
+    def dual_edges(self):
+        return _view(self, self.result.dual_edges, 2)
+    @property
+    def edge_faces(self):
+        return _view(self, self.result.edge_faces, 2)
+    @property
+    def vertex_face_offsets(self):
+        return _view(self, self.result.vertex_face_offsets)
+    @property
+    def vertex_faces(self):
+        return _view(self, self.result.vertex_faces)
+
+
+cdef class py_batch_circle_finder:
+    """
+    Faces and dual edges of a batch of graphs, found by a thread pool with the GIL released.
+    Graph i has edges `edge_origin[edge_offsets[i]:edge_offsets[i + 1]]`.
+    Accessors are the same as `py_graph_circle_finder`, taking the graph index.
+    """
+    cdef vector[circle_finder_result] results
+
+    def __cinit__(self, int[:] edge_offsets, int[:,:] edge_origin, int thread_num=0):
+        cdef int batch = edge_offsets.shape[0] - 1
+        if batch <= 0:
+            return
+        with nogil:
+            find_circles_batch(batch, &edge_offsets[0], &edge_origin[0,0], thread_num, &self.results)
+        errors = [(i, self.results[i].error_message.decode("utf-8", "replace"))
+                  for i in range(batch) if self.results[i].error_flag]
+        if errors:
+            message = "; ".join(f"graph {i}: {error or 'unknown error'}" for i, error in errors)
+            if any("bad_alloc" in error for _, error in errors):
+                raise MemoryError(f"Out of memory when finding circles of {message}.")
+            raise RuntimeError(f"Failed to find circles of {message}.")
+
+    def __len__(self):
+        return self.results.size()
+
+    @property
+    def planar_flag(self):
+        return np.array([self.results[i].planar_flag for i in range(self.results.size())], dtype=np.int32)
+
+    def face_size(self, int idx):
+        return self.results[idx].face_offsets.size() - 1
+
+    def get_face_offsets(self, int idx):
+        return _view(self, self.results[idx].face_offsets)
+
+    def get_face_vertices(self, int idx):
+        return _view(self, self.results[idx].face_vertices)
+
+    def get_face_vertex_list(self, int idx):
+        return np.split(self.get_face_vertices(idx), self.get_face_offsets(idx)[1:-1])
+
+    def get_dual_edge_list(self, int idx):
+        return _view(self, self.results[idx].dual_edges, 2)
+
+    def dual_adjacency(self, int idx, dtype=np.float64, sparse=False, out=None):
+        """
+        `py_graph_circle_finder.dual_adjacency` of the idx-th graph.
+        """
+        cdef Py_ssize_t face_num = self.results[idx].face_offsets.size() - 1
+        if sparse:
+            return _csr_adjacency(self.results[idx].dual_edges, face_num, dtype)
+        if out is None:
+            out = np.empty([face_num, face_num], dtype=dtype)
+        _check_out(out, face_num)
+        _fill_adjacency_py(self.results[idx].dual_edges, out)
+        return out
+
+    def dual_adjacency_batch(self, dtype=np.float64, out=None):
+        """
+        Dense adjacency of faces of all graphs with shape [B, F, F], for graphs with the same face number.
+        """
+        cdef Py_ssize_t face_num = self.face_size(0) if self.results.size() else 0
+        if any(self.face_size(i) != face_num for i in range(self.results.size())):
+            raise ValueError("Graphs in batch have different face numbers.")
+        if out is None:
+            out = np.empty([self.results.size(), face_num, face_num], dtype=dtype)
+        if out.shape != (self.results.size(), face_num, face_num):
+            raise ValueError(f"`out` must have shape ({self.results.size()}, {face_num}, {face_num}), got {out.shape}.")
+        for i in range(self.results.size()):
+            _fill_adjacency_py(self.results[i].dual_edges, out[i])
+        return out
+
+    def get_edge_faces(self, int idx):
+        return _view(self, self.results[idx].edge_faces, 2)
+
+    def get_vertex_face_offsets(self, int idx):
+        return _view(self, self.results[idx].vertex_face_offsets)
+
+    def get_vertex_faces(self, int idx):
+        return _view(self, self.results[idx].vertex_faces)
+
+
+def spiral_search(int circle_num, bint ipr=False, prefix=(), int depth=0):
+    """
+    Depth first search of face spirals with `circle_num` circles in C++, with the GIL released.
+    Spirals are wound up as `windup_dual`, and a closed spiral is kept only if it is the canonical one
+    of its isomer (see `isomers.canonical_automorphisms`).
+
+    Parameters
+    ----------
+    circle_num:int
+        Number of circles, `N // 2 + 2` for C`N`.
+    ipr:bool
+        Only spirals obeying the isolated pentagon rule.
+    prefix:
+        Face sizes of the first circles to search from.
+    depth:int
+        If positive, return partial spirals of `depth` circles instead of closed ones.
+
+    Returns
+    -------
+    np.ndarray or None:
+        Face sizes (5 or 6) with shape [M, depth] if `depth` is positive, else canonical closed spirals
+        with shape [M, circle_num], in lexicographic order. None if `prefix` itself can't be wound up.
+    """
+    cdef vector[int] prefix_sizes = [int(s) for s in prefix]
+    cdef vector[signed char] sizes
+    cdef int width = depth if depth > 0 else circle_num
+    cdef int count
+    if circle_num < 12:
+        raise ValueError(f"No fullerene with {circle_num} circles.")
+    if prefix_sizes.size() > <size_t>circle_num or (depth > 0 and prefix_sizes.size() > <size_t>depth):
+        raise ValueError(f"Prefix of {prefix_sizes.size()} circles is too long.")
+    if any(s != 5 and s != 6 for s in prefix_sizes):
+        raise ValueError(f"Face sizes of prefix must be 5 or 6, got {list(prefix_sizes)}.")
+    with nogil:
+        count = search_spirals(circle_num, ipr, prefix_sizes.data(), prefix_sizes.size(), depth, sizes)
+    if count < 0:
+        return None
+    out = np.empty([count, width], dtype=np.int8)
+    cdef signed char[:, :] out_view = out
+    cdef Py_ssize_t i, j
+    for i in range(count):
+        for j in range(width):
+            out_view[i, j] = sizes[i * width + j]
+    return out
@@ -0,0 +1,334 @@
+#ifndef __FACE_SPIRAL_HPP__
+#define __FACE_SPIRAL_HPP__
+
+#include <algorithm>
+#include <vector>
+
+namespace face_spiral
+{
+  // Depth first search of closed face spirals with `circle_num` circles (Fowler & Manolopoulos).
+  // Circles are wound up as in `windup_dual`, pentagon before hexagon, and the windup state is
+  // changed in place and undone on backtracking.
+  //
+  // Open circles `boundary[start:]` bound the wound up patch. The rest of the sphere is a
+  // triangulated disc of the remaining `r` circles, whose `e = 3r + m - 3 - B` inner edges
+  // (`m` open circles with `B` free edges in total) must satisfy `r - 1 <= e <= max(3r - 6, r - 1)`,
+  // otherwise the branch is cut before it fails in the last circles. A closed spiral is only kept
+  // if it is the canonical one of its isomer, see `canonical`.
+  class spiral_search
+  {
+  public:
+    spiral_search(const int arg_circle_num, const bool arg_ipr) : circle_num(arg_circle_num),
+                                                                  ipr(arg_ipr),
+                                                                  size(arg_circle_num, 0),
+                                                                  free(arg_circle_num, 0),
+                                                                  touched(arg_circle_num),
+                                                                  popped(arg_circle_num),
+                                                                  at_start(arg_circle_num),
+                                                                  saved_start(arg_circle_num, 0),
+                                                                  start(0),
+                                                                  pentagons(0),
+                                                                  free_sum(0),
+                                                                  arc(arg_circle_num * 3 * MAX_DEGREE),
+                                                                  head(arg_circle_num),
+                                                                  tail(arg_circle_num),
+                                                                  degree(arg_circle_num),
+                                                                  rotation(arg_circle_num * MAX_DEGREE),
+                                                                  order(arg_circle_num),
+                                                                  unused(arg_circle_num),
+                                                                  used(arg_circle_num, 0),
+                                                                  seen(arg_circle_num, 0),
+                                                                  stamp(0)
+    {
+      boundary.reserve(arg_circle_num);
+    }
+
+    // Wind up circle `k` of size `s`. Return false if the spiral fails here (state is restored).
+    bool add(const int k, const int s)
+    {
+      size[k] = s;
+      free[k] = s;
+      touched[k].clear();
+      at_start[k].clear();
+      popped[k].clear();
+      saved_start[k] = start;
+      if (k == 0)
+      {
+        boundary.push_back(0);
+        pentagons += s == 5;
+        free_sum += s;
+        return true;
+      }
+      const bool check_ipr = ipr && s == 5;
+      std::vector<int> &touch = touched[k];
+      std::vector<char> &side = at_start[k];
+      int j = boundary.back();
+      touch.push_back(j);
+      side.push_back(0);
+      free[j]--;
+      bool failed = check_ipr && size[j] == 5;
+      if (k > 1)
+      {
+        j = boundary[start];
+        touch.push_back(j);
+        side.push_back(1);
+        free[j]--;
+        failed = failed || (check_ipr && size[j] == 5);
+        while (!failed && (int)boundary.size() - start > 2)
+        {
+          if (free[boundary[start]] == 0)
+          {
+            start++;
+            j = boundary[start];
+            side.push_back(1);
+          }
+          else if (free[boundary.back()] == 0)
+          {
+            popped[k].push_back(boundary.back());
+            boundary.pop_back();
+            j = boundary.back();
+            side.push_back(0);
+          }
+          else
+            break;
+          touch.push_back(j);
+          free[j]--;
+          failed = check_ipr && size[j] == 5;
+        }
+      }
+      free[k] -= touch.size();
+      if (!failed)
+        failed = free[boundary[start]] < 0 || free[boundary.back()] < 0 || free[k] < 0;
+      const int remain = circle_num - k - 1;
+      const int new_free_sum = free_sum + s - 2 * (int)touch.size();
+      if (!failed)
+      {
+        if (remain == 0)
+          failed = new_free_sum != 0;
+        else
+        {
+          const int inner = 3 * remain + (int)boundary.size() - start - 2 - new_free_sum;
+          failed = free[k] == 0 || inner < remain - 1 || inner > std::max(3 * remain - 6, remain - 1);
+        }
+      }
+      if (failed)
+      {
+        restore(k);
+        return false;
+      }
+      boundary.push_back(k);
+      pentagons += s == 5;
+      free_sum = new_free_sum;
+      return true;
+    }
+
+    void undo(const int k)
+    {
+      boundary.pop_back();
+      pentagons -= size[k] == 5;
+      free_sum -= size[k] - 2 * (int)touched[k].size();
+      restore(k);
+    }
+
+    // Face sizes of all spirals wound up from circle `k` on, appended to `sizes`: partial spirals
+    // of `depth` circles if `depth` is positive, else closed spirals which are canonical.
+    void search(const int k, const int depth, std::vector<signed char> &sizes)
+    {
+      if (k == (depth > 0 ? depth : circle_num))
+      {
+        if (depth > 0 || canonical())
+          sizes.insert(sizes.end(), size.begin(), size.begin() + k);
+        return;
+      }
+      for (int s = 5; s <= 6; s++)
+      {
+        if ((s == 5 && pentagons == 12) || (s == 6 && pentagons + circle_num - k - 1 < 12))
+          continue;
+        if (!add(k, s))
+          continue;
+        search(k + 1, depth, sizes);
+        undo(k);
+      }
+    }
+
+  private:
+    void restore(const int k)
+    {
+      const std::vector<int> &touch = touched[k];
+      for (size_t i = 0; i < touch.size(); i++)
+        free[touch[i]]++;
+      boundary.insert(boundary.end(), popped[k].rbegin(), popped[k].rend());
+      start = saved_start[k];
+    }
+
+    // Rotation system of the wound up circle graph: neighbors of each circle in cyclic order, all in the
+    // same orientation. It's replayed from the windup: going along the open circles, a new circle follows
+    // the last neighbor of the oldest open circle it touches and precedes the first neighbor of the others,
+    // and its own neighbors are those touched at the start in reverse, then those at the end.
+    // Return false if it's not a triangulation.
+    bool fill_rotation()
+    {
+      const int n = circle_num;
+      const int width = 3 * MAX_DEGREE;
+      for (int f = 0; f < n; f++)
+        head[f] = tail[f] = f * width + MAX_DEGREE;
+      for (int k = 1; k < n; k++)
+      {
+        const std::vector<int> &touch = touched[k];
+        const std::vector<char> &side = at_start[k];
+        const int t = touch.size();
+        if (t > MAX_DEGREE)
+          return false;
+        for (int i = 0; i < t; i++)
+        {
+          const int j = touch[i];
+          if (tail[j] - head[j] == MAX_DEGREE || std::find(touch.begin(), touch.begin() + i, j) != touch.begin() + i)
+            return false;
+          if (side[i])
+            arc[tail[j]++] = k;
+          else
+            arc[--head[j]] = k;
+        }
+        for (int i = t - 1; i >= 0; i--)
+          if (side[i])
+            arc[tail[k]++] = touch[i];
+        for (int i = 0; i < t; i++)
+          if (!side[i])
+            arc[tail[k]++] = touch[i];
+      }
+      for (int f = 0; f < n; f++)
+      {
+        degree[f] = tail[f] - head[f];
+        if (degree[f] != size[f])
+          return false;
+        std::copy(arc.begin() + head[f], arc.begin() + tail[f], rotation.begin() + f * MAX_DEGREE);
+      }
+      return true;
+    }
+
+    // Index of `g` in the rotation of `f`, -1 if it isn't a neighbor.
+    int position(const int f, const int g) const
+    {
+      const int *cycle = &rotation[f * MAX_DEGREE];
+      for (int idx = 0; idx < degree[f]; idx++)
+        if (cycle[idx] == g)
+          return idx;
+      return -1;
+    }
+
+    // Unroll the spiral starting from circles `first`, `second` in direction `step` (1 or -1) around each circle,
+    // comparing its face sizes with the wound up one, as `_unroll`. Return -1 if smaller, 1 if larger or not a spiral,
+    // 0 if equal. A smaller start only counts if the spiral closes, so it is unrolled to the end.
+    // Circles are marked with `stamp` instead of clearing the buffers for each start.
+    int unroll(const int first, const int second, const int step)
+    {
+      const int n = circle_num;
+      if (++stamp == 0)
+      {
+        std::fill(used.begin(), used.end(), 0);
+        std::fill(seen.begin(), seen.end(), 0);
+        stamp = 1;
+      }
+      int open_idx = 0;
+      int c = first, last = -1;
+      bool smaller = false;
+      for (int i = 0; i < n; i++)
+      {
+        if (i == 1)
+          c = second;
+        else if (i > 1)
+        {
+          while (open_idx < i && unused[order[open_idx]] == 0)
+            open_idx++;
+          if (open_idx == i)
+            return 1;
+          const int f = order[open_idx];
+          const int pos = position(f, last);
+          if (pos < 0)
+            return 1;
+          c = rotation[f * MAX_DEGREE + (pos + step + degree[f]) % degree[f]];
+          if (used[c] == stamp)
+            return 1;
+        }
+        if (!smaller && size[c] != size[i])
+        {
+          if (size[c] > size[i])
+            return 1;
+          smaller = true;
+        }
+        used[c] = stamp;
+        order[i] = c;
+        const int *cycle = &rotation[c * MAX_DEGREE];
+        for (int idx = 0; idx < degree[c]; idx++)
+        {
+          const int g = cycle[idx];
+          if (seen[g] != stamp)
+          {
+            seen[g] = stamp;
+            unused[g] = degree[g];
+          }
+          unused[g]--;
+        }
+        if (seen[c] != stamp)
+        {
+          seen[c] = stamp;
+          unused[c] = degree[c];
+        }
+        last = c;
+      }
+      return smaller ? -1 : 0;
+    }
+
+    // No spiral from any other start or direction is lexicographically smaller than the wound up one,
+    // as `canonical_automorphisms`.
+    bool canonical()
+    {
+      if (!fill_rotation())
+        return false;
+      for (int first = 0; first < circle_num; first++)
+      {
+        if (size[first] > size[0])
+          continue;
+        for (int idx = 0; idx < degree[first]; idx++)
+          for (int step = 1; step >= -1; step -= 2)
+            if (unroll(first, rotation[first * MAX_DEGREE + idx], step) < 0)
+              return false;
+      }
+      return true;
+    }
+
+    static const int MAX_DEGREE = 6;
+    const int circle_num;
+    const bool ipr;
+    std::vector<int> size, free, boundary;
+    std::vector<std::vector<int>> touched, popped; // Undo records of each circle.
+    std::vector<std::vector<char>> at_start; // If each circle of `touched` was the oldest open one.
+    std::vector<int> saved_start;
+    int start, pentagons, free_sum;
+    // Buffers of the canonical check, rotation of circle f is `rotation[f * MAX_DEGREE:]`.
+    std::vector<int> arc, head, tail, degree, rotation, order, unused;
+    std::vector<unsigned int> used, seen;
+    unsigned int stamp;
+  };
+
+  // Face sizes (5 or 6) of the spirals with `circle_num` circles searched from the `prefix_len` circles in `prefix`,
+  // appended to `sizes`: partial spirals of `depth` circles if `depth` is positive, else closed spirals which are
+  // canonical. Return the number of spirals, or -1 if `prefix` itself can't be wound up.
+  inline int search_spirals(const int circle_num,
+                            const int ipr,
+                            const int *prefix,
+                            const int prefix_len,
+                            const int depth,
+                            std::vector<signed char> &sizes)
+  {
+    sizes.clear();
+    spiral_search searcher(circle_num, ipr != 0);
+    for (int k = 0; k < prefix_len; k++)
+      if (!searcher.add(k, prefix[k]))
+        return -1;
+    searcher.search(prefix_len, depth, sizes);
+    return sizes.size() / (depth > 0 ? depth : circle_num);
+  }
+}
+
+#endif
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : fingerprint.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+
+"""
+Spectral fingerprint index of isomers.
+
+Sorted eigenvalues of circle adjacency don't depend on how circles are numbered,
+so they identify an isomer up to (rare) cospectral mates. An index directory holds::
+
+    lambda_max.npy  largest eigenvalue of each isomer, sorted ascending
+    spectra.npy     sorted eigenvalues with shape [M, F], rows in the order of lambda_max
+    spiral_num.npy  spiral numbers, rows in the order of lambda_max
+
+The arrays are memory-mapped when the index is opened. A query binary searches the
+`lambda_max` window within tolerance and compares whole spectra only inside the window.
+"""
+
+import os
+from typing import List
+
+import numpy as np
+from tqdm import tqdm
+
+from fullerenedataparser.graph.adjacency import CSRAdjacency
+from fullerenedataparser.util.logger import Logger
+
+logger = Logger(__name__, console_on=True)
+
+
+def fingerprint_index_path(path) -> str:
+    """
+    Path of the fingerprint index directory stored next to spiral file or database `path`.
+    """
+    return str(path) + ".fp"
+
+
+def _circle_batches(source, batch_size: int):
+    from fullerenedataparser.data.db.spiraldb import MAGIC, SpiralDatabase
+    from fullerenedataparser.data.spiral import SpiralFile
+    with open(source, "rb") as f:
+        is_db = f.read(len(MAGIC)) == MAGIC
+    if not is_db:
+        for batch in SpiralFile(source, circle=True).iter_batches(batch_size):
+            yield batch["spiral_num"], batch["adj_matrix"]
+        return
+    db = SpiralDatabase(source)
+    for start in range(0, len(db), batch_size):
+        records = db[start:start + batch_size]
+        neighbors = records["circle_neighbors"]
+        adj = np.zeros([neighbors.shape[0], db.circle_num, db.circle_num + 1], dtype=np.float64)
+        # Padding (-1) of pentagons goes to the extra last column.
+        adj[np.arange(neighbors.shape[0])[:, None, None], np.arange(db.circle_num)[None, :, None], neighbors] = 1
+        yield records["spiral_num"].astype(np.int64), adj[:, :, :-1]
+
+
+def build_fingerprint_index(source, target=None, batch_size: int = 1000) -> str:
+    """
+    Build the fingerprint index of all isomers in `source`.
+
+    Parameters
+    ----------
+    source
+        Binary spiral database, or spiral file of circle adjacency.
+    target
+        Index directory. Default to `fingerprint_index_path(source)`.
+    batch_size:int
+        Number of isomers diagonalized at once.
+
+    Returns
+    -------
+    str:
+        Index directory.
+    """
+    target = target or fingerprint_index_path(source)
+    os.makedirs(target, exist_ok=True)
+    spiral_num = []
+    spectra = []
+    pbar = tqdm()
+    pbar.set_description(f"{target}")
+    for batch_spiral_num, adj in _circle_batches(source, batch_size):
+        spiral_num.append(batch_spiral_num)
+        spectra.append(np.linalg.eigvalsh(np.asarray(adj, dtype=np.float64)))
+        pbar.update(len(batch_spiral_num))
+    pbar.close()
+    spiral_num = np.concatenate(spiral_num)
+    spectra = np.concatenate(spectra)
+    order = np.argsort(spectra[:, -1], kind="stable")
+    np.save(os.path.join(target, "lambda_max.npy"), spectra[order, -1])
+    np.save(os.path.join(target, "spectra.npy"), spectra[order])
+    np.save(os.path.join(target, "spiral_num.npy"), spiral_num[order])
+    logger.info(f"Fingerprint index of {spiral_num.shape[0]} isomers has been stored in {target}.")
+    return target
+
+
+class FingerprintIndex:
+    """
+    Memory-mapped fingerprint index, see `build_fingerprint_index`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lambda_max = np.load(os.path.join(path, "lambda_max.npy"), mmap_mode="r")
+        self.spectra = np.load(os.path.join(path, "spectra.npy"), mmap_mode="r")
+        self.spiral_num = np.load(os.path.join(path, "spiral_num.npy"), mmap_mode="r")
+
+    @classmethod
+    def open(cls, source, batch_size: int = 1000) -> "FingerprintIndex":
+        """
+        Open the index next to `source`, building it first if it doesn't exist.
+        """
+        path = fingerprint_index_path(source)
+        if not os.path.exists(os.path.join(path, "spiral_num.npy")):
+            build_fingerprint_index(source, path, batch_size=batch_size)
+        return cls(path)
+
+    def __len__(self):
+        return self.spiral_num.shape[0]
+
+    def query(self, circleadj, atol: float = 1e-6) -> List[int]:
+        """
+        Spiral numbers of isomers with the spectrum of `circleadj`.
+
+        Parameters
+        ----------
+        circleadj:np.ndarray or CSRAdjacency
+            Adjacency of circles, numbered in any order.
+        atol:float
+            Absolute tolerance of eigenvalues.
+
+        Returns
+        -------
+        List[int]:
+            Matching spiral numbers, more than one only for cospectral isomers.
+        """
+        if isinstance(circleadj, CSRAdjacency):
+            circleadj = circleadj.todense()
+        spectrum = np.linalg.eigvalsh(np.asarray(circleadj, dtype=np.float64))
+        if spectrum.shape[0] != self.spectra.shape[1]:
+            raise ValueError(f"Index of {self.spectra.shape[1]} circles can't identify {spectrum.shape[0]} circles.")
+        start = np.searchsorted(self.lambda_max, spectrum[-1] - atol, side="left")
+        stop = np.searchsorted(self.lambda_max, spectrum[-1] + atol, side="right")
+        window = np.abs(self.spectra[start:stop] - spectrum).max(-1) <= atol
+        return sorted(int(i) for i in self.spiral_num[start:stop][window])
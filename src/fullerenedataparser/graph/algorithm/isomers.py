@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : isomers.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+
+"""
+Enumeration of fullerene isomers by face spirals (Fowler & Manolopoulos).
+
+Face size sequences are searched depth first, pentagon before hexagon, while the spiral is
+wound up circle by circle (see `graph.algorithm.windup`), so a branch is cut as soon as its
+partial spiral can't be wound up. Every closed spiral is kept only if it is the canonical one of
+its isomer, i.e. no spiral from any other start is lexicographically smaller. Both run in C++
+(`dual.spiral_search`, see face_spiral.hpp), only the symmetry of canonical spirals is analysed here.
+Isomers come out in lexicographic order of canonical pentagon indices, which is the spiral number
+order of spiral output files.
+
+Searching is split across processes by the face sizes of the first circles (spiral prefix).
+"""
+
+from math import gcd
+from multiprocessing import Pool
+from typing import Generator, List, Optional, Tuple
+
+import numpy as np
+
+from fullerenedataparser.graph.adjacency import CSRAdjacency, dense_to_neighbors
+from fullerenedataparser.graph.algorithm.windup import dual_to_atom_adj, windup_dual
+from fullerenedataparser.util.logger import Logger
+
+logger = Logger(__name__, console_on=True)
+
+
+def spiral_rotation(circleadj: np.ndarray) -> List[list]:
+    """
+    Rotation system of circle graph: neighbors of each circle in cyclic order,
+    all in the same orientation.
+
+    Parameters
+    ----------
+    circleadj:np.ndarray
+        Adjacency of circles with shape [F, F].
+
+    Returns
+    -------
+    List[list]:
+        Neighbors of each circle, consecutive ones share an atom.
+    """
+    rows, cols = np.nonzero(circleadj)
+    neighbors = [set() for _ in range(circleadj.shape[0])]
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        neighbors[i].add(j)
+    rotation = []
+    for nbrs in neighbors:
+        current = min(nbrs)
+        cycle = [current]
+        while len(cycle) < len(nbrs):
+            following = (neighbors[current] & nbrs).difference(cycle)
+            current = min(following)
+            cycle.append(current)
+        rotation.append(cycle)
+    # Propagate the orientation of circle 0: if h follows g around f, f follows h around g.
+    oriented = [False] * len(rotation)
+    oriented[0] = True
+    queue = [0]
+    while queue:
+        f = queue.pop()
+        cycle = rotation[f]
+        for idx, g in enumerate(cycle):
+            if oriented[g]:
+                continue
+            h = cycle[(idx + 1) % len(cycle)]
+            g_cycle = rotation[g]
+            if g_cycle[(g_cycle.index(h) + 1) % len(g_cycle)] != f:
+                g_cycle.reverse()
+            oriented[g] = True
+            queue.append(g)
+    return rotation
+
+
+def _next_tables(rotation: List[list]) -> Tuple[list, list]:
+    circle_num = len(rotation)
+    tables = []
+    for step in (1, -1):
+        table = [[-1] * circle_num for _ in range(circle_num)]
+        for f, cycle in enumerate(rotation):
+            for idx, g in enumerate(cycle):
+                table[f][g] = cycle[(idx + step) % len(cycle)]
+        tables.append(table)
+    return tables[0], tables[1]
+
+
+def _unroll(first: int, second: int, table: list, rotation: List[list], size: list, target: list):
+    """
+    Unroll the spiral starting from circles `first`, `second`, comparing its face sizes with `target`.
+
+    Returns
+    -------
+    (-1, order) if smaller than `target`, (1, None) if larger or not a spiral, (0, order) if equal.
+    A smaller start only counts if the spiral closes, so it is unrolled to the end.
+    """
+    circle_num = len(size)
+    used = [False] * circle_num
+    unused = [len(cycle) for cycle in rotation]
+    order = []
+    open_idx = 0
+    c = first
+    last = None
+    smaller = False
+    for i in range(circle_num):
+        if i == 1:
+            c = second
+        elif i > 1:
+            while unused[order[open_idx]] == 0:
+                open_idx += 1
+            c = table[order[open_idx]][last]
+            if c < 0 or used[c]:
+                return 1, None
+        if not smaller and size[c] != target[i]:
+            if size[c] > target[i]:
+                return 1, None
+            smaller = True
+        used[c] = True
+        order.append(c)
+        for g in rotation[c]:
+            unused[g] -= 1
+        last = c
+    if smaller:
+        return -1, order
+    return 0, order
+
+
+def canonical_spiral(circleadj: np.ndarray) -> Tuple[list, list]:
+    """
+    Lexicographically smallest face spiral of a fullerene, trying all starts and both directions.
+    Circles of `circleadj` may be numbered in any order.
+
+    Parameters
+    ----------
+    circleadj:np.ndarray
+        Adjacency of circles with shape [F, F].
+
+    Returns
+    -------
+    Tuple[list, list]:
+        Canonical pentagon indices (counted from 1), and circles of `circleadj` in canonical spiral order.
+
+    Raises
+    ------
+    ValueError:
+        If no spiral of the fullerene closes.
+    """
+    rotation = spiral_rotation(circleadj)
+    tables = _next_tables(rotation)
+    size = [len(cycle) for cycle in rotation]
+    best = [7] * len(size)
+    best_order = None
+    for first in range(len(size)):
+        for second in rotation[first]:
+            for table in tables:
+                result, order = _unroll(first, second, table, rotation, size, best)
+                if result < 0:
+                    best = [size[c] for c in order]
+                    best_order = order
+    if best_order is None:
+        raise ValueError("No closed spiral found.")
+    return [idx + 1 for idx, s in enumerate(best) if s == 5], best_order
+
+
+def canonical_automorphisms(circleadj: np.ndarray) -> Optional[List[Tuple[list, bool]]]:
+    """
+    Check that circles of `circleadj` are numbered along the canonical spiral.
+
+    Parameters
+    ----------
+    circleadj:np.ndarray
+        Adjacency of circles with shape [F, F], circles in order of a spiral.
+
+    Returns
+    -------
+    List[Tuple[list, bool]] or None:
+        None if a spiral from another start is lexicographically smaller. Otherwise the automorphisms of
+        the circle graph, as circle permutations with a flag for orientation preserving (proper rotations).
+    """
+    rotation = spiral_rotation(circleadj)
+    tables = _next_tables(rotation)
+    size = [len(cycle) for cycle in rotation]
+    # Orientation of the spiral itself.
+    reference = 0 if tables[0][0][1] == 2 else 1
+    automorphisms = []
+    for first in range(len(size)):
+        if size[first] > size[0]:
+            continue
+        for second in rotation[first]:
+            for idx, table in enumerate(tables):
+                result, order = _unroll(first, second, table, rotation, size, size)
+                if result < 0:
+                    return None
+                if result == 0:
+                    automorphisms.append((order, idx == reference))
+    return automorphisms
+
+
+def _permutation_order(permutation: list) -> int:
+    order = 1
+    seen = [False] * len(permutation)
+    for i in range(len(permutation)):
+        length = 0
+        j = i
+        while not seen[j]:
+            seen[j] = True
+            j = permutation[j]
+            length += 1
+        if length:
+            order = order * length // gcd(order, length)
+    return order
+
+
+def point_group(automorphisms: List[Tuple[list, bool]], circleadj: np.ndarray, triangles: np.ndarray) -> str:
+    """
+    Point group of the most symmetric embedding of a fullerene from its automorphism group.
+
+    Proper rotations are the orientation preserving automorphisms. The only improper element
+    which fixes no circle, bond or atom is the inversion, other improper elements of order 2 are mirrors.
+
+    Parameters
+    ----------
+    automorphisms:
+        See `canonical_automorphisms`.
+    circleadj:np.ndarray
+        Adjacency of circles.
+    triangles:np.ndarray
+        Circles of each atom, see `dual_to_atom_adj`.
+
+    Returns
+    -------
+    str:
+        Schoenflies symbol like "Ih".
+    """
+    edges = np.argwhere(np.triu(circleadj))
+    proper_orders = [_permutation_order(perm) for perm, proper in automorphisms if proper]
+    improper = [(perm, _permutation_order(perm)) for perm, proper in automorphisms if not proper]
+    n_proper = len(proper_orders)
+    max_order = max(proper_orders)
+    if n_proper == 1:
+        rotation = ("C", 1)
+    elif max_order == n_proper:
+        rotation = ("C", n_proper)
+    elif n_proper == 12 and max_order == 3:
+        rotation = ("T", 0)
+    elif n_proper == 60:
+        rotation = ("I", 0)
+    else:
+        rotation = ("D", n_proper // 2)
+    kind, n = rotation
+    name = "C1" if kind == "C" and n == 1 else f"{kind}{n or ''}"
+    if not improper:
+        return name
+
+    def fixes_something(perm):
+        perm = np.asarray(perm)
+        if (perm == np.arange(perm.shape[0])).any():
+            return True
+        if (np.sort(perm[edges], axis=-1) == edges).all(-1).any():
+            return True
+        return bool((np.sort(perm[triangles], axis=-1) == triangles).all(-1).any())
+
+    inversion = any(order == 2 and not fixes_something(perm) for perm, order in improper)
+    mirrors_only = all(order == 2 for perm, order in improper) and not inversion
+    if kind == "C" and n == 1:
+        return "Cs" if mirrors_only else "Ci"
+    if kind == "C":
+        if mirrors_only:
+            return f"C{n}v"
+        if inversion == (n % 2 == 0):
+            return f"C{n}h"
+        return f"S{2 * n}"
+    if kind == "D":
+        return f"D{n}h" if inversion == (n % 2 == 0) else f"D{n}d"
+    if kind == "T":
+        return "Th" if inversion else "Td"
+    return "Ih"
+
+
+def nmr_pattern(automorphisms: List[Tuple[list, bool]], triangles: np.ndarray) -> str:
+    """
+    Pattern of atom orbits under the automorphism group, like "2x241x12" for two orbits of 24 atoms
+    and one of 12, written the way spiral output headers are read by `SpiralFile`.
+    """
+    index = {tuple(triangle): idx for idx, triangle in enumerate(triangles.tolist())}
+    orbit = list(range(triangles.shape[0]))
+
+    def find(i):
+        while orbit[i] != i:
+            orbit[i] = orbit[orbit[i]]
+            i = orbit[i]
+        return i
+
+    for perm, _ in automorphisms:
+        images = np.sort(np.asarray(perm)[triangles], axis=-1).tolist()
+        for idx, image in enumerate(images):
+            a, b = find(idx), find(index[tuple(image)])
+            if a != b:
+                orbit[max(a, b)] = min(a, b)
+    sizes = np.bincount([find(i) for i in range(len(orbit))])
+    sizes = sizes[sizes > 0]
+    counts = np.bincount(sizes)
+    return "".join(f"{counts[s]}x{s}" for s in sorted(np.unique(sizes), reverse=True))
+
+
+def _isomer_item(pentagon_index: list, atom_num: int) -> Optional[dict]:
+    circleadj = windup_dual(pentagon_index, atom_num)
+    automorphisms = canonical_automorphisms(circleadj)
+    if automorphisms is None:
+        return None
+    atomadj, triangles = dual_to_atom_adj(circleadj)
+    return {
+        "atomadj": dense_to_neighbors(atomadj),
+        "symmetry": point_group(automorphisms, circleadj, triangles),
+        "pentagon_index": pentagon_index,
+        "circleadj": CSRAdjacency.from_dense(circleadj),
+        "NMR": nmr_pattern(automorphisms, triangles)
+    }
+
+
+def _search_prefix(args) -> list:
+    from fullerenedataparser.graph.algorithm import dual
+    atom_num, ipr, prefix = args
+    spirals = dual.spiral_search(atom_num // 2 + 2, ipr, prefix)
+    items = []
+    if spirals is None:
+        return items
+    for sizes in spirals:
+        item = _isomer_item((np.nonzero(sizes == 5)[0] + 1).tolist(), atom_num)
+        if item is not None:
+            items.append(item)
+    return items
+
+
+def spiral_prefixes(atom_num: int, ipr: bool = False, count: int = 1) -> List[tuple]:
+    """
+    Face sizes of the first circles splitting the spiral search into at least `count` parts (if possible),
+    in lexicographic order.
+    """
+    from fullerenedataparser.graph.algorithm import dual
+    circle_num = atom_num // 2 + 2
+    prefixes = [()]
+    for depth in range(1, circle_num + 1):
+        if len(prefixes) >= count:
+            break
+        prefixes = [tuple(sizes) for sizes in dual.spiral_search(circle_num, ipr, depth=depth).tolist()]
+    return prefixes
+
+
+def enumerate_isomers(atom_num: int, ipr: bool = False, workers: int = 1) -> Generator[dict, None, None]:
+    """
+    !! Multiprocess
+    Enumerate all isomers of C`atom_num` in spiral number order.
+
+    Parameters
+    ----------
+    atom_num:int
+        Number of atoms, even and at least 20.
+    ipr:bool
+        Only isomers obeying the isolated pentagon rule.
+    workers:int
+        Number of worker processes.
+
+    Returns
+    -------
+    Generator[dict]:
+        Items like `adj_gener(..., compact=True)`. Circles are in spiral order,
+        atoms are numbered as triangles of the circle graph (see `dual_to_atom_adj`).
+    """
+    if atom_num < 20 or atom_num % 2 or atom_num == 22:
+        raise ValueError(f"No fullerene with {atom_num} atoms.")
+    prefixes = spiral_prefixes(atom_num, ipr, count=1 if workers <= 1 else 16 * workers)
+    tasks = [(atom_num, ipr, prefix) for prefix in prefixes]
+    logger.debug(f"Split isomer search of C{atom_num} into {len(tasks)} prefixes.")
+    spiral_num = 0
+    if workers <= 1:
+        results = map(_search_prefix, tasks)
+        for items in results:
+            for item in items:
+                spiral_num += 1
+                yield {"spiral_num": spiral_num, **item}
+        return
+    with Pool(workers) as po:
+        for items in po.imap(_search_prefix, tasks):
+            for item in items:
+                spiral_num += 1
+                yield {"spiral_num": spiral_num, **item}
@@ -5,15 +5,290 @@
 # @File    : matrix2spiral.py
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
+import os
 import pathlib
+from multiprocessing import Pool
+from typing import Dict, Generator, Iterable, Optional, Tuple
 
-import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 from ase.io.gaussian import read_gaussian_in
 from tqdm import tqdm
 
+from fullerenedataparser.graph.algorithm.isomers import canonical_spiral
+from fullerenedataparser.io.compress import open_file, strip_compression_suffix
+from fullerenedataparser.io.g16log import read_g16log_atoms
+from fullerenedataparser.io.recursion import recursion_files
+from fullerenedataparser.io.table import check_table_target, write_table
+from fullerenedataparser.io.xyz import simple_read_xyz_xtb
+from fullerenedataparser.data.db.spiraldb import MAGIC, SpiralDatabase
+from fullerenedataparser.data.spiral import SpiralFile
 from fullerenedataparser.molecular.fullerene import FullereneCage
-from src.fullerenedataparser.io.xyz import simple_read_xyz_xtb
+from fullerenedataparser.util.logger import Logger
+
+logger = Logger(__name__, console_on=True)
+
+CAGE_SUFFIXES = (".xyz", ".gjf", ".log")
+
+
+def _spiral_keys(pentagon_index) -> np.ndarray:
+    # Big endian bytes compare in the same order as the indices, so rows can be binary searched.
+    pentagon_index = np.ascontiguousarray(np.asarray(pentagon_index).reshape(-1, 12), dtype=">u2")
+    return pentagon_index.view("S24").ravel()
+
+
+class SpiralLookup:
+    """
+    Spiral numbers of canonical pentagon indices.
+
+    Isomers of spiral output files and spiral databases are in lexicographic order of
+    canonical pentagon indices, so a lookup is a binary search.
+    """
+
+    def __init__(self, pentagon_index, spiral_num=None):
+        """
+
+        Parameters
+        ----------
+        pentagon_index:
+            Canonical pentagon indices with shape [M, 12], in spiral number order.
+        spiral_num:
+            Spiral numbers with shape [M]. Default to 1, 2, ..., M.
+        """
+        self.keys = _spiral_keys(pentagon_index)
+        self.spiral_num = np.arange(1, self.keys.shape[0] + 1) if spiral_num is None else np.asarray(spiral_num)
+        if (self.keys[1:] <= self.keys[:-1]).any():
+            raise ValueError("Pentagon indices are not in spiral number order.")
+
+    @classmethod
+    def from_spiral_file(cls, path) -> "SpiralLookup":
+        headers = SpiralFile(path).iter_headers()
+        return cls(headers["pentagon_index"], headers["spiral_num"])
+
+    @classmethod
+    def from_spiral_db(cls, path) -> "SpiralLookup":
+        db = SpiralDatabase(path)
+        return cls(db.pentagon_index, db.spiral_num)
+
+    def __len__(self):
+        return self.keys.shape[0]
+
+    def lookup(self, pentagon_index) -> int:
+        """
+        Spiral number of canonical `pentagon_index`.
+
+        Raises
+        ------
+        KeyError:
+            If `pentagon_index` is not in the reference.
+        """
+        key = _spiral_keys(pentagon_index)[0]
+        position = int(np.searchsorted(self.keys, key))
+        if position == len(self) or self.keys[position] != key:
+            raise KeyError(f"Pentagon indices {list(pentagon_index)} not found.")
+        return int(self.spiral_num[position])
+
+
+def load_lookups(paths: Iterable) -> Dict[int, SpiralLookup]:
+    """
+    References keyed by atom number, from spiral databases or atom spiral files.
+    """
+    lookups = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            is_db = f.read(len(MAGIC)) == MAGIC
+        if is_db:
+            atom_num = SpiralDatabase(path).atom_num
+            lookups[atom_num] = SpiralLookup.from_spiral_db(path)
+        else:
+            atom_num = SpiralFile(path).atom_num
+            lookups[atom_num] = SpiralLookup.from_spiral_file(path)
+        logger.info(f"Load {len(lookups[atom_num])} isomers of C{atom_num} from {path}.")
+    return lookups
+
+
+def read_cage(path) -> FullereneCage:
+    """
+    Read the last structure of a .xyz, .gjf or Gaussian .log file as a `FullereneCage`.
+    Compressed files are read transparently.
+    """
+    path = pathlib.Path(path)
+    suffix = os.path.splitext(strip_compression_suffix(path.name))[-1]
+    if suffix == ".gjf":
+        with open_file(path, "r") as f:
+            atoms = read_gaussian_in(f)
+    elif suffix == ".xyz":
+        atoms = list(simple_read_xyz_xtb(path.as_posix(), read_comment=False))[-1]
+    elif suffix == ".log":
+        atoms = read_g16log_atoms(path.as_posix())
+        if not atoms:
+            raise ValueError(f"No structure in {path}.")
+        atoms = atoms[-1]
+    else:
+        raise ValueError(f"Unrecognizable extension name {suffix}.")
+    return FullereneCage(spiral=None, nospiralflag=True, atoms=atoms)
+
+
+def matrix2spiral(cage: FullereneCage, lookup: Optional[SpiralLookup] = None) -> Tuple[list, Optional[int]]:
+    """
+    Identify a cage by its canonical spiral, computed from its geometry in O(N^2).
+
+    Parameters
+    ----------
+    cage:FullereneCage
+    lookup:SpiralLookup
+        Reference of C`N` isomers to get spiral number from.
+
+    Returns
+    -------
+    Tuple[list, Optional[int]]:
+        Canonical pentagon indices, and spiral number (None without `lookup`).
+    """
+    pentagon_index, _ = canonical_spiral(cage.circleADJ)
+    spiral_num = lookup.lookup(pentagon_index) if lookup is not None else None
+    return pentagon_index, spiral_num
+
+
+def cage_files(rootpath) -> Generator[pathlib.Path, None, None]:
+    """
+    Structure files in `rootpath` readable by `read_cage`.
+    """
+    for path in recursion_files(rootpath, format=""):
+        if os.path.splitext(strip_compression_suffix(path.name))[-1] in CAGE_SUFFIXES:
+            yield path
+
+
+def matrix2spiral_dir(rootpath, lookups: Optional[Dict[int, SpiralLookup]] = None) -> Generator[dict, None, None]:
+    """
+    `matrix2spiral` for all .xyz, .gjf and Gaussian .log files in `rootpath`.
+
+    Parameters
+    ----------
+    rootpath
+    lookups:Dict[int, SpiralLookup]
+        References keyed by atom number.
+
+    Returns
+    -------
+    Generator[dict]:
+        {
+            "path": path,
+            "natoms": natoms,
+            "pentagon_index": pentagon_index,
+            "spiral_num": spiral_num  # None if no reference of C`natoms`
+        }
+    """
+    lookups = lookups or {}
+    for path in cage_files(rootpath):
+        cage = read_cage(path)
+        pentagon_index, spiral_num = matrix2spiral(cage, lookups.get(cage.natoms))
+        yield {
+            "path": str(path),
+            "natoms": cage.natoms,
+            "pentagon_index": pentagon_index,
+            "spiral_num": spiral_num
+        }
+
+
+_LOOKUPS: Dict[int, SpiralLookup] = {}
+
+
+def _init_identify(lookups):
+    global _LOOKUPS
+    _LOOKUPS = lookups
+
+
+def _identify_file(path) -> dict:
+    result = {"path": str(path), "natoms": None, "pentagon_index": None, "spiral_num": None, "error": None}
+    try:
+        cage = read_cage(path)
+        result["natoms"] = cage.natoms
+        degree = cage.atomADJ.sum(-1)
+        if cage.natoms < 20 or cage.natoms % 2 or (degree != 3).any():
+            # The dual graph is only defined for cubic cages.
+            raise ValueError(f"Not a fullerene cage, atom degrees {sorted(set(degree.tolist()))}.")
+        lookup = _LOOKUPS.get(cage.natoms)
+        pentagon_index, spiral_num = matrix2spiral(cage, lookup)
+        result["pentagon_index"] = " ".join(str(i) for i in pentagon_index)
+        if lookup is not None:
+            result["spiral_num"] = spiral_num
+        else:
+            result["error"] = f"No reference of C{cage.natoms}."
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def identify_dir(rootpath, lookups: Optional[Dict[int, SpiralLookup]] = None, workers: int = 1) \
+        -> Generator[dict, None, None]:
+    """
+    Identify all structure files in `rootpath` by `matrix2spiral`, in a process pool.
+    Failures don't stop the others, they are reported in "error".
+
+    Parameters
+    ----------
+    rootpath
+    lookups:Dict[int, SpiralLookup]
+        References keyed by atom number, see `load_lookups`.
+    workers:int
+        Number of worker processes.
+
+    Returns
+    -------
+    Generator[dict]:
+        {
+            "path": path,
+            "natoms": natoms,
+            "pentagon_index": pentagon_index,  # space separated
+            "spiral_num": spiral_num,
+            "error": error  # None if identified
+        }
+    """
+    lookups = lookups or {}
+    paths = [str(path) for path in cage_files(rootpath)]
+    pbar = tqdm(total=len(paths))
+    pbar.set_description(f"Identify {rootpath}")
+    if workers <= 1:
+        _init_identify(lookups)
+        results = map(_identify_file, paths)
+        for result in results:
+            pbar.update(1)
+            yield result
+    else:
+        with Pool(workers, initializer=_init_identify, initargs=(lookups,)) as po:
+            for result in po.imap(_identify_file, paths, chunksize=max(1, len(paths) // (workers * 16))):
+                pbar.update(1)
+                yield result
+    pbar.close()
+
+
+def store_identify(rootpath, target, lookups: Optional[Dict[int, SpiralLookup]] = None, workers: int = 1) \
+        -> pd.DataFrame:
+    """
+    Store `identify_dir` results of `rootpath` in one table.
+
+    Parameters
+    ----------
+    rootpath
+    target
+        Path of the table, see `io.table.write_table`.
+    lookups:Dict[int, SpiralLookup]
+    workers:int
+
+    Returns
+    -------
+    pd.DataFrame:
+        The stored table.
+    """
+    check_table_target(target)
+    table = pd.DataFrame(list(identify_dir(rootpath, lookups, workers)),
+                         columns=["path", "natoms", "pentagon_index", "spiral_num", "error"])
+    table["natoms"] = table["natoms"].astype("Int64")
+    table["spiral_num"] = table["spiral_num"].astype("Int64")
+    write_table(table, target)
+    failed = table["error"].notna().sum()
+    logger.info(f"{len(table) - failed} of {len(table)} structures identified, stored in {target}.")
+    return table
 
 
 # slow method
@@ -58,6 +333,8 @@ def matrix2spiral_slow(input_path, circle_num, eigh_ref):
 
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
     np.set_printoptions(threshold=np.inf, linewidth=500)
     ADJ_DB_FILE = r"D:\CODE\#DATASETS\FullDB\circleadj\ADJ86"
     atom_num = 86
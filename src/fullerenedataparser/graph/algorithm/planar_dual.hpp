@@ -1,6 +1,12 @@
 #ifndef __CREATE_DUAL_GRAPH_HPP__
 #define __CREATE_DUAL_GRAPH_HPP__
 
+#include <algorithm>
+#include <atomic>
+#include <exception>
+#include <string>
+#include <system_error>
+#include <thread>
 #include <vector>
 
 #include <boost/config.hpp>
@@ -45,7 +51,8 @@ namespace planar_dual
                                                                      num_face(0),
                                                                      edge_to_face_vector(num_edges(g),
                                                                                          graph_traits<InputGraph>::null_vertex()),
-                                                                     edge_to_face(edge_to_face_vector.begin(), index_e)
+                                                                     edge_to_face(edge_to_face_vector.begin(), index_e),
+                                                                     edge_faces(2 * num_edges(g), -1)
 
     {
     }
@@ -91,9 +98,11 @@ namespace planar_dual
       if (existing_face == graph_traits<InputGraph>::null_vertex())
       {
         edge_to_face[e] = num_face;
+        edge_faces[2 * index_e[e]] = num_face;
       }
       else
       {
+        edge_faces[2 * index_e[e] + 1] = num_face;
         vertex_vector_t e_vector(2);
         e_vector[0] = existing_face;
         e_vector[1] = num_face;
@@ -112,8 +121,49 @@ namespace planar_dual
 
     vertex_vector_t edge_to_face_vector;
     edge_to_face_map_t edge_to_face;
+    vertex_vector_t edge_faces; // Two faces of each edge, edges in input order.
   };
 
+  // Faces and dual edges of graph given by `edge_num` edges in `edge_origin`.
+  // Return 1 if the graph is planar, else -1 with nothing found.
+  // Faces of each edge are written to `edge_faces` (if given) with shape [edge_num, 2].
+  inline int find_circles(const int edge_num,
+                          const int *edge_origin,
+                          std::vector<std::vector<int>> &vector_v,
+                          std::vector<std::vector<std::vector<int>>> &vector_e,
+                          std::vector<std::vector<int>> &vector_dual_edge,
+                          std::vector<int> *edge_faces = nullptr)
+  {
+    graph g;
+    for (int i = 0; i < edge_num; i++)
+    {
+      add_edge(edge_origin[i * 2 + 0], edge_origin[i * 2 + 1], g);
+    }
+    property_map<planar_dual::graph, edge_index_t>::type e_index = get(edge_index, g);
+    graph_traits<planar_dual::graph>::edges_size_type edge_count = 0;
+    graph_traits<planar_dual::graph>::edge_iterator ei, ei_end;
+    for (boost::tie(ei, ei_end) = edges(g); ei != ei_end; ++ei)
+      put(e_index, *ei, edge_count++);
+    //Check planarity.
+    typedef std::vector<graph_traits<planar_dual::graph>::edge_descriptor> vec_t;
+    std::vector<vec_t> embedding(num_vertices(g));
+    if (!boyer_myrvold_planarity_test(boyer_myrvold_params::graph = g,
+                                      boyer_myrvold_params::embedding = &embedding[0]))
+      return -1;
+    graph_face_vertex_visitor<graph,
+                              std::vector<std::vector<int>>,
+                              std::vector<std::vector<std::vector<int>>>,
+                              std::vector<std::vector<int>>>
+        face_vis(g,
+                 vector_v,
+                 vector_e,
+                 vector_dual_edge);
+    planar_face_traversal(g, &embedding[0], face_vis);
+    if (edge_faces)
+      edge_faces->swap(face_vis.edge_faces);
+    return 1;
+  }
+
   class graph_circle_finder
   {
   public:
@@ -122,38 +172,8 @@ namespace planar_dual
     int planar_flag = 0;
     graph_circle_finder(const int edge_num, const int *edge_origin)
     {
-      graph g;
-      for (int i = 0; i < edge_num; i++)
-      {
-        add_edge(edge_origin[i * 2 + 0], edge_origin[i * 2 + 1], g);
-      }
-      property_map<planar_dual::graph, edge_index_t>::type e_index = get(edge_index, g);
-      graph_traits<planar_dual::graph>::edges_size_type edge_count = 0;
-      graph_traits<planar_dual::graph>::edge_iterator ei, ei_end;
-      for (boost::tie(ei, ei_end) = edges(g); ei != ei_end; ++ei)
-        put(e_index, *ei, edge_count++);
-      //Check planarity.
-      typedef std::vector<graph_traits<planar_dual::graph>::edge_descriptor> vec_t;
-      std::vector<vec_t> embedding(num_vertices(g));
-      if (boyer_myrvold_planarity_test(boyer_myrvold_params::graph = g,
-                                       boyer_myrvold_params::embedding = &embedding[0]))
-      {
-        planar_flag = 1;
-        graph_face_vertex_visitor<graph,
-                                  std::vector<std::vector<int>>,
-                                  std::vector<std::vector<std::vector<int>>>,
-                                  std::vector<std::vector<int>>>
-            face_vis(g,
-                     vector_v,
-                     vector_e,
-                     vector_dual_edge);
-        planar_face_traversal(g, &embedding[0], face_vis);
-      }
-      else
-      {
-        planar_flag = -1;
-        exit(-1);
-      }
+      // Non-planar graphs are reported by `planar_flag = -1`, callers decide how to fail.
+      planar_flag = find_circles(edge_num, edge_origin, vector_v, vector_e, vector_dual_edge);
     }
 
     int privacy_get_graph_face_num()
@@ -236,10 +256,199 @@ namespace planar_dual
     }
 
   private:
-    graph g;
     std::vector<std::vector<int>> vector_v;
     std::vector<std::vector<std::vector<int>>> vector_e;
     std::vector<std::vector<int>> vector_dual_edge;
   };
+
+  // Flat result of one graph in a batch.
+  struct circle_finder_result
+  {
+    int planar_flag = 0;
+    std::vector<int> face_offsets;  // Faces of `face_vertices[face_offsets[i]:face_offsets[i + 1]]`.
+    std::vector<int> face_vertices;
+    std::vector<int> dual_edges;    // Pairs of faces.
+    std::vector<int> edge_faces;    // Pairs of faces of each input edge.
+    std::vector<int> vertex_face_offsets; // Faces of vertex i are `vertex_faces[vertex_face_offsets[i]:vertex_face_offsets[i + 1]]`.
+    std::vector<int> vertex_faces;
+    int error_flag = 0;             // 1 if an exception was caught in `find_circles_batch`.
+    std::string error_message;
+  };
+
+  // Vertex to face incidence of `result` by counting sort of face vertices.
+  inline void fill_vertex_faces(const int edge_num, const int *edge_origin, circle_finder_result &result)
+  {
+    int vertex_num = 0;
+    for (int i = 0; i < 2 * edge_num; i++)
+      vertex_num = std::max(vertex_num, edge_origin[i] + 1);
+    result.vertex_face_offsets.assign(vertex_num + 1, 0);
+    for (size_t i = 0; i < result.face_vertices.size(); i++)
+      result.vertex_face_offsets[result.face_vertices[i] + 1]++;
+    for (int i = 0; i < vertex_num; i++)
+      result.vertex_face_offsets[i + 1] += result.vertex_face_offsets[i];
+    result.vertex_faces.assign(result.face_vertices.size(), 0);
+    std::vector<int> cursor(result.vertex_face_offsets.begin(), result.vertex_face_offsets.end() - 1);
+    for (size_t f = 0; f + 1 < result.face_offsets.size(); f++)
+      for (int i = result.face_offsets[f]; i < result.face_offsets[f + 1]; i++)
+        result.vertex_faces[cursor[result.face_vertices[i]]++] = f;
+  }
+
+  inline void find_circles_flat(const int edge_num, const int *edge_origin, circle_finder_result &result)
+  {
+    std::vector<std::vector<int>> vector_v;
+    std::vector<std::vector<std::vector<int>>> vector_e;
+    std::vector<std::vector<int>> vector_dual_edge;
+    result.planar_flag = find_circles(edge_num, edge_origin, vector_v, vector_e, vector_dual_edge, &result.edge_faces);
+    result.face_offsets.assign(1, 0);
+    result.face_vertices.clear();
+    result.dual_edges.clear();
+    for (size_t i = 0; i < vector_v.size(); i++)
+    {
+      result.face_vertices.insert(result.face_vertices.end(), vector_v[i].begin(), vector_v[i].end());
+      result.face_offsets.push_back(result.face_vertices.size());
+    }
+    for (size_t i = 0; i < vector_dual_edge.size(); i++)
+    {
+      result.dual_edges.push_back(vector_dual_edge[i][0]);
+      result.dual_edges.push_back(vector_dual_edge[i][1]);
+    }
+    fill_vertex_faces(edge_num, edge_origin, result);
+  }
+
+  // Faces traced from a rotation system in O(E), without the planarity test.
+  // `rotation` has shape [vertex_num, degree], neighbors of each vertex in cyclic order (all clockwise
+  // or all counterclockwise seen from outside). Return 1 with `result` filled if the rotation traces a
+  // sphere (every edge between two faces, F = E - V + 2) on the edges in `edge_origin`, else -1.
+  inline int find_circles_rotation(const int edge_num,
+                                   const int *edge_origin,
+                                   const int vertex_num,
+                                   const int degree,
+                                   const int *rotation,
+                                   circle_finder_result &result)
+  {
+    const int dart_num = vertex_num * degree;
+    result.planar_flag = -1;
+    if (dart_num != 2 * edge_num)
+      return -1;
+    // Dart d = v * degree + k goes from v to rotation[d].
+    std::vector<int> twin(dart_num, -1), dart_edge(dart_num, -1), dart_face(dart_num, -1);
+    for (int e = 0; e < edge_num; e++)
+    {
+      const int a = edge_origin[2 * e], b = edge_origin[2 * e + 1];
+      if (a < 0 || a >= vertex_num || b < 0 || b >= vertex_num)
+        return -1;
+      int ab = -1, ba = -1;
+      for (int k = 0; k < degree; k++)
+      {
+        if (rotation[a * degree + k] == b)
+          ab = a * degree + k;
+        if (rotation[b * degree + k] == a)
+          ba = b * degree + k;
+      }
+      if (ab < 0 || ba < 0 || dart_edge[ab] >= 0 || dart_edge[ba] >= 0)
+        return -1;
+      twin[ab] = ba;
+      twin[ba] = ab;
+      dart_edge[ab] = dart_edge[ba] = e;
+    }
+    result.face_offsets.assign(1, 0);
+    result.face_vertices.clear();
+    int face_num = 0;
+    for (int start = 0; start < dart_num; start++)
+    {
+      if (dart_face[start] >= 0)
+        continue;
+      int d = start;
+      do
+      {
+        dart_face[d] = face_num;
+        result.face_vertices.push_back(d / degree);
+        // Turn at the head of d to the next neighbor after the tail.
+        const int back = twin[d];
+        d = (back / degree) * degree + (back % degree + 1) % degree;
+        if ((int)result.face_vertices.size() > dart_num)
+          return -1;
+      } while (d != start);
+      result.face_offsets.push_back(result.face_vertices.size());
+      face_num++;
+    }
+    if (face_num != edge_num - vertex_num + 2)
+      return -1;
+    result.edge_faces.assign(2 * edge_num, -1);
+    result.dual_edges.assign(2 * edge_num, -1);
+    for (int e = 0; e < edge_num; e++)
+    {
+      const int a = edge_origin[2 * e];
+      int ab = 0;
+      for (int k = 0; k < degree; k++)
+        if (rotation[a * degree + k] == edge_origin[2 * e + 1])
+          ab = a * degree + k;
+      if (dart_face[ab] == dart_face[twin[ab]])
+        return -1;
+      result.edge_faces[2 * e] = result.dual_edges[2 * e] = std::min(dart_face[ab], dart_face[twin[ab]]);
+      result.edge_faces[2 * e + 1] = result.dual_edges[2 * e + 1] = std::max(dart_face[ab], dart_face[twin[ab]]);
+    }
+    fill_vertex_faces(edge_num, edge_origin, result);
+    result.planar_flag = 1;
+    return 1;
+  }
+
+  // Find circles of `batch` graphs, graph i has edges `edge_origin[2 * edge_offsets[i]:2 * edge_offsets[i + 1]]`.
+  // Graphs are shared out to `thread_num` threads (all cores if not positive). No Python object is touched.
+  // Exceptions of one graph (e.g. std::bad_alloc) are caught in its thread and kept in `error_flag`/`error_message`,
+  // so they never escape a std::thread.
+  inline void find_circles_batch(const int batch,
+                                 const int *edge_offsets,
+                                 const int *edge_origin,
+                                 int thread_num,
+                                 std::vector<circle_finder_result> *results)
+  {
+    results->resize(batch);
+    if (thread_num <= 0)
+      thread_num = std::max(1, (int)std::thread::hardware_concurrency());
+    thread_num = std::min(thread_num, std::max(batch, 1));
+    std::atomic<int> next(0);
+    auto worker = [&]() noexcept
+    {
+      for (int i = next++; i < batch; i = next++)
+      {
+        circle_finder_result &result = (*results)[i];
+        try
+        {
+          find_circles_flat(edge_offsets[i + 1] - edge_offsets[i], edge_origin + 2 * edge_offsets[i], result);
+        }
+        catch (...)
+        {
+          result.error_flag = 1;
+          result.planar_flag = 0;
+          try
+          {
+            std::rethrow_exception(std::current_exception());
+          }
+          catch (const std::exception &e)
+          {
+            try { result.error_message = e.what(); } catch (...) {}
+          }
+          catch (...) {}
+        }
+      }
+    };
+    // The calling thread is one of the workers. If a thread can't be started, the others take its graphs.
+    std::vector<std::thread> threads;
+    for (int t = 1; t < thread_num; t++)
+    {
+      try
+      {
+        threads.emplace_back(worker);
+      }
+      catch (const std::system_error &)
+      {
+        break;
+      }
+    }
+    worker();
+    for (size_t t = 0; t < threads.size(); t++)
+      threads[t].join();
+  }
 }
 #endif //__CREATE_DUAL_GRAPH_HPP__
\ No newline at end of file
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : windup.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+
+"""
+Face spiral windup: rebuild a fullerene from the 12 pentagon indices of its spiral.
+
+Circles (faces) are added one after another along the spiral. Each new circle touches
+the previous one and the oldest circle on the boundary which still has free edges,
+then closes around every boundary circle which becomes saturated (Fowler & Manolopoulos).
+Circles are numbered in spiral order, so `windup_dual` gives the same matrix as
+circle adjacency in spiral output files.
+
+Atoms are the triangles of the dual graph. They are numbered in lexicographic order of
+their three circles, which is generally not the atom order of spiral output files.
+"""
+
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+from fullerenedataparser.util.logger import Logger
+
+logger = Logger(__name__, console_on=True)
+
+
+def spiral_face_sizes(pentagon_index, circle_num: int) -> np.ndarray:
+    """
+    Size of each circle along the spiral.
+
+    Parameters
+    ----------
+    pentagon_index:
+        12 pentagon indices, counted from 1.
+    circle_num:int
+        Number of circles, `N // 2 + 2` for C`N`.
+
+    Returns
+    -------
+    np.ndarray:
+        5 for pentagons and 6 for hexagons, shape [circle_num].
+    """
+    pentagon_index = np.asarray(pentagon_index, dtype=int)
+    if pentagon_index.shape != (12,) or pentagon_index.min() < 1 or pentagon_index.max() > circle_num \
+            or np.unique(pentagon_index).shape[0] != 12:
+        raise ValueError(f"Illegal pentagon indices {pentagon_index.tolist()} for {circle_num} circles.")
+    sizes = np.full(circle_num, 6, dtype=int)
+    sizes[pentagon_index - 1] = 5
+    return sizes
+
+
+def windup_dual(pentagon_index, atom_num: int) -> np.ndarray:
+    """
+    Wind up the face spiral of C`atom_num` given by `pentagon_index` into circle adjacency.
+
+    Parameters
+    ----------
+    pentagon_index:
+        12 pentagon indices, counted from 1.
+    atom_num:int
+        Number of atoms.
+
+    Returns
+    -------
+    np.ndarray:
+        Adjacency of circles with shape [N // 2 + 2, N // 2 + 2], circles in spiral order.
+
+    Raises
+    ------
+    ValueError:
+        If the spiral doesn't close into a fullerene.
+    """
+    circle_num = atom_num // 2 + 2
+    free = spiral_face_sizes(pentagon_index, circle_num).tolist()
+    edges = set()
+
+    def connect(i, j):
+        if (i, j) in edges:
+            raise ValueError(f"Spiral {list(pentagon_index)} of C{atom_num} fails at circle {j + 1}.")
+        edges.add((i, j))
+        free[i] -= 1
+        free[j] -= 1
+
+    connect(0, 1)
+    boundary = [0, 1]
+    start = 0  # boundary[start:] are the open circles, boundary[start] is the oldest one.
+    for k in range(2, circle_num):
+        connect(k, boundary[-1])
+        connect(k, boundary[start])
+        last = k == circle_num - 1
+        while len(boundary) - start > 2:
+            if free[boundary[start]] == 0:
+                start += 1
+                connect(k, boundary[start])
+            elif free[boundary[-1]] == 0:
+                boundary.pop()
+                connect(k, boundary[-1])
+            else:
+                break
+        if min(free[boundary[start]], free[boundary[-1]], free[k]) < 0 or (free[k] == 0 and not last):
+            raise ValueError(f"Spiral {list(pentagon_index)} of C{atom_num} fails at circle {k + 1}.")
+        boundary.append(k)
+    if any(free):
+        raise ValueError(f"Spiral {list(pentagon_index)} of C{atom_num} doesn't close.")
+    edges = np.array(list(edges))
+    adj = np.zeros([circle_num, circle_num], dtype=int)
+    adj[edges[:, 0], edges[:, 1]] = 1
+    adj[edges[:, 1], edges[:, 0]] = 1
+    return adj
+
+
+def dual_to_atom_adj(circleadj: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Atom adjacency of a fullerene from its circle adjacency.
+
+    Atoms are the triangles of the circle graph, two atoms are bonded
+    if their triangles share an edge of the circle graph.
+
+    Parameters
+    ----------
+    circleadj:np.ndarray
+        Adjacency of circles with shape [F, F].
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]:
+        Adjacency of atoms with shape [N, N], and the circles of each atom with shape [N, 3].
+    """
+    circleadj = np.asarray(circleadj, dtype=int)
+    i, j = np.nonzero(np.triu(circleadj))
+    common = circleadj[i] & circleadj[j]
+    # Keep triangles i < j < k once.
+    k_mask = common.astype(bool) & (np.arange(circleadj.shape[0])[None, :] > j[:, None])
+    edge_idx, k = np.nonzero(k_mask)
+    triangles = np.stack([i[edge_idx], j[edge_idx], k], axis=-1)
+    atom_num = triangles.shape[0]
+    if atom_num != 2 * (circleadj.shape[0] - 2):
+        raise ValueError(f"Not the dual of a fullerene, {atom_num} triangles for {circleadj.shape[0]} circles.")
+    # Each circle edge is shared by exactly two triangles, which are bonded atoms.
+    edge_code = np.concatenate([triangles[:, [0, 1]], triangles[:, [0, 2]], triangles[:, [1, 2]]])
+    edge_code = edge_code[:, 0] * circleadj.shape[0] + edge_code[:, 1]
+    atoms = np.tile(np.arange(atom_num), 3)
+    order = np.argsort(edge_code, kind="stable")
+    pairs = atoms[order].reshape(-1, 2)
+    adj = np.zeros([atom_num, atom_num], dtype=int)
+    adj[pairs[:, 0], pairs[:, 1]] = 1
+    adj[pairs[:, 1], pairs[:, 0]] = 1
+    return adj, triangles
+
+
+@lru_cache(maxsize=4096)
+def _windup_cached(pentagon_index: tuple, atom_num: int) -> Tuple[np.ndarray, np.ndarray]:
+    circleadj = windup_dual(pentagon_index, atom_num)
+    atomadj, _ = dual_to_atom_adj(circleadj)
+    atomadj.setflags(write=False)
+    circleadj.setflags(write=False)
+    return atomadj, circleadj
+
+
+def windup(pentagon_index, atom_num: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Atom and circle adjacency of C`atom_num` from the 12 pentagon indices of its spiral.
+    Results are cached (LRU), and read-only.
+
+    Parameters
+    ----------
+    pentagon_index:
+        12 pentagon indices, counted from 1.
+    atom_num:int
+        Number of atoms.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]:
+        atomadj with shape [N, N] and circleadj with shape [N // 2 + 2, N // 2 + 2].
+    """
+    return _windup_cached(tuple(int(i) for i in pentagon_index), int(atom_num))
+
+
+def windup_batch(pentagon_indices, atom_num: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    `windup` for a batch of spirals of C`atom_num`.
+
+    Parameters
+    ----------
+    pentagon_indices:
+        Pentagon indices with shape [B, 12], e.g. from `SpiralFile.iter_headers()`.
+    atom_num:int
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]:
+        atomadj with shape [B, N, N] and circleadj with shape [B, N // 2 + 2, N // 2 + 2].
+    """
+    circle_num = atom_num // 2 + 2
+    pentagon_indices = np.asarray(pentagon_indices, dtype=int).reshape(-1, 12)
+    atomadj = np.zeros([pentagon_indices.shape[0], atom_num, atom_num], dtype=int)
+    circleadj = np.zeros([pentagon_indices.shape[0], circle_num, circle_num], dtype=int)
+    for idx, pentagon_index in enumerate(pentagon_indices):
+        atomadj[idx], circleadj[idx] = windup(pentagon_index, atom_num)
+    return atomadj, circleadj
@@ -144,7 +144,7 @@ def planarity_graph_draw(cage: FullereneCage,
                     verticalalignment='center', )
             pass
         # draw edge lines
-        for edges in cage.graph.edges:
+        for edges in cage.atom_graph.edges():
             ax.add_patch(mpatches.FancyArrowPatch(project_axis_sp_r[edges[0]],
                                                   project_axis_sp_r[edges[1]],
                                                   antialiased=antialiased,
@@ -153,7 +153,7 @@ def planarity_graph_draw(cage: FullereneCage,
     else:
         ax.scatter(project_axis_sp_r[:, 0], project_axis_sp_r[:, 1], c=line_color,
                    alpha=line_alpha)
-        for edges in cage.graph.edges:
+        for edges in cage.atom_graph.edges():
             ax.add_patch(mpatches.FancyArrowPatch(project_axis_sp_r[edges[0]],
                                                   project_axis_sp_r[edges[1]],
                                                   antialiased=antialiased,
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : compress.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+
+"""
+Transparent reading of compressed files.
+
+gzip, xz, bzip2 and zstd (with the optional `zstandard` package) files are detected
+by extension or magic bytes, and decompressed while streaming, never to a temporary file.
+Decompression runs in a background thread which reads ahead of the consumer,
+so it overlaps with parsing (the decompressors release the GIL).
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+from typing import Optional
+
+from fullerenedataparser.util.logger import Logger
+
+logger = Logger(__name__, console_on=True)
+
+COMPRESSION_SUFFIXES = {
+    ".gz": "gzip",
+    ".xz": "xz",
+    ".lzma": "xz",
+    ".bz2": "bz2",
+    ".zst": "zstd",
+}
+COMPRESSION_MAGICS = {
+    b"\x1f\x8b": "gzip",
+    b"\xfd7zXZ\x00": "xz",
+    b"BZh": "bz2",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+
+def compression_of(path) -> Optional[str]:
+    """
+    Compression format of file `path`, by its extension or, failing that, by its magic bytes.
+
+    Returns
+    -------
+    str or None:
+        One of "gzip", "xz", "bz2" and "zstd", or None for uncompressed files.
+    """
+    suffix = os.path.splitext(str(path))[-1].lower()
+    if suffix in COMPRESSION_SUFFIXES:
+        return COMPRESSION_SUFFIXES[suffix]
+    with open(path, "rb") as file:
+        head = file.read(6)
+    for magic, compression in COMPRESSION_MAGICS.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def strip_compression_suffix(path) -> str:
+    """
+    `path` without compression extension, e.g. "C60.xyz.gz" -> "C60.xyz".
+    """
+    root, suffix = os.path.splitext(str(path))
+    if suffix.lower() in COMPRESSION_SUFFIXES:
+        return root
+    return str(path)
+
+
+def _open_decompressor(path, compression):
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "xz":
+        return lzma.open(path, "rb")
+    if compression == "bz2":
+        return bz2.open(path, "rb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"Package `zstandard` is needed to read zstd file {path}.")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    raise ValueError(f"Unknown compression {compression}.")
+
+
+class PrefetchReader(io.RawIOBase):
+    """
+    Read-only binary stream reading `raw` ahead in a background thread.
+
+    Up to `depth` chunks of `chunk_size` bytes are kept ready, so the work done in
+    `raw.read` (e.g. decompression) overlaps with the work of the consumer.
+    """
+
+    def __init__(self, raw, chunk_size: int = 1 << 20, depth: int = 4):
+        super().__init__()
+        self.raw = raw
+        self.chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._buffer = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        try:
+            while not self._stop.is_set():
+                chunk = self.raw.read(self.chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buffer and not self._eof:
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._eof = True
+            self._buffer = memoryview(item)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self.raw.close()
+        super().close()
+
+
+def open_file(path, mode: str = "r", encoding: str = "utf-8", prefetch: bool = True):
+    """
+    Open file `path` for reading, decompressing it on the fly if compressed.
+
+    Parameters
+    ----------
+    path:
+        Path of a plain or compressed file.
+    mode:str
+        "r" for text, "rb" for bytes.
+    encoding:str
+        Encoding in text mode.
+    prefetch:bool
+        Decompress in a background thread, see `PrefetchReader`.
+
+    Returns
+    -------
+    File object. Streams of compressed files are not seekable.
+    """
+    if mode not in ("r", "rb"):
+        raise ValueError(f"Only reading is supported, got mode {mode}.")
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, mode, encoding=encoding if mode == "r" else None)
+    logger.debug(f"Reading {compression} compressed file {path}.")
+    raw = _open_decompressor(path, compression)
+    if prefetch:
+        raw = PrefetchReader(raw)
+    stream = io.BufferedReader(raw, buffer_size=1 << 16)
+    if mode == "rb":
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
@@ -11,6 +11,7 @@ import re
 
 import numpy as np
 from ase.atoms import Atoms
+from fullerenedataparser.io.compress import open_file
 from fullerenedataparser.util.functools import lazy_property
 from fullerenedataparser.util.logger import Logger
 
@@ -79,7 +80,7 @@ class LogFile(object):
         """The identity function.
 
         """
-        with open(self.path) as file:
+        with open_file(self.path) as file:
             information = file.read()
             # self.content['taskTitle'] = LogFile.par_tasktitle.findall(information)[0]
             self.content['taskTitle'] = os.path.basename(self.path)
@@ -10,6 +10,7 @@ import os
 from pathlib import Path
 
 from fullerenedataparser.io import FileNotMatchError
+from fullerenedataparser.io.compress import strip_compression_suffix
 from fullerenedataparser.util.logger import Logger
 
 logger = Logger(__name__, console_on=True)
@@ -25,6 +26,7 @@ def recursion_files(rootpath, format="xyz", ignore_mode=False):
         If `format` set to "" or None, all files will be returned.
         Warning: Format will match all files contain ".{format}",
         which means "xxx.xyz1234" will be matched also.
+        Compression extensions are ignored, so "xxx.xyz.gz" is matched by "xyz".
         # TODO: A better way to match file.
     ignore_mode:bool
         If ignore_mode, files doesn't match format will be ignored.
@@ -42,7 +44,7 @@ def recursion_files(rootpath, format="xyz", ignore_mode=False):
                     yield Path(sub_item_path)
         elif os.path.isfile(item_path):
             if format:
-                if f".{format}" in os.path.splitext(item)[-1]:
+                if f".{format}" in os.path.splitext(strip_compression_suffix(item))[-1]:
                     yield Path(item_path)
                 else:
                     if not ignore_mode:
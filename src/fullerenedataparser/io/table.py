@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : table.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+
+"""
+Result tables written as CSV, or as parquet with the optional `pyarrow` (or `fastparquet`) package,
+installed by `pip install FullereneDataParser[parquet]`.
+"""
+
+import importlib.util
+
+import pandas as pd
+
+from fullerenedataparser.util.logger import Logger
+
+logger = Logger(__name__, console_on=True)
+
+PARQUET_ENGINES = ("pyarrow", "fastparquet")
+
+
+def check_table_target(target):
+    """
+    Raise ImportError before any calculation if `target` is a `.parquet` file but no parquet engine is installed.
+    """
+    if str(target).endswith(".parquet") and not any(importlib.util.find_spec(engine) for engine in PARQUET_ENGINES):
+        raise ImportError(f"Package `pyarrow` or `fastparquet` is needed to write {target}. "
+                          f"Install by `pip install FullereneDataParser[parquet]`, or write a `.csv` table instead.")
+
+
+def write_table(table: pd.DataFrame, target):
+    """
+    Write `table` to `target`, `.parquet` files by `DataFrame.to_parquet`, others as CSV.
+    """
+    check_table_target(target)
+    if str(target).endswith(".parquet"):
+        table.to_parquet(target, index=False)
+    else:
+        table.to_csv(target, index=False)
@@ -8,6 +8,7 @@
 
 from ase.atoms import Atoms
 from fullerenedataparser.io import FileCommentError
+from fullerenedataparser.io.compress import open_file
 from fullerenedataparser.util.logger import Logger
 
 logger = Logger(__name__, console_on=True)
@@ -27,7 +28,7 @@ def simple_read_xyz_xtb(filepath, index=None, read_comment=True):
     -------
         Generator of Atoms.
     """
-    with open(filepath, "r",encoding="utf-8") as file:
+    with open_file(filepath, "r", encoding="utf-8") as file:
         lines = file.readlines()
         natoms = int(lines[0])
         nimages = len(lines) // (natoms + 2)
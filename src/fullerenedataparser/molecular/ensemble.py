@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : ensemble.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+
+"""
+Many isomers (or frames) of C`N` held as contiguous arrays.
+
+`FullereneFamily` is an `ase.Atoms` per cage. `FullereneEnsemble` keeps M cages of
+the same atom number in stacked arrays and computes their properties for all
+members at once. A `FullereneCage` is only built when a member is indexed.
+"""
+
+from typing import Iterable, List, Optional
+
+import numpy as np
+from ase import Atoms
+
+from fullerenedataparser.calculator.csi import count_napp
+from fullerenedataparser.graph.adjacency import CSRAdjacency, circle_adjacency, circle_adjacency_batch
+from fullerenedataparser.molecular.fullerene import FullereneCage
+from fullerenedataparser.util.functools import lazy_property
+from fullerenedataparser.util.geometry import nearest_neighbors
+from fullerenedataparser.util.logger import Logger
+
+logger = Logger(__name__, console_on=True)
+
+
+class FullereneEnsemble:
+    """
+    M fullerenes with N atoms.
+
+    Attributes
+    ----------
+    positions:np.ndarray
+        float64 with shape [M, N, 3], or None for topology only.
+    neighbors:np.ndarray
+        Neighbor arrays of atoms with shape [M, N, 3].
+    energies:np.ndarray
+        float64 with shape [M], nan if unknown.
+    spiral_num:np.ndarray
+        int64 with shape [M], -1 if unknown.
+    charges:np.ndarray
+        int64 with shape [M].
+    """
+
+    def __init__(self, positions=None, neighbors=None, energies=None, spiral_num=None, charges=None):
+        """
+
+        Parameters
+        ----------
+        positions:
+            Positions with shape [M, N, 3].
+        neighbors:
+            Neighbor arrays with shape [M, N, 3]. Perceived from `positions` by nearest neighbors if not given.
+        energies:
+            Energies with shape [M].
+        spiral_num:
+            Spiral numbers with shape [M].
+        charges:
+            Charges with shape [M] or one charge for all.
+        """
+        if positions is None and neighbors is None:
+            raise ValueError("Either `positions` or `neighbors` is needed.")
+        self.positions = None if positions is None else np.ascontiguousarray(positions, dtype=np.float64)
+        if neighbors is None:
+            neighbors = nearest_neighbors(self.positions, k=3)
+        self.neighbors = np.ascontiguousarray(neighbors, dtype=np.int64)
+        if self.neighbors.ndim != 3 or self.neighbors.shape[-1] != 3:
+            raise ValueError(f"`neighbors` must have shape [M, N, 3], got {self.neighbors.shape}.")
+        if self.positions is not None and self.positions.shape != self.neighbors.shape:
+            raise ValueError(f"Shapes of positions {self.positions.shape} and neighbors {self.neighbors.shape} mismatch.")
+        self.size, self.natoms = self.neighbors.shape[:2]
+        self.energies = np.full(self.size, np.nan) if energies is None else np.asarray(energies, dtype=np.float64)
+        self.spiral_num = np.full(self.size, -1, dtype=np.int64) if spiral_num is None \
+            else np.asarray(spiral_num, dtype=np.int64)
+        self.charges = np.broadcast_to(np.asarray(0 if charges is None else charges, dtype=np.int64), [self.size]).copy()
+        for name in ("energies", "spiral_num", "charges"):
+            if getattr(self, name).shape != (self.size,):
+                raise ValueError(f"`{name}` must have shape [{self.size}], got {getattr(self, name).shape}.")
+
+    @classmethod
+    def from_atoms(cls, atoms_list: Iterable[Atoms], spiral_num=None, charges=None) -> "FullereneEnsemble":
+        """
+        Stack `ase.Atoms` (e.g. from `simple_read_xyz_xtb`) of the same atom number.
+        Energies are taken from `atoms.info["energy"]`.
+        """
+        atoms_list = list(atoms_list)
+        positions = np.stack([atoms.positions for atoms in atoms_list])
+        energies = [atoms.info.get("energy", np.nan) for atoms in atoms_list]
+        return cls(positions=positions, energies=energies, spiral_num=spiral_num, charges=charges)
+
+    @classmethod
+    def from_spiral_db(cls, path, key=slice(None)) -> "FullereneEnsemble":
+        """
+        Topology of isomers `key` of a binary spiral database, without positions.
+        """
+        from fullerenedataparser.data.db.spiraldb import SpiralDatabase
+        records = SpiralDatabase(path)[key]
+        return cls(neighbors=records["neighbors"], spiral_num=records["spiral_num"])
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        """
+        `FullereneCage` view of member `idx`, sharing the neighbor array.
+        Positions are zeros for topology-only ensembles.
+        Slices, index arrays and masks give `subset(idx)` instead.
+        """
+        if not isinstance(idx, (int, np.integer)):
+            return self.subset(idx)
+        idx = range(self.size)[idx]
+        spiral = int(self.spiral_num[idx])
+        atoms = Atoms(symbols=["C"] * self.natoms, positions=None if self.positions is None else self.positions[idx],
+                      info={"energy": self.energies[idx], "charge": int(self.charges[idx])})
+        # Only the dual of this member, the batched `circleADJ` of all members is not needed.
+        return FullereneCage(spiral=spiral if spiral >= 0 else None, nospiralflag=spiral < 0, atoms=atoms,
+                             atomADJ=self.neighbors[idx], circleADJ=circle_adjacency(self.neighbors[idx], compact=True),
+                             compact=True)
+
+    def __iter__(self):
+        for idx in range(self.size):
+            yield self[idx]
+
+    def subset(self, idx) -> "FullereneEnsemble":
+        """
+        Members `idx` (slice, index array or mask) as a new ensemble.
+        """
+        return FullereneEnsemble(positions=None if self.positions is None else self.positions[idx],
+                                 neighbors=self.neighbors[idx], energies=self.energies[idx],
+                                 spiral_num=self.spiral_num[idx], charges=self.charges[idx])
+
+    @property
+    def atomADJ(self) -> np.ndarray:
+        """
+        Adjacency of atoms with shape [M, N, N].
+        """
+        adj = np.zeros([self.size, self.natoms, self.natoms], dtype=int)
+        adj[np.arange(self.size)[:, None, None], np.arange(self.natoms)[None, :, None], self.neighbors] = 1
+        return adj
+
+    @lazy_property
+    def circleADJ(self) -> np.ndarray:
+        """
+        Adjacency of circles with shape [M, N // 2 + 2, N // 2 + 2], circles in face traversal order.
+        """
+        return circle_adjacency_batch(self.neighbors)
+
+    @lazy_property
+    def circle_neighbors(self) -> List[CSRAdjacency]:
+        return [CSRAdjacency.from_dense(adj) for adj in self.circleADJ]
+
+    @lazy_property
+    def Napp(self) -> np.ndarray:
+        """
+        Number of pentagon-pentagon adjacencies with shape [M].
+        """
+        return count_napp(self.circleADJ)
+
+    def distances(self, idx: Optional[slice] = None) -> np.ndarray:
+        """
+        Distances between atoms with shape [M, N, N] (members `idx` only if given).
+        """
+        if self.positions is None:
+            raise ValueError("No positions in this ensemble.")
+        positions = self.positions if idx is None else self.positions[idx]
+        return np.linalg.norm(positions[..., :, None, :] - positions[..., None, :, :], axis=-1)
+
+    def spectra(self, vectors: bool = False):
+        """
+        Eigen-spectra of atom adjacency of all members by one batched decomposition.
+
+        Parameters
+        ----------
+        vectors:bool
+            Also return eigenvectors with shape [M, N, N].
+
+        Returns
+        -------
+        np.ndarray or Tuple[np.ndarray, np.ndarray]:
+            Eigenvalues in ascending order with shape [M, N].
+        """
+        adj = self.atomADJ.astype(np.float64)
+        if vectors:
+            return np.linalg.eigh(adj)
+        return np.linalg.eigvalsh(adj)
@@ -8,12 +8,14 @@
 import logging
 from typing import Iterable
 
-import networkx as nx
 import numpy as np
 from ase import Atoms
 from ase.neighborlist import natural_cutoffs, NeighborList
 
+from fullerenedataparser.graph.adjacency import CSRAdjacency, atom_edges, dense_to_neighbors, geometry_rotation, \
+    neighbors_to_dense
 from fullerenedataparser.util.functools import lazy_property
+from fullerenedataparser.util.geometry import nearest_neighbors, symmetric_neighbors
 from fullerenedataparser.util.logger import Logger
 
 logger = Logger(__name__, console_on=True)
@@ -26,6 +28,7 @@ class FullereneFamily(Atoms):
         nospiralflag=False,
         atomADJ=None,
         circleADJ=None,
+        compact=False,
         **kwargs,
     ):
         """
@@ -36,13 +39,22 @@ class FullereneFamily(Atoms):
         nospiralflag
         atomADJ
         circleADJ
+        compact:bool
+            If compact, `atomADJ` is given as a `(N, 3)` neighbor array and `circleADJ` as a `CSRAdjacency`.
+            They are kept compact and converted to dense matrices only when `atomADJ`/`circleADJ` are requested.
         atoms:ase.atoms.Atoms
             `Atoms` object for details.
         """
         self.spiral = self._get_spiral(spiral, nospiralflag)
         self.nospiralflag = nospiralflag
-        self._atomADJ = atomADJ
-        self._circleADJ = circleADJ
+        self.compact = compact
+        if compact:
+            self._atom_neighbors, self._circle_neighbors = atomADJ, circleADJ
+            self._atomADJ = self._circleADJ = None
+        else:
+            self._atom_neighbors = self._circle_neighbors = None
+            self._atomADJ = atomADJ
+            self._circleADJ = circleADJ
         if "atoms" in kwargs:
             assert isinstance(kwargs["atoms"], Atoms), f"`atoms` must be an instance of `ase.atoms.Atoms`, got {type(kwargs['atoms'])}"
             super(FullereneFamily, self).__init__(symbols=kwargs["atoms"].symbols,
@@ -54,6 +66,8 @@ class FullereneFamily(Atoms):
     def atomADJ(self):
         if self._atomADJ is not None:
             return self._atomADJ
+        elif self._atom_neighbors is not None:
+            return neighbors_to_dense(self._atom_neighbors)
         else:
             return self.calculated_atomADJ
 
@@ -61,9 +75,29 @@ class FullereneFamily(Atoms):
     def circleADJ(self):
         if self._circleADJ is not None:
             return self._circleADJ
+        elif self._circle_neighbors is not None:
+            return self._circle_neighbors.todense()
         else:
             return self.calculated_circleADJ
 
+    @property
+    def atom_neighbors(self) -> np.ndarray:
+        """
+        `(N, 3)` neighbor array of atoms.
+        """
+        if self._atom_neighbors is not None:
+            return self._atom_neighbors
+        return dense_to_neighbors(self.atomADJ)
+
+    @property
+    def circle_neighbors(self) -> CSRAdjacency:
+        """
+        Adjacency of circles in CSR layout.
+        """
+        if self._circle_neighbors is not None:
+            return self._circle_neighbors
+        return CSRAdjacency.from_dense(self.circleADJ)
+
     def _get_spiral(self, spiral, nospiralflag=False):
         # test spiral
         assert isinstance(nospiralflag, bool)
@@ -86,31 +120,40 @@ class FullereneFamily(Atoms):
 
     @lazy_property
     def calculated_atomADJ(self):
-        cutoffs = natural_cutoffs(self)
-        neighborList = NeighborList(cutoffs, self_interaction=False, bothways=True)
+        neighbors = nearest_neighbors(self.positions, k=3)
+        if symmetric_neighbors(neighbors):
+            atomADJ = np.zeros([self.natoms, self.natoms], dtype=int)
+            atomADJ[np.arange(self.natoms)[:, None], neighbors] = 1
+            return atomADJ
+        logging.warning(f"Nearest 3 neighbors are not mutual for {self.spiral}. "
+                        f"Trying bonds by natural cutoffs of ase.")
+        neighborList = NeighborList(natural_cutoffs(self), self_interaction=False, bothways=True)
         neighborList.update(self)
-        atomADJ = neighborList.get_connectivity_matrix(sparse=False)
+        atomADJ = np.asarray(neighborList.get_connectivity_matrix(sparse=False), dtype=int)
         if (atomADJ.sum(-1) != 3).any():
-            atomADJ = np.zeros_like(atomADJ)
-            logging.warning(f"More than 3 neighbors by ase found for {self.spiral}."
-                            f"Trying using first 3 shortest distance.")
-            neighborDis: np.ndarray = self.get_all_distances()
-            neighborSorted = np.argsort(neighborDis)
-            atomADJ[np.arange(self.natoms)[:, None], neighborSorted[:, 1:4]] = 1
+            raise ValueError(f"Bonds of {self.spiral} are not a cubic graph, "
+                             f"atoms {np.nonzero(atomADJ.sum(-1) != 3)[0].tolist()} don't have 3 neighbors.")
         return atomADJ
 
     @lazy_property
     def calculated_circleADJ(self):
-        edge_list = self.circle_finder.get_dual_edge_list()
-        circleADJ = np.zeros([self.circle_finder.face_size,self.circle_finder.face_size])
-        for item in edge_list:
-            circleADJ[item[0],item[1]]=1
-            circleADJ[item[1], item[0]] = 1
-        return circleADJ
+        return self.circle_finder.dual_adjacency(dtype=np.float64)
 
     @lazy_property
-    def graph(self) -> nx.Graph:
-        return nx.from_numpy_array(self.atomADJ, create_using=nx.Graph)
+    def atom_graph(self) -> CSRAdjacency:
+        """
+        Graph of atoms (edges, BFS distances, connected components) without networkx.
+        """
+        if self._atom_neighbors is not None:
+            return CSRAdjacency.from_neighbors(self._atom_neighbors)
+        return CSRAdjacency.from_dense(self.atomADJ)
+
+    @lazy_property
+    def graph(self):
+        """
+        `networkx.Graph` of atoms, built on demand from `atom_graph`.
+        """
+        return self.atom_graph.to_networkx()
 
     @lazy_property
     def circle_finder(self):
@@ -125,6 +168,9 @@ class FullereneFamily(Atoms):
 
         """
         # warnings.warn(f"This Function `get_fullerenecage` is still in progress")
+        if self.compact:
+            return FullereneCage(spiral=self.spiral, nospiralflag=self.nospiralflag, atoms=self,
+                                 atomADJ=self.atom_neighbors, circleADJ=self.circle_neighbors, compact=True)
         return FullereneCage(spiral=self.spiral, nospiralflag=self.nospiralflag, atoms=self, atomADJ=self.atomADJ, circleADJ=self.circleADJ)
 
 
@@ -141,8 +187,19 @@ class FullereneCage(FullereneFamily):
 
     @lazy_property
     def circle_finder(self):
+        """
+        Faces are traced from the rotation system given by geometry,
+        the planarity test is only used if geometry is missing or ambiguous.
+        """
         from fullerenedataparser.graph.algorithm import dual
-        return dual.py_graph_circle_finder(len(self.graph.edges), np.array(self.graph.edges).data)
+        edges = atom_edges(self.atomADJ)
+        rotation = None
+        if self.natoms == self.atomADJ.shape[0]:
+            try:
+                rotation = geometry_rotation(self.positions, self.atom_neighbors)
+            except ValueError as e:
+                logger.debug(f"Fall back to planarity test: {e}")
+        return dual.py_graph_circle_finder(edges.shape[0], edges, rotation)
 
     @lazy_property
     def circle_vertex_list(self) -> Iterable[np.ndarray]:
@@ -35,7 +35,7 @@ except ModuleNotFoundError:
             logger.warning("Please install module `deprecation` by `conda install deprecation -c conda-forge.`")
             sys.exit(1)
 
-from fullerenedataparser.calculator.csi import mp_store_csi
+from fullerenedataparser.calculator.csi import DEFAULT_CHARGES, mp_store_csi
 from fullerenedataparser.util.logger import Logger
 
 __author__ = "hanyanbo"
@@ -94,13 +94,69 @@ def fullertool(verbose):
 
 
 @fullertool.command()
-def spiral():
+@click.option("--natoms", "-n", "atom_num", help="Number of atoms.", type=int, required=True)
+@click.option("--ipr", "ipr", help="Only isomers obeying the isolated pentagon rule.", is_flag=True)
+@click.option("--workers", "-j", "workers", help="Number of worker processes.", type=int, default=1, show_default=True)
+@click.option("--stor", "-o", "target", help="Path of spiral database. Default to `C{natoms}.spdb` (or `C{natoms}_IPR.spdb`).")
+def spiral(atom_num, ipr, workers, target):
     """
-    Toolsets for deal with spiral algorithm and output files. (TODO)
+    Enumerate all spiral isomers of C`natoms` into a binary spiral database.\n
+    Isomers are numbered in spiral order, the same as spiral output files.
     """
-    # TODO: Spiral binary.
-    click.echo(click.style("`Spiral` integration is Unavailable now.", fg="red"), err=True)
-    # raise NotImplementedError("`Spiral` integration is in Working.")
+    from fullerenedataparser.data.db.spiraldb import enumerate_spiral_db
+    target = os.path.abspath(target or f"C{atom_num}{'_IPR' if ipr else ''}.spdb")
+    try:
+        enumerate_spiral_db(atom_num, target, ipr=ipr, workers=workers)
+    except ValueError as e:
+        click.echo(click.style(str(e), fg="red"), err=True)
+        sys.exit(1)
+
+
+@fullertool.command()
+@click.option("--dir", "-d", "rootpath", help="ROOT directory of .xyz, .gjf and .log files.", required=True)
+@click.option("--ref", "-r", "references", help="Spiral database or atom spiral file of reference isomers. Repeatable.",
+              multiple=True)
+@click.option("--workers", "-j", "workers", help="Number of worker processes.", type=int, default=1, show_default=True)
+@click.option("--stor", "-o", "target", help="Path of result table, `.csv` or `.parquet` (needs extra `parquet`).",
+              default="identify.csv", show_default=True)
+def identify(rootpath, references, workers, target):
+    """
+    Identify spiral numbers of all structures in `dir`.\n
+    Results and failure reasons are stored in one table.
+    """
+    from fullerenedataparser.graph.algorithm.matrix2spiral import load_lookups, store_identify
+    try:
+        lookups = load_lookups(os.path.abspath(path) for path in references)
+        store_identify(os.path.abspath(rootpath), os.path.abspath(target), lookups, workers=workers)
+    except ImportError as e:
+        click.echo(click.style(str(e), fg="red"), err=True)
+        sys.exit(1)
+
+
+@fullertool.command()
+@click.option("--atom", "--at", "atomdir", help="Directory of atom adjacent matrix.", required=True)
+@click.option("--circle", "--ci", "circledir", help="Directory of circle adjacent matrix. Dual of atoms if not given.")
+@click.option("--charge", "-q", "charges", help="Charges of cages. Repeatable.", type=int, multiple=True,
+              default=DEFAULT_CHARGES, show_default=True)
+@click.option("--natoms", "-n", "number_mask", help="Only cages of these atom numbers. Repeatable.", type=int,
+              multiple=True)
+@click.option("--stor", "-o", "target", help="Path of result table, `.csv` or `.parquet` (needs extra `parquet`).",
+              default="csi.csv",
+              show_default=True)
+def csisweep(atomdir, circledir, charges, number_mask, target):
+    """
+    Topological CSI of all isomers for all charges.\n
+    Each isomer is decomposed once, results are stored in one table
+    keyed by (natoms, spiral_num, charge).
+    """
+    from fullerenedataparser.calculator.csi import store_sweep_csi
+    try:
+        store_sweep_csi(os.path.abspath(atomdir), os.path.abspath(target),
+                        circledir=circledir and os.path.abspath(circledir), charges=charges,
+                        number_mask=number_mask or None)
+    except (ValueError, ImportError) as e:
+        click.echo(click.style(str(e), fg="red"), err=True)
+        sys.exit(1)
 
 
 @fullertool.command()
@@ -6,7 +6,10 @@
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
 
+from typing import Optional
+
 import numpy as np
+from scipy.spatial import cKDTree
 
 
 def sphere_center_of_four_points(point_a: np.ndarray, point_b: np.ndarray,
@@ -26,6 +29,8 @@ def sphere_center_of_four_points(point_a: np.ndarray, point_b: np.ndarray,
     point_d: np.ndarray
         point coordinate
 
+    Points can also be stacked with shape [..., 3], one sphere for each.
+
     Returns
     -------
     np.ndarray
@@ -46,13 +51,13 @@ def sphere_center_of_four_points(point_a: np.ndarray, point_b: np.ndarray,
 
     .. math:: \mathbf{O'}=[\mathbf{AD+AB+AC},\mathbf{BA+BC+BD},\mathbf{CA+CB+CD}]^T
     """
-    pos_list = np.array([point_a, point_b, point_c, point_d])
-    pos_tensor = pos_list - pos_list[:, None, :]
+    pos_list = np.stack([point_a, point_b, point_c, point_d], axis=-2)
+    pos_tensor = pos_list[..., None, :, :] - pos_list[..., :, None, :]
     dis_matrix = np.linalg.norm(pos_tensor, axis=-1)
     center_matrix = pos_tensor.sum(axis=-2)
     B = (pos_list * center_matrix).sum(axis=-1) + (
         (dis_matrix ** 2).sum(axis=-1)) / 2
-    O = np.linalg.inv(center_matrix[:3]) @ B[:3]
+    O = np.linalg.solve(center_matrix[..., :3, :], B[..., :3, None])[..., 0]
     return O
 
 
@@ -74,6 +79,87 @@ def poav_of_four_points(point_a: np.ndarray,
     return pi_vec / np.linalg.norm(pi_vec)
 
 
+def nearest_neighbors(positions: np.ndarray, k: int = 3) -> np.ndarray:
+    """
+    Bond perception by `k` nearest neighbors of each atom, with one KD-tree for all frames.
+
+    Frames are translated apart along x so that no atom has a nearer atom
+    in another frame, then queried in one call.
+
+    Parameters
+    ----------
+    positions: np.ndarray
+        Positions with shape [N, 3] or a trajectory with shape [F, N, 3].
+    k: int
+        Number of neighbors, 3 for fullerenes.
+
+    Returns
+    -------
+    np.ndarray
+        Neighbor indices with shape [N, k] or [F, N, k], sorted ascending for each atom.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    frames = positions.reshape(-1, positions.shape[-2], 3)
+    frame_num, atom_num = frames.shape[:2]
+    if atom_num <= k:
+        raise ValueError(f"{atom_num} atoms can't have {k} neighbors each.")
+    extent = np.ptp(frames.reshape(-1, 3), axis=0).max() if frames.size else 0.
+    shifted = frames.copy()
+    shifted[:, :, 0] += np.arange(frame_num)[:, None] * (2 * extent + 1.)
+    _, idx = cKDTree(shifted.reshape(-1, 3)).query(shifted.reshape(-1, 3), k=k + 1)
+    # Drop the atom itself, which is its own nearest point.
+    idx = idx.reshape(frame_num, atom_num, k + 1)[:, :, 1:] - (np.arange(frame_num) * atom_num)[:, None, None]
+    idx.sort(axis=-1)
+    return idx.reshape(positions.shape[:-1] + (k,))
+
+
+def symmetric_neighbors(neighbors: np.ndarray) -> np.ndarray:
+    """
+    Whether `j` in neighbors of `i` implies `i` in neighbors of `j` for every bond of each frame.
+
+    Parameters
+    ----------
+    neighbors: np.ndarray
+        Neighbor indices with shape [N, k] or [F, N, k].
+
+    Returns
+    -------
+    np.ndarray
+        bool with shape [] or [F].
+    """
+    neighbors = np.asarray(neighbors)
+    frames = neighbors.reshape(-1, *neighbors.shape[-2:])
+    # neighbors of the neighbors of each atom, [F, N, k, k].
+    back = np.take_along_axis(frames[:, None, :, :], frames.reshape(frames.shape[0], 1, -1, 1), axis=2)
+    back = back.reshape(frames.shape + (frames.shape[-1],))
+    atoms = np.arange(frames.shape[1])[None, :, None, None]
+    return (back == atoms).any(-1).all((-2, -1)).reshape(neighbors.shape[:-2])
+
+
+def topology_changes(neighbors: np.ndarray, reference: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Frames whose bonds differ from `reference`, or from the previous frame without `reference`.
+
+    Parameters
+    ----------
+    neighbors: np.ndarray
+        Sorted neighbor indices of a trajectory with shape [F, N, k], see `nearest_neighbors`.
+    reference: np.ndarray
+        Sorted neighbor indices with shape [N, k].
+
+    Returns
+    -------
+    np.ndarray
+        bool with shape [F]. Without `reference` the first frame is never changed.
+    """
+    neighbors = np.asarray(neighbors)
+    if reference is not None:
+        return (neighbors != np.sort(reference, axis=-1)[None]).any((-2, -1))
+    changed = np.zeros(neighbors.shape[0], dtype=bool)
+    changed[1:] = (neighbors[1:] != neighbors[:-1]).any((-2, -1))
+    return changed
+
+
 if __name__ == '__main__':
     import numpy as np
     import matplotlib.pyplot as plt
@@ -0,0 +1,101 @@
+import os
+
+import ase.build
+import numpy as np
+import pytest
+
+from fullerenedataparser.graph.adjacency import CSRAdjacency, atom_edges, batch_circle_finder, circle_adjacency, \
+    circle_adjacency_batch, geometry_rotation
+from fullerenedataparser.graph.algorithm import dual
+from fullerenedataparser.graph.algorithm.isomers import canonical_spiral, enumerate_isomers
+from fullerenedataparser.molecular.fullerene import FullereneCage
+
+__author__ = "hanyanbo"
+__copyright__ = "hanyanbo"
+__license__ = "MIT"
+
+TEST_PATH = os.path.dirname(__file__)
+
+
+def test_circle_adjacency_batch():
+    """Batch dual of an isomer family equals the dual of each cage"""
+    neighbors = np.stack([item["atomadj"] for item in enumerate_isomers(36)]).astype(int)
+    batch = circle_adjacency_batch(neighbors, thread_num=4)
+    assert batch.shape == (15, 20, 20)
+    for atomadj, circleadj in zip(neighbors, batch):
+        assert np.array_equal(circle_adjacency(atomadj), circleadj)
+
+
+def test_batch_circle_finder_nonplanar():
+    """Non-planar graphs raise instead of exiting"""
+    k33 = np.array([[i, j] for i in range(3) for j in range(3, 6)])
+    with pytest.raises(ValueError):
+        batch_circle_finder([k33[:5], k33])
+
+
+def test_circle_finder_csr():
+    """CSR faces and incidence arrays share memory with the finder"""
+    atomadj = next(enumerate_isomers(60, ipr=True))["atomadj"]
+    edges = atom_edges(atomadj)
+    finder = dual.py_graph_circle_finder(edges.shape[0], edges)
+    face_offsets, face_vertices = finder.face_offsets, finder.face_vertices
+    edge_faces, vertex_faces = finder.edge_faces, finder.vertex_faces
+    assert finder.dual_edges.shape == (90, 2) and finder.dual_edges.dtype == np.int32
+    assert not face_vertices.flags.writeable
+    del finder
+    faces = [set(face_vertices[face_offsets[i]:face_offsets[i + 1]]) for i in range(32)]
+    assert sorted(len(face) for face in faces) == [5] * 12 + [6] * 20
+    for (a, b), (x, y) in zip(edges, edge_faces):
+        assert x != y and {a, b} <= faces[x] and {a, b} <= faces[y]
+    for vertex, incident in enumerate(vertex_faces.reshape(60, 3)):
+        assert all(vertex in faces[face] for face in incident)
+
+
+def test_circle_finder_rotation():
+    """Faces traced from geometry match the planarity test, bad rotations fall back"""
+    cage = FullereneCage(spiral=None, nospiralflag=True, atoms=ase.build.molecule("C60"))
+    edges = atom_edges(cage.atomADJ)
+    rotation = geometry_rotation(cage.positions, cage.atom_neighbors)
+    finder = dual.py_graph_circle_finder(edges.shape[0], edges, rotation)
+    assert finder.rotation_used and cage.circle_finder.rotation_used
+    reference = dual.py_graph_circle_finder(edges.shape[0], edges)
+    assert sorted(map(sorted, finder.get_face_vertex_list())) == sorted(map(sorted, reference.get_face_vertex_list()))
+    assert canonical_spiral(cage.circleADJ)[0] == [1, 7, 9, 11, 13, 15, 18, 20, 22, 24, 26, 32]
+    rotation[0, 1:] = rotation[0, :0:-1]
+    finder = dual.py_graph_circle_finder(edges.shape[0], edges, rotation)
+    assert not finder.rotation_used and finder.face_size == 32
+    with pytest.raises(ValueError):
+        geometry_rotation(np.zeros([60, 3]), cage.atom_neighbors)
+
+
+def test_dual_adjacency():
+    """Dense buffers and scipy CSR matrices filled by the extension"""
+    atomadj = next(enumerate_isomers(60, ipr=True))["atomadj"]
+    reference = circle_adjacency(atomadj)
+    edges = atom_edges(atomadj)
+    finder = dual.py_graph_circle_finder(edges.shape[0], edges)
+    for dtype in [np.float64, np.float32, np.int32, np.int8, bool]:
+        adj = finder.dual_adjacency(dtype=dtype)
+        assert adj.dtype == np.dtype(dtype) and np.array_equal(adj, reference)
+    out = np.ones([32, 32], dtype=np.int16)
+    assert finder.dual_adjacency(out=out) is out and np.array_equal(out, reference)
+    sparse = finder.dual_adjacency(dtype=np.float32, sparse=True)
+    assert sparse.dtype == np.float32 and np.array_equal(sparse.toarray(), reference)
+    with pytest.raises(ValueError):
+        finder.dual_adjacency(out=np.zeros([3, 3]))
+
+
+def test_csr_graph_layer():
+    """Edges, BFS distances and components without networkx"""
+    cage = FullereneCage(spiral=None, nospiralflag=True, atoms=ase.build.molecule("C60"))
+    graph = cage.atom_graph
+    assert np.array_equal(graph.edges(), atom_edges(cage.atomADJ))
+    distances = graph.bfs_distances()
+    assert distances.shape == (60, 60) and distances.max() == 9
+    assert np.array_equal(graph.bfs_distances(3), distances[3])
+    assert np.array_equal(distances, distances.T) and (np.diag(distances) == 0).all()
+    assert (distances[cage.atomADJ == 1] == 1).all()
+    assert sorted(cage.graph.edges) == [tuple(edge) for edge in graph.edges().tolist()]
+    pair = CSRAdjacency.from_dense(np.kron(np.eye(2, dtype=int), cage.atomADJ))
+    assert np.bincount(pair.connected_components()).tolist() == [60, 60]
+    assert (pair.bfs_distances(0)[60:] == -1).all()
@@ -0,0 +1,220 @@
+import logging
+import os
+import tempfile
+
+import ase.build
+import ase.io
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from fullerenedataparser.calculator.csi import DEFAULT_CHARGES, batched_eigh, calculate_csi, charged_csi, \
+    eigh_batch_size, frontier_window, store_csi, subset_pays_off, sweep_csi
+from fullerenedataparser.data.db.spiraldb import enumerate_spiral_db
+from fullerenedataparser.data.spiral import adj_gener
+from fullerenedataparser.molecular.ensemble import FullereneEnsemble
+from fullerenedataparser.molecular.fullerene import FullereneCage
+from fullerenedataparser.skeleton import fullertool
+from fullerenedataparser.util.config import SetModuleEnvValue
+from fullerenedataparser.util.geometry import sphere_center_of_four_points
+
+# extend_csi turns the global log level to DEBUG on import.
+with SetModuleEnvValue("log_level", logging.WARNING):
+    from fullerenedataparser.calculator.extend_csi import calculate_ext_csi, extended_adjacency, sweep_ext_csi
+
+__author__ = "hanyanbo"
+__copyright__ = "hanyanbo"
+__license__ = "MIT"
+
+TEST_PATH = os.path.dirname(__file__)
+
+
+ATOMFILE = os.path.join(TEST_PATH, "files", "ADJ", "atomadj", "ADJ20")
+CIRCLEFILE = os.path.join(TEST_PATH, "files", "ADJ", "circleadj", "ADJ20")
+
+
+def write_c20(atomadj, tmpdir):
+    xyz_dir = os.path.join(tmpdir, "C20")
+    os.mkdir(xyz_dir)
+    # Spectral embedding of the dodecahedron as its geometry.
+    positions = np.linalg.eigh(atomadj.astype(float))[1][:, -4:-1] * 10
+    with open(os.path.join(xyz_dir, "C20_1.xyz"), "w") as f:
+        f.write("20\n energy: -1.0 gnorm: 0.1 xtb: 6.3.3\n")
+        f.writelines("C %f %f %f\n" % tuple(position) for position in positions)
+    return xyz_dir
+
+
+def test_batched_eigh():
+    """Batches of mixed sizes are scattered back in input order"""
+    with tempfile.TemporaryDirectory(prefix=r"testcsi_") as tmpdir:
+        target = os.path.join(tmpdir, "C36.spdb")
+        enumerate_spiral_db(36, target)
+        atomadj = FullereneEnsemble.from_spiral_db(target).atomADJ
+    rng = np.random.default_rng(0)
+    small = rng.normal(size=[15, 6, 6])
+    matrices = []
+    for adj, other in zip(atomadj, small + small.transpose(0, 2, 1)):
+        matrices.extend([adj, other])
+    budget = 36 * 36 * 8 * 3 * 4
+    assert eigh_batch_size(36, vectors=True, memory_budget=budget) == 4
+    values = list(batched_eigh(iter(matrices), memory_budget=budget))
+    pairs = list(batched_eigh(iter(matrices), vectors=True, memory_budget=budget))
+    assert len(values) == len(pairs) == 30
+    for matrix, val, (val2, vec) in zip(matrices, values, pairs):
+        assert np.allclose(val, np.linalg.eigvalsh(matrix))
+        assert np.allclose(val2, val)
+        assert np.allclose(matrix @ vec, vec * val2)
+
+
+def test_batched_eigh_blocked_size():
+    """Results behind a size whose batch never fills are flushed within the budget"""
+    consumed = []
+
+    def matrices():
+        yield np.diag(np.arange(36.))
+        for idx in range(3000):
+            consumed.append(idx)
+            yield np.diag(np.arange(6.) + idx)
+
+    budget = 36 * 36 * 8 * 2 * 4
+    results = batched_eigh(matrices(), memory_budget=budget)
+    assert np.allclose(next(results), np.arange(36.))
+    assert len(consumed) < 3000
+    for idx, values in enumerate(results):
+        assert np.allclose(values, np.arange(6.) + idx)
+    assert idx == 2999
+
+
+def test_extended_adjacency():
+    """Extended adjacency equals the atom by atom construction"""
+    atoms = ase.build.molecule("C60")
+    fuller = FullereneCage(spiral=1812, atoms=atoms)
+    fuller.info["charge"] = 0
+    orbital_p_vec = np.zeros([fuller.natoms, 3])
+    for i in range(fuller.natoms):
+        a, b, c = fuller.positions[np.where(fuller.atomADJ[i] == 1)]
+        orbital_p_vec[i] = fuller.positions[i] - sphere_center_of_four_points(a, b, c, fuller.positions[i])
+    orbital_p_vec /= -np.linalg.norm(orbital_p_vec, 2, 1)[:, None]
+    distances = fuller.get_all_distances()
+    expected = 7 * ((orbital_p_vec @ orbital_p_vec.T) / 2 + 0.5) / (distances + 0.00001) ** 4 * (1 - np.eye(60))
+    assert np.allclose(extended_adjacency(fuller, para=7), expected)
+    values, _, napp = calculate_ext_csi(fuller)
+    assert np.allclose(values, next(batched_eigh([expected])))
+    assert napp == 0
+    # Moving a bond keeps 3N entries but leaves atoms with two or four neighbors.
+    atomadj = fuller.atomADJ.copy()
+    far = next(idx for idx in range(1, 60) if atomadj[0, idx] == 0)
+    near = np.nonzero(atomadj[far])[0][0]
+    atomadj[far, near] = atomadj[near, far] = 0
+    atomadj[far, 0] = atomadj[0, far] = 1
+    assert atomadj.sum() == 180
+    with pytest.raises(ValueError):
+        extended_adjacency(FullereneCage(spiral=1812, atoms=atoms, atomADJ=atomadj))
+
+
+def test_csi_window():
+    """Values only and frontier windows of one cage"""
+    atoms = ase.build.molecule("C60")
+    cage = FullereneCage(spiral=1812, atoms=atoms)
+    values, vectors, _ = calculate_csi(cage)
+    assert frontier_window(60, [0]) is None
+    assert frontier_window(60, [2]) == (31, 32)
+    assert frontier_window(60, [-6, -2, 0, 2, 4]) == (27, 33)
+    window = frontier_window(60, [-4, 0, 6])
+    only_values, no_vectors, _ = calculate_csi(cage, vectors=False, window=window)
+    assert no_vectors is None
+    assert np.allclose(only_values, values[28:34])
+    sub_values, sub_vectors, _ = calculate_csi(cage, window=window)
+    assert sub_vectors.shape == (60, 6)
+    assert np.allclose(cage.atomADJ @ sub_vectors, sub_vectors * sub_values)
+    assert np.allclose(next(batched_eigh([cage.atomADJ], window=window)), only_values)
+    # Subset driver matrix by matrix, full batched decomposition without vectors.
+    assert subset_pays_off(60, window, vectors=True) and not subset_pays_off(60, window, vectors=False)
+    batch_values, batch_vectors = next(batched_eigh([cage.atomADJ], vectors=True, window=window))
+    assert np.allclose(batch_values, only_values)
+    assert np.allclose(cage.atomADJ @ batch_vectors, batch_vectors * batch_values)
+
+
+def test_store_csi_modes():
+    """Only the requested eigen-data is stored"""
+    atomfile, circlefile = ATOMFILE, CIRCLEFILE
+    atomadj = next(adj_gener(atomfile, circlefile))["atomadj"]
+    with tempfile.TemporaryDirectory(prefix=r"testcsi_") as tmpdir:
+        xyz_dir = write_c20(atomadj, tmpdir)
+        store_csi(atomfile, circlefile, xyz_dir, os.path.join(tmpdir, "values.npz"))
+        store_csi(atomfile, circlefile, xyz_dir, os.path.join(tmpdir, "window.npz"), vectors=True, window=(8, 12))
+        values = dict(np.load(os.path.join(tmpdir, "values.npz")))
+        window = dict(np.load(os.path.join(tmpdir, "window.npz")))
+    assert set(values) == {"csi_list", "spiral_num", "energy", "napp"}
+    assert np.allclose(values["csi_list"], np.linalg.eigvalsh(atomadj)[None])
+    assert values["napp"][0] == 30 and values["spiral_num"][0] == 1
+    assert set(window) == {"csi_list", "csi_vectors", "csi_window", "spiral_num", "energy", "napp"}
+    assert window["csi_vectors"].shape == (1, 20, 4)
+    assert np.allclose(window["csi_list"], values["csi_list"][:, 8:12])
+    assert window["csi_window"].tolist() == [8, 12]
+
+
+def test_charged_csi():
+    """CSI of all charges from one frontier window equals the formula on full spectra"""
+    with tempfile.TemporaryDirectory(prefix=r"testcsi_") as tmpdir:
+        target = os.path.join(tmpdir, "C36.spdb")
+        enumerate_spiral_db(36, target)
+        ensemble = FullereneEnsemble.from_spiral_db(target)
+    values = ensemble.spectra()
+    start, stop = frontier_window(36, DEFAULT_CHARGES)
+    csi = charged_csi(values[:, start:stop], ensemble.Napp, 36, DEFAULT_CHARGES, start=start)
+    for column, charge in enumerate(DEFAULT_CHARGES):
+        # `calculate_origin_csi` of examples/xcsi/utils.py
+        if charge > 0:
+            expected = -values[:, 18 + 1:18 + 1 + charge // 2].sum(-1)
+        elif charge < 0:
+            expected = -values[:, 18 + charge // 2:18].sum(-1)
+        else:
+            expected = 0
+        assert np.allclose(csi[:, column], expected + 0.2 * ensemble.Napp)
+
+
+def test_sweep_csi():
+    """One table keyed by (natoms, spiral_num, charge) from the CLI"""
+    table = sweep_csi(ATOMFILE, CIRCLEFILE)
+    assert table.columns.tolist() == ["natoms", "spiral_num", "charge", "napp", "csi"]
+    assert table["charge"].tolist() == list(DEFAULT_CHARGES)
+    values = np.linalg.eigvalsh(next(adj_gener(ATOMFILE, CIRCLEFILE))["atomadj"])
+    assert np.isclose(table["csi"][2], -values[11] + 6)
+    assert np.allclose(sweep_csi(ATOMFILE)["csi"], table["csi"])
+    with tempfile.TemporaryDirectory(prefix=r"testcsi_") as tmpdir:
+        target = os.path.join(tmpdir, "csi.csv")
+        result = CliRunner().invoke(fullertool, ["csisweep", "--at", os.path.dirname(ATOMFILE),
+                                                 "-q", "0", "-q", "-2", "-o", target])
+        assert result.exit_code == 0, result.output
+        stored = pd.read_csv(target)
+    assert stored[["natoms", "spiral_num", "charge"]].values.tolist() == [[20, 1, 0], [20, 1, -2]]
+    assert np.allclose(stored["csi"], table["csi"][:2])
+    # Neutral cages only need no eigenvalue.
+    assert sweep_csi(ATOMFILE, charges=[0])["csi"].tolist() == [6.]
+
+
+def test_sweep_csi_parquet_engine(monkeypatch):
+    """Missing parquet engine is reported before calculation"""
+    monkeypatch.setattr("fullerenedataparser.io.table.PARQUET_ENGINES", ("no_such_parquet_engine",))
+    with tempfile.TemporaryDirectory(prefix=r"testcsi_") as tmpdir:
+        result = CliRunner().invoke(fullertool, ["csisweep", "--at", os.path.dirname(ATOMFILE),
+                                                 "-o", os.path.join(tmpdir, "csi.parquet")])
+        assert result.exit_code == 1
+        assert "fastparquet" in result.output
+        assert os.listdir(tmpdir) == []
+
+
+def test_sweep_ext_csi():
+    """xCSI of all charges from one decomposition of each geometry"""
+    atomadj = next(adj_gener(ATOMFILE, CIRCLEFILE))["atomadj"]
+    with tempfile.TemporaryDirectory(prefix=r"testcsi_") as tmpdir:
+        xyz_dir = write_c20(atomadj, tmpdir)
+        table = sweep_ext_csi(ATOMFILE, CIRCLEFILE, xyz_dir, charges=[0, 2, -2])
+        cage = FullereneCage(spiral=1, atoms=ase.io.read(os.path.join(xyz_dir, "C20_1.xyz")))
+    cage.info["charge"] = 0
+    values, _, napp = calculate_ext_csi(cage)
+    # `calculate_xcsi` of examples/xcsi/utils.py
+    expected = [values[:10 + charge // 2 - 1].sum() + 0.2 * napp for charge in [0, 2, -2]]
+    assert np.allclose(table["xcsi"], expected)
@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+import ase.build
+import numpy as np
+
+from fullerenedataparser.calculator.csi import calculate_csi
+from fullerenedataparser.data.db.spiraldb import enumerate_spiral_db
+from fullerenedataparser.molecular.ensemble import FullereneEnsemble
+
+__author__ = "hanyanbo"
+__copyright__ = "hanyanbo"
+__license__ = "MIT"
+
+TEST_PATH = os.path.dirname(__file__)
+
+
+def test_ensemble_spiral_db():
+    """Vectorized properties of all isomers equal those of each cage"""
+    with tempfile.TemporaryDirectory(prefix=r"testensemble_") as tmpdir:
+        target = os.path.join(tmpdir, "C36.spdb")
+        enumerate_spiral_db(36, target)
+        ensemble = FullereneEnsemble.from_spiral_db(target)
+    assert len(ensemble) == 15
+    assert ensemble.atomADJ.shape == (15, 36, 36)
+    assert ensemble.circleADJ.shape == (15, 20, 20)
+    spectra = ensemble.spectra()
+    for idx, cage in enumerate(ensemble):
+        assert cage.spiral == idx + 1
+        values, _, napp = calculate_csi(cage)
+        assert np.allclose(values, spectra[idx])
+        assert napp == ensemble.Napp[idx]
+
+
+def test_ensemble_frames():
+    """Frames with positions, energies and charges"""
+    atoms = ase.build.molecule("C60")
+    frames = []
+    for scale in (1., 1.02):
+        frame = atoms.copy()
+        frame.positions *= scale
+        frame.info["energy"] = -scale
+        frames.append(frame)
+    ensemble = FullereneEnsemble.from_atoms(frames, charges=-2)
+    assert ensemble.Napp.tolist() == [0, 0]
+    assert np.allclose(ensemble.distances()[1], ensemble.distances()[0] * 1.02)
+    assert np.array_equal(ensemble.energies, [-1., -1.02])
+    cage = ensemble[-1]
+    assert cage.info["charge"] == -2 and cage.spiral is None
+    assert np.allclose(cage.positions, frames[1].positions)
+    assert ensemble.subset([1]).charges.tolist() == [-2]
+
+
+def test_ensemble_indexing():
+    """Slices give sub-ensembles, one member doesn't dualize the others"""
+    with tempfile.TemporaryDirectory(prefix=r"testensemble_") as tmpdir:
+        target = os.path.join(tmpdir, "C36.spdb")
+        enumerate_spiral_db(36, target)
+        ensemble = FullereneEnsemble.from_spiral_db(target)
+    cage = ensemble[3]
+    assert "circleADJ" not in vars(ensemble)
+    assert np.array_equal(cage.circleADJ, ensemble.circleADJ[3])
+    head = ensemble[0:2]
+    assert isinstance(head, FullereneEnsemble)
+    assert head.spiral_num.tolist() == [1, 2]
+    assert ensemble[np.array([4, 1])].spiral_num.tolist() == [5, 2]
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+import numpy as np
+
+from fullerenedataparser.data.db.spiraldb import SpiralDatabase, enumerate_spiral_db
+from fullerenedataparser.graph.algorithm.fingerprint import FingerprintIndex, build_fingerprint_index
+from fullerenedataparser.graph.algorithm.windup import windup
+
+__author__ = "hanyanbo"
+__copyright__ = "hanyanbo"
+__license__ = "MIT"
+
+TEST_PATH = os.path.dirname(__file__)
+
+
+def test_fingerprint_index_db():
+    """Every isomer of C36 is found by the spectrum of its shuffled circle adjacency"""
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory(prefix=r"testfingerprint_") as tmpdir:
+        target = os.path.join(tmpdir, "C36.spdb")
+        enumerate_spiral_db(36, target)
+        index = FingerprintIndex.open(target)
+        assert isinstance(index.spectra, np.memmap)
+        db = SpiralDatabase(target)
+        assert len(index) == len(db)
+        for spiral_num, pentagon_index in zip(db.spiral_num, db.pentagon_index):
+            _, circleadj = windup(pentagon_index, 36)
+            perm = rng.permutation(circleadj.shape[0])
+            assert int(spiral_num) in index.query(circleadj[perm][:, perm])
+
+
+def test_fingerprint_index_spiral_file():
+    """Fingerprint index from a spiral file of circle adjacency"""
+    circlefile = os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20")
+    with tempfile.TemporaryDirectory(prefix=r"testfingerprint_") as tmpdir:
+        index = FingerprintIndex(build_fingerprint_index(circlefile, os.path.join(tmpdir, "ADJ20.fp")))
+        _, circleadj = windup(range(1, 13), 20)
+        assert index.query(circleadj) == [1]
@@ -0,0 +1,46 @@
+import os
+
+import ase.build
+import numpy as np
+import pytest
+
+from fullerenedataparser.molecular.fullerene import FullereneCage
+from fullerenedataparser.util.geometry import nearest_neighbors, symmetric_neighbors, topology_changes
+
+__author__ = "hanyanbo"
+__copyright__ = "hanyanbo"
+__license__ = "MIT"
+
+TEST_PATH = os.path.dirname(__file__)
+
+
+def test_nearest_neighbors_trajectory():
+    """Bonds of all frames by one KD-tree query, with topology changes"""
+    positions = ase.build.molecule("C60").positions
+    rng = np.random.default_rng(0)
+    traj = positions[None] + rng.normal(0, 0.01, [20, 60, 3])
+    distances = np.linalg.norm(positions[:, None] - positions[None], axis=-1)
+    reference = np.sort(np.argsort(distances)[:, 1:4], axis=-1)
+    neighbors = nearest_neighbors(traj)
+    assert neighbors.shape == (20, 60, 3)
+    assert np.array_equal(nearest_neighbors(positions), reference)
+    assert symmetric_neighbors(neighbors).all()
+    assert not topology_changes(neighbors).any()
+    traj[7, 0] = traj[7, 1] + 0.3
+    neighbors = nearest_neighbors(traj)
+    assert np.nonzero(topology_changes(neighbors))[0].tolist() == [7, 8]
+    assert np.nonzero(topology_changes(neighbors, reference))[0].tolist() == [7]
+    assert np.nonzero(~symmetric_neighbors(neighbors))[0].tolist() == [7]
+    cage = FullereneCage(spiral=None, nospiralflag=True, atoms=ase.build.molecule("C60"))
+    assert np.array_equal(np.sort(np.nonzero(cage.atomADJ)[1].reshape(60, 3), axis=-1), reference)
+
+
+def test_broken_cage_bonds():
+    """Non-mutual nearest neighbors are not turned into an asymmetric adjacency"""
+    atoms = ase.build.molecule("C60")
+    atoms.positions[0] *= 2
+    cage = FullereneCage(spiral=1812, atoms=atoms)
+    with pytest.raises(ValueError):
+        cage.atomADJ
+    with pytest.raises(ValueError):
+        nearest_neighbors(np.zeros([3, 3]), k=3)
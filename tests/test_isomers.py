@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+
+from fullerenedataparser.data.spiral import adj_gener
+from fullerenedataparser.graph.adjacency import neighbors_to_dense
+from fullerenedataparser.graph.algorithm import dual
+from fullerenedataparser.graph.algorithm.isomers import canonical_spiral, enumerate_isomers
+from fullerenedataparser.graph.algorithm.windup import windup_dual
+
+__author__ = "hanyanbo"
+__copyright__ = "hanyanbo"
+__license__ = "MIT"
+
+TEST_PATH = os.path.dirname(__file__)
+
+
+def test_isomer_counts():
+    """Number of isomers and point groups of small fullerenes"""
+    counts = {20: 1, 24: 1, 26: 1, 28: 2, 30: 3, 32: 6, 34: 6}
+    for atom_num, count in counts.items():
+        assert len(list(enumerate_isomers(atom_num))) == count
+    assert [item["symmetry"] for item in enumerate_isomers(32)] == ["C2", "D2", "D3d", "C2", "D3h", "D3"]
+    ipr = list(enumerate_isomers(60, ipr=True, workers=2))
+    assert [(item["spiral_num"], item["symmetry"], item["NMR"]) for item in ipr] == [(1, "Ih", "1x60")]
+    assert ipr[0]["pentagon_index"] == [1, 7, 9, 11, 13, 15, 18, 20, 22, 24, 26, 32]
+
+
+def test_isomers_spiral_file():
+    """Enumerated isomers match spiral output files"""
+    ref = next(adj_gener(os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20"), os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20")))
+    item = next(enumerate_isomers(20))
+    for key in ["spiral_num", "symmetry", "pentagon_index", "NMR"]:
+        assert item[key] == ref[key]
+    assert np.array_equal(item["circleadj"].todense(), ref["circleadj"])
+    assert np.allclose(np.linalg.eigvalsh(neighbors_to_dense(item["atomadj"])), np.linalg.eigvalsh(ref["atomadj"]))
+
+
+def test_spiral_search():
+    """Spiral search in C++ splits by prefixes and keeps canonical spirals only"""
+    spirals = dual.spiral_search(22)
+    assert spirals.shape == (40, 22)
+    assert spirals.tolist() == sorted(spirals.tolist())
+    for sizes in spirals[::7]:
+        pentagon_index = (np.nonzero(sizes == 5)[0] + 1).tolist()
+        assert canonical_spiral(windup_dual(pentagon_index, 40))[0] == pentagon_index
+    prefixes = dual.spiral_search(22, depth=4)
+    assert prefixes.shape[1] == 4
+    parts = [dual.spiral_search(22, prefix=prefix) for prefix in prefixes.tolist()]
+    assert np.array_equal(np.concatenate([part for part in parts if part is not None]), spirals)
+    # Adjacent pentagons can't be wound up under the isolated pentagon rule.
+    assert dual.spiral_search(32, ipr=True, prefix=(5, 5)) is None
+    assert dual.spiral_search(32, ipr=True).shape == (1, 32)
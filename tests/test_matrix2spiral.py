@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+
+import ase.build
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from fullerenedataparser.data.db.spiraldb import enumerate_spiral_db
+from fullerenedataparser.graph.algorithm.matrix2spiral import SpiralLookup, matrix2spiral, matrix2spiral_dir
+from fullerenedataparser.molecular.fullerene import FullereneCage
+from fullerenedataparser.skeleton import fullertool
+
+__author__ = "hanyanbo"
+__copyright__ = "hanyanbo"
+__license__ = "MIT"
+
+TEST_PATH = os.path.dirname(__file__)
+
+
+def test_matrix2spiral_c60():
+    """Canonical spiral of Ih C60 from geometry"""
+    cage = FullereneCage(spiral=None, nospiralflag=True, atoms=ase.build.molecule("C60"))
+    lookup = SpiralLookup([[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12], [1, 7, 9, 11, 13, 15, 18, 20, 22, 24, 26, 32]], [1, 1812])
+    assert matrix2spiral(cage, lookup) == ([1, 7, 9, 11, 13, 15, 18, 20, 22, 24, 26, 32], 1812)
+    with pytest.raises(KeyError):
+        lookup.lookup([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 13])
+
+
+def test_matrix2spiral_dir():
+    """Spiral numbers of a directory of structures"""
+    with tempfile.TemporaryDirectory(prefix=r"testmatrix2spiral_") as tmpdir:
+        shutil.copy(os.path.join(TEST_PATH, "files/C28_000000001opted.xyz"), tmpdir)
+        enumerate_spiral_db(28, os.path.join(tmpdir, "C28.spdb"))
+        lookups = {28: SpiralLookup.from_spiral_db(os.path.join(tmpdir, "C28.spdb"))}
+        results = list(matrix2spiral_dir(tmpdir, lookups))
+        assert len(results) == 1
+        assert results[0]["natoms"] == 28
+        assert results[0]["spiral_num"] == 1
+
+
+def test_identify_cli():
+    """`fullertool identify` writes one table with failure reasons"""
+    with tempfile.TemporaryDirectory(prefix=r"testmatrix2spiral_") as tmpdir:
+        rootpath = os.path.join(tmpdir, "structures")
+        shutil.copytree(os.path.join(TEST_PATH, "files/logfiles"), rootpath)
+        shutil.copy(os.path.join(TEST_PATH, "files/C28_000000001opted.xyz"), rootpath)
+        with open(os.path.join(rootpath, "broken.gjf"), "w") as f:
+            f.write("not a gaussian input\n")
+        enumerate_spiral_db(28, os.path.join(tmpdir, "C28.spdb"))
+        target = os.path.join(tmpdir, "identify.csv")
+        result = CliRunner().invoke(fullertool, ["identify", "-d", rootpath, "-o", target, "-j", "2",
+                                                 "-r", os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20"),
+                                                 "-r", os.path.join(tmpdir, "C28.spdb")])
+        assert result.exit_code == 0, result.output
+        table = pd.read_csv(target)
+        table.index = table["path"].map(os.path.basename)
+        assert len(table) == 5
+        assert table.loc["C20_Ih_1.log", "spiral_num"] == 1
+        assert table.loc["DOUBLEC20_Ih_1.log", "spiral_num"] == 1
+        assert table.loc["C28_000000001opted.xyz", "spiral_num"] == 1
+        assert table.loc["C24_D6d_1.log", "error"] == "No reference of C24."
+        assert table.loc["C24_D6d_1.log", "pentagon_index"] == "1 2 3 4 5 7 8 10 11 12 13 14"
+        assert isinstance(table.loc["broken.gjf", "error"], str)
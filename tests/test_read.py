@@ -1,8 +1,15 @@
+import bz2
+import gzip
+import lzma
 import os
+import tempfile
+from pathlib import Path
 
 import pytest
 from fullerenedataparser.io import FileCommentError
+from fullerenedataparser.io.compress import open_file
 from fullerenedataparser.io.g16log import read_g16log_atoms, LogFile
+from fullerenedataparser.io.recursion import recursion_files
 from fullerenedataparser.io.xyz import simple_read_xyz_xtb
 
 __author__ = "hanyanbo"
@@ -62,3 +69,19 @@ def test_log_brief_read():
     f = os.path.join(TEST_PATH, r"files/logfiles/C24_D6d_1.log")
     atoms = LogFile(f)
     assert atoms.brief_content() == "C24_D6d_1.log	 opt freq b3lyp/6-31G(d,p) empiricaldispersion=gd3	-913.874862231	True\n"
+
+
+@pytest.mark.parametrize("compress, suffix", [(gzip.compress, ".gz"), (lzma.compress, ".xz"), (bz2.compress, "")])
+def test_read_compressed(compress, suffix):
+    """Compressed files are detected by extension or magic bytes and read like plain files"""
+    with tempfile.TemporaryDirectory(prefix=r"testread_") as tmpdir:
+        source = os.path.join(TEST_PATH, r"files/C28_000000001opt.xyz")
+        target = os.path.join(tmpdir, "C28_000000001opt.xyz" + suffix)
+        with open(source, "rb") as f, open(target, "wb") as g:
+            g.write(compress(f.read()))
+        with open_file(target, "rb") as f, open(source, "rb") as g:
+            assert f.read() == g.read()
+        atomlist = list(simple_read_xyz_xtb(target))
+        assert len(atomlist) == 10
+        assert atomlist[-1].info["energy"] == -59.368405988605
+        assert list(recursion_files(tmpdir, format="xyz")) == [Path(target)]
@@ -1,8 +1,18 @@
+import gzip
+import io
 import os
 import tempfile
 from pathlib import Path
 
-from fullerenedataparser.data.spiral import read_spiral_output
+import numpy as np
+import pytest
+from ase import Atoms
+
+from fullerenedataparser.data.spiral import (SpiralFile, _parse_adj_block, adj_batch_gener, adj_gener, adj_store,
+                                             read_adj_store, read_spiral_output, spiral_index_path,
+                                             store_spiral_output_parallel)
+from fullerenedataparser.graph.adjacency import CSRAdjacency, neighbors_to_dense
+from fullerenedataparser.molecular.fullerene import FullereneFamily
 
 __author__ = "hanyanbo"
 __copyright__ = "hanyanbo"
@@ -15,3 +25,193 @@ def test_read_spiral_output():
     """spiral output file combination Tests"""
     with tempfile.TemporaryDirectory(prefix=r"testspiral_", dir=os.path.join(TEST_PATH, Path(r"files/ADJ"))) as f:
         read_spiral_output(atomdir=os.path.join(TEST_PATH, Path(r"files/ADJ/atomadj")), circledir=os.path.join(TEST_PATH, Path(r"files/ADJ/circleadj")), storedir=Path(f))
+
+
+def test_spiral_block_mode():
+    """Block parsing yields the same records as line parsing"""
+    for path, circle in [(os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20"), False),
+                         (os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20"), True)]:
+        line_records = [{**item, "adj_matrix": item["adj_matrix"].copy()} for item in SpiralFile(path, circle=circle).content()]
+        block_records = list(SpiralFile(path, circle=circle, block=True).content())
+        assert len(line_records) == len(block_records) == 1
+        for line_item, block_item in zip(line_records, block_records):
+            assert line_item.keys() == block_item.keys()
+            for key in line_item:
+                assert np.array_equal(line_item[key], block_item[key])
+
+
+def test_parse_adj_block_fallback():
+    """Signs and multi-digit entries are not taken by the single digit fast path"""
+    assert _parse_adj_block("0 1\n1 0\n", 2).tolist() == [[0, 1], [1, 0]]
+    assert _parse_adj_block("-1 1\n1 0\n", 2).tolist() == [[-1, 1], [1, 0]]
+    assert _parse_adj_block("0 1\n10 0\n", 2).tolist() == [[0, 1], [10, 0]]
+    with pytest.raises(ValueError):
+        _parse_adj_block("0 1\n10\n", 2)
+    with pytest.raises(ValueError):
+        _parse_adj_block("0 1\n1 0x\n", 2)
+
+
+def test_spiral_index_random_access():
+    """Offset index gives random access and is rebuilt when the file changes"""
+    with open(os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20"), "r") as f:
+        title, spiral_line, *matrix = f.readlines()
+    with tempfile.TemporaryDirectory(prefix=r"testspiral_") as tmpdir:
+        path = os.path.join(tmpdir, "ADJ20")
+        with open(path, "w") as f:
+            f.writelines([title, spiral_line, *matrix])
+        spiral_file = SpiralFile(path)
+        assert spiral_file.get(1)["symmetry"] == "Ih"
+        assert os.path.exists(spiral_index_path(path))
+        with open(path, "a") as f:
+            f.writelines(["\n", spiral_line.replace("1", "2", 1), *matrix])
+        os.utime(path, ns=(0, 0))
+        records = spiral_file.get_many([2, 1])
+        assert [item["spiral_num"] for item in records] == [2, 1]
+        assert np.array_equal(records[0]["adj_matrix"], records[1]["adj_matrix"])
+        with pytest.raises(KeyError):
+            spiral_file.get(3)
+        # No file handle besides the streaming `file` is kept open between calls.
+        assert [value for value in vars(spiral_file).values() if isinstance(value, io.IOBase)] == [spiral_file.file]
+
+
+def test_adj_gener_compact():
+    """Compact adjacency converts back to the dense matrices"""
+    atomfile = os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20")
+    circlefile = os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20")
+    for dense, compact in zip(adj_gener(atomfile, circlefile), adj_gener(atomfile, circlefile, compact=True)):
+        assert compact["atomadj"].shape == (20, 3)
+        assert compact["atomadj"].dtype == np.int16
+        assert isinstance(compact["circleadj"], CSRAdjacency)
+        assert np.array_equal(neighbors_to_dense(compact["atomadj"]), dense["atomadj"])
+        assert np.array_equal(compact["circleadj"].todense(), dense["circleadj"])
+        fullerene = FullereneFamily(spiral=compact["spiral_num"], atomADJ=compact["atomadj"], circleADJ=compact["circleadj"],
+                                    compact=True, atoms=Atoms("C20", positions=np.zeros([20, 3])))
+        assert np.array_equal(fullerene.atomADJ, dense["atomadj"])
+        assert np.array_equal(fullerene.get_fullerenecage().circleADJ, dense["circleadj"])
+
+
+def test_adj_store_roundtrip():
+    """adj_store appends typed arrays that read_adj_store reads back"""
+    atomfile = os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20")
+    circlefile = os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20")
+    with tempfile.TemporaryDirectory(prefix=r"testspiral_") as tmpdir:
+        target = os.path.join(tmpdir, "ADJ20.h5")
+        adj_store(target, adj_gener(atomfile, circlefile, compact=True), buffer=1)
+        data = read_adj_store(target)
+        ref = next(adj_gener(atomfile, circlefile))
+        assert data["atomadj"].dtype == np.int8
+        assert data["atomadj"].shape == (1, 20, 20)
+        assert np.array_equal(data["atomadj"][0], ref["atomadj"])
+        assert np.array_equal(data["circleadj"][0], ref["circleadj"])
+        assert np.array_equal(data["pentagon_index"][0], ref["pentagon_index"])
+        assert data["symmetry"].tolist() == ["Ih"]
+        assert data["NMR"] == ["1x20"]
+        assert len(read_adj_store(target, start=1)["spiral_num"]) == 0
+
+
+def _repeat_spiral_file(source, target, count):
+    with open(source, "r") as f:
+        title, spiral_line, *matrix = f.readlines()
+    with open(target, "w") as f:
+        f.write(title)
+        for spiral_num in range(1, count + 1):
+            f.writelines([f"{spiral_num:8d}" + spiral_line[8:], *matrix])
+
+
+def test_adj_store_closed_on_error():
+    """The HDF5 file is closed when the generator raises"""
+    atomfile = os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20")
+    circlefile = os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20")
+
+    def broken():
+        yield from adj_gener(atomfile, circlefile)
+        raise RuntimeError("broken generator")
+
+    with tempfile.TemporaryDirectory(prefix=r"testspiral_") as tmpdir:
+        target = os.path.join(tmpdir, "ADJ20.h5")
+        with pytest.raises(RuntimeError):
+            adj_store(target, broken(), buffer=1)
+        assert len(read_adj_store(target)["spiral_num"]) == 1
+
+
+def test_store_spiral_output_parallel():
+    """Parallel chunked parsing gives the same store as sequential parsing"""
+    with tempfile.TemporaryDirectory(prefix=r"testspiral_") as tmpdir:
+        atomfile = os.path.join(tmpdir, "atom_ADJ20")
+        circlefile = os.path.join(tmpdir, "circle_ADJ20")
+        _repeat_spiral_file(os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20"), atomfile, 5)
+        _repeat_spiral_file(os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20"), circlefile, 5)
+        store_spiral_output_parallel(atomfile, circlefile, os.path.join(tmpdir, "parallel.h5"), processes=2, chunk_size=2)
+        adj_store(os.path.join(tmpdir, "serial.h5"), adj_gener(atomfile, circlefile))
+        parallel = read_adj_store(os.path.join(tmpdir, "parallel.h5"))
+        serial = read_adj_store(os.path.join(tmpdir, "serial.h5"))
+        assert parallel["spiral_num"].tolist() == [1, 2, 3, 4, 5]
+        for key in serial:
+            assert np.array_equal(parallel[key], serial[key])
+
+
+def test_adj_batch_gener():
+    """Batches stack the same isomers as adj_gener"""
+    with tempfile.TemporaryDirectory(prefix=r"testspiral_") as tmpdir:
+        atomfile = os.path.join(tmpdir, "atom_ADJ20")
+        circlefile = os.path.join(tmpdir, "circle_ADJ20")
+        _repeat_spiral_file(os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20"), atomfile, 5)
+        _repeat_spiral_file(os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20"), circlefile, 5)
+        batches = list(adj_batch_gener(atomfile, circlefile, batch_size=2))
+        assert [batch["atomadj"].shape for batch in batches] == [(2, 20, 20), (2, 20, 20), (1, 20, 20)]
+        assert batches[0]["circleadj"].shape == (2, 12, 12)
+        items = list(adj_gener(atomfile, circlefile))
+        stacked = {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+        for idx, item in enumerate(items):
+            for key in item:
+                assert np.array_equal(stacked[key][idx], item[key])
+        # Duals of a whole batch at once are the same as those of single isomers.
+        duals = np.concatenate([batch["circleadj"] for batch in adj_batch_gener(atomfile, batch_size=2)])
+        for dual, item in zip(duals, adj_gener(atomfile)):
+            assert np.array_equal(dual, item["circleadj"])
+
+
+def test_spiral_iter_headers():
+    """Header scan gives the metadata of content() with and without an offset index"""
+    with tempfile.TemporaryDirectory(prefix=r"testspiral_") as tmpdir:
+        atomfile = os.path.join(tmpdir, "ADJ20")
+        _repeat_spiral_file(os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20"), atomfile, 5)
+        items = list(SpiralFile(atomfile).content())
+        scanned = SpiralFile(atomfile).iter_headers()
+        assert not os.path.exists(spiral_index_path(atomfile))
+        SpiralFile(atomfile).index
+        indexed = SpiralFile(atomfile).iter_headers()
+        for headers in (scanned, indexed):
+            assert headers["spiral_num"].tolist() == [item["spiral_num"] for item in items]
+            assert headers["symmetry"].tolist() == [item["symmetry"] for item in items]
+            assert headers["pentagon_index"].tolist() == [item["pentagon_index"] for item in items]
+            assert headers["NMR"].tolist() == [item["NMR"] for item in items]
+
+
+def test_adj_gener_without_circlefile():
+    """Circle adjacency computed from atom adjacency is the dual graph of the spiral file"""
+    atomfile = os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20")
+    circlefile = os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20")
+    for ref, item, compact in zip(adj_gener(atomfile, circlefile), adj_gener(atomfile), adj_gener(atomfile, compact=True)):
+        assert item["circleadj"].shape == ref["circleadj"].shape
+        assert np.array_equal(compact["circleadj"].todense(), item["circleadj"])
+        assert np.allclose(np.linalg.eigvalsh(item["circleadj"]), np.linalg.eigvalsh(ref["circleadj"]))
+    batch = next(adj_batch_gener(atomfile))
+    assert batch["circleadj"].shape == (1, 12, 12)
+
+
+def test_spiral_compressed():
+    """Compressed spiral files stream the same isomers, but can't be indexed"""
+    with tempfile.TemporaryDirectory(prefix=r"testspiral_") as tmpdir:
+        atomfile = os.path.join(tmpdir, "ADJ20")
+        _repeat_spiral_file(os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20"), atomfile, 5)
+        with open(atomfile, "rb") as f, gzip.open(atomfile + ".gz", "wb") as g:
+            g.write(f.read())
+        items = list(SpiralFile(atomfile).content())
+        compressed = SpiralFile(atomfile + ".gz")
+        assert compressed.atom_num == 20
+        for item, compressed_item in zip(items, compressed.content()):
+            assert np.array_equal(item["adj_matrix"], compressed_item["adj_matrix"])
+        assert SpiralFile(atomfile + ".gz").iter_headers()["spiral_num"].tolist() == [1, 2, 3, 4, 5]
+        with pytest.raises(ValueError):
+            SpiralFile(atomfile + ".gz").get(1)
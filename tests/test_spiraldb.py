@@ -0,0 +1,40 @@
+import os
+import tempfile
+
+import numpy as np
+
+from fullerenedataparser.data.db.spiraldb import SpiralDatabase, convert_spiral_db, enumerate_spiral_db
+from fullerenedataparser.data.spiral import adj_gener
+
+__author__ = "hanyanbo"
+__copyright__ = "hanyanbo"
+__license__ = "MIT"
+
+TEST_PATH = os.path.dirname(__file__)
+
+
+def test_spiral_db_roundtrip():
+    """Binary spiral database holds the same isomers as the spiral files"""
+    atomfile = os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20")
+    circlefile = os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20")
+    with tempfile.TemporaryDirectory(prefix=r"testspiraldb_") as tmpdir:
+        target = os.path.join(tmpdir, "C20.spdb")
+        convert_spiral_db(atomfile, circlefile, target)
+        db = SpiralDatabase(target)
+        assert len(db) == 1
+        assert isinstance(db[:1], np.memmap)
+        assert db.symmetry().tolist() == ["Ih"]
+        for ref, item in zip(adj_gener(atomfile, circlefile), db.content()):
+            for key in ref:
+                assert np.array_equal(ref[key], item[key])
+        assert db.get(1)["NMR"] == "1x20"
+
+
+def test_enumerate_spiral_db():
+    """Enumerated isomers are streamed into a binary spiral database"""
+    with tempfile.TemporaryDirectory(prefix=r"testspiraldb_") as tmpdir:
+        target = os.path.join(tmpdir, "C28.spdb")
+        enumerate_spiral_db(28, target, workers=2)
+        db = SpiralDatabase(target)
+        assert db.spiral_num.tolist() == [1, 2]
+        assert db.symmetry().tolist() == ["D2", "Td"]
@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+import pytest
+
+from fullerenedataparser.data.spiral import adj_gener
+from fullerenedataparser.graph.algorithm.windup import windup, windup_batch, windup_dual
+
+__author__ = "hanyanbo"
+__copyright__ = "hanyanbo"
+__license__ = "MIT"
+
+TEST_PATH = os.path.dirname(__file__)
+
+
+def test_windup_spiral_file():
+    """Windup of pentagon indices gives the adjacency of spiral output files"""
+    ref = next(adj_gener(os.path.join(TEST_PATH, "files/ADJ/atomadj/ADJ20"), os.path.join(TEST_PATH, "files/ADJ/circleadj/ADJ20")))
+    atomadj, circleadj = windup(ref["pentagon_index"], 20)
+    assert np.array_equal(circleadj, ref["circleadj"])
+    assert np.allclose(np.linalg.eigvalsh(atomadj), np.linalg.eigvalsh(ref["atomadj"]))
+    assert windup(ref["pentagon_index"], 20)[0] is atomadj
+
+
+def test_windup_c60():
+    """Windup of Ih C60 and of an illegal spiral"""
+    atomadj, circleadj = windup_batch([[1, 7, 9, 11, 13, 15, 18, 20, 22, 24, 26, 32]], 60)
+    assert atomadj.shape == (1, 60, 60) and circleadj.shape == (1, 32, 32)
+    assert (atomadj[0].sum(-1) == 3).all()
+    assert np.unique(np.round(np.linalg.eigvalsh(atomadj[0]), 6)).shape[0] == 15
+    with pytest.raises(ValueError):
+        windup_dual([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 32], 60)